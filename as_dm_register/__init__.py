@@ -7,4 +7,15 @@ as_dm_register 模块
 # 导出注册函数
 from .as_dm_register import register_device
 
-__all__ = ["register_device"]
+# 导出批量预注册函数和本地存储
+from .as_dm_batch import pre_register_batch, generate_sn_pairs
+from .as_dm_store import RegistrationStore
+
+# 导出注册台账
+from .as_dm_ledger import RegistrationLedger
+
+# 导出序列号池
+from .as_sn_pool import SNPool
+
+__all__ = ["register_device", "pre_register_batch", "generate_sn_pairs", "RegistrationStore", "RegistrationLedger",
+           "SNPool"]
@@ -4,13 +4,27 @@ MS500 DM (Device Management) API Module
 
 设备管理服务器 API 通信模块
 提供与 DM 服务器交互的所有 API 函数
+
+网络策略:
+    - 连接/读取超时分开设置（秒），服务器无响应时每个请求最多等待 CONNECT_TIMEOUT + READ_TIMEOUT
+    - 幂等的 GET 请求在连接失败和 502/503/504 时按指数退避重试，POST/PATCH 不重试
+    - 熔断器：同一服务器连续失败 BREAKER_FAILURE_THRESHOLD 次后，BREAKER_COOLDOWN 秒内的请求直接失败，
+      冷却后放行一个探测请求，成功则恢复。熔断状态按服务器地址保存在 as_dm_breaker.db，
+      同一台工位机上所有进程的 StreamingEndpoint 共用
 """
 
 import json
 import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
 import requests
+from requests.adapters import HTTPAdapter
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
 
 disable_warnings(InsecureRequestWarning)
 
@@ -29,9 +43,189 @@ SERVER_TOKENS = {
     "https://gs-be.leopardaws.com": "24db61d56ddaa9575ad6e4f906c02e94a3aecd68"
 }
 
-# ------------------ 默认超时时间 ------------------
+# ------------------ 网络策略 ------------------
+
+# 连接超时（秒）
+CONNECT_TIMEOUT = 5
+
+# 读取超时（秒）
+READ_TIMEOUT = 30
+
+# 默认超时时间：None 表示使用 (CONNECT_TIMEOUT, READ_TIMEOUT)
+DEFAULT_TIMEOUT = None
+
+# GET 请求的重试次数和退避系数（第 n 次重试前等待 backoff * 2^(n-1) 秒）
+GET_RETRIES = 3
+GET_RETRY_BACKOFF = 0.5
+
+# GET 请求遇到这些状态码时重试
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# 熔断器：连续失败次数阈值和熔断持续时间（秒）
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+# 探测请求的最长时间（秒），超过后视为探测进程已退出，再放行一个探测请求
+BREAKER_PROBE_TIMEOUT = 120
+
+# 熔断状态数据库（当前目录下的 as_dm_breaker.db，同一台工位机上的所有进程共用）
+BREAKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_dm_breaker.db')
+
+_BREAKER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS breakers (
+    url          TEXT PRIMARY KEY,
+    failures     INTEGER NOT NULL DEFAULT 0,
+    opened_at    REAL,
+    probe_until  REAL
+)
+"""
+
+# ------------------ 连接池大小 ------------------
+
+# 同一 StreamingEndpoint 上可并发的请求数（注册时摄像头/Unit 与账户/Token 两条链并发执行）
+SESSION_POOL_SIZE = 4
+
+
+# ------------------ 熔断器 ------------------
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后在冷却时间内拒绝请求，冷却后放行一个探测请求
+
+    状态按服务器地址保存在 SQLite（path），同一台工位机上的所有进程（多个治具、守护进程、批量预注册）共用，
+    一个进程发现服务器故障后，其他进程的请求同样直接失败。每次操作使用独立的短连接，可在多个线程中调用
+    """
+
+    def __init__(self, url, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN,
+                 path=None):
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.path = path or BREAKER_PATH
+        with self._connect() as conn:
+            # WAL 模式：多个进程并发读写时读取不被阻塞
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_BREAKER_SCHEMA)
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def _state(self, conn):
+        row = conn.execute('SELECT failures, opened_at, probe_until FROM breakers WHERE url = ?',
+                           (self.url,)).fetchone()
+        return row or (0, None, None)
+
+    @property
+    def failures(self):
+        with self._connect() as conn:
+            return self._state(conn)[0]
+
+    @property
+    def opened_at(self):
+        with self._connect() as conn:
+            return self._state(conn)[1]
+
+    @property
+    def probing(self):
+        with self._connect() as conn:
+            return self._state(conn)[2] is not None
+
+    def allow(self):
+        """是否允许发出请求"""
+        with self._connect() as conn:
+            if self._state(conn)[1] is None:
+                return True
+            # 熔断中：在写事务中检查并占用探测名额，多个进程只有一个能放行
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                _, opened_at, probe_until = self._state(conn)
+                now = time.time()
+                if opened_at is not None:
+                    if now - opened_at < self.cooldown or (probe_until is not None and now < probe_until):
+                        return False
+                    # 冷却结束：只放行一个探测请求（探测进程异常退出时，BREAKER_PROBE_TIMEOUT 秒后再放行一个）
+                    conn.execute('UPDATE breakers SET probe_until = ? WHERE url = ?',
+                                 (now + BREAKER_PROBE_TIMEOUT, self.url))
+                return True
+            finally:
+                conn.execute('COMMIT')
+
+    def record_success(self):
+        """请求成功（服务器有响应且不是 5xx）"""
+        with self._connect() as conn:
+            if self._state(conn) == (0, None, None):
+                return
+            conn.execute('UPDATE breakers SET failures = 0, opened_at = NULL, probe_until = NULL WHERE url = ?',
+                         (self.url,))
+
+    def record_failure(self):
+        """请求失败（连接失败、超时或 5xx）"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                failures, opened_at, probe_until = self._state(conn)
+                failures += 1
+                if probe_until is not None or failures >= self.failure_threshold:
+                    opened_at = time.time()
+                conn.execute('INSERT OR REPLACE INTO breakers (url, failures, opened_at, probe_until) '
+                             'VALUES (?, ?, ?, NULL)', (self.url, failures, opened_at))
+            finally:
+                conn.execute('COMMIT')
+
+
+def apply_network_policy(policy: dict):
+    """应用网络策略配置（as_ms500_config.get_dm_network_policy 的返回值）
+
+    只影响之后创建的 StreamingEndpoint，熔断器参数立即生效；重试参数变化时丢弃 get_endpoint 缓存的连接
+
+    Args:
+        policy: {connect_timeout, read_timeout, get_retries, breaker_threshold, breaker_cooldown}，缺少的键保持默认值
+    """
+    global CONNECT_TIMEOUT, READ_TIMEOUT, GET_RETRIES, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN
+    CONNECT_TIMEOUT = policy.get('connect_timeout', CONNECT_TIMEOUT)
+    READ_TIMEOUT = policy.get('read_timeout', READ_TIMEOUT)
+    GET_RETRIES = policy.get('get_retries', GET_RETRIES)
+    BREAKER_FAILURE_THRESHOLD = policy.get('breaker_threshold', BREAKER_FAILURE_THRESHOLD)
+    BREAKER_COOLDOWN = policy.get('breaker_cooldown', BREAKER_COOLDOWN)
+
+    with _breakers_lock:
+        for breaker in _breakers.values():
+            breaker.failure_threshold = BREAKER_FAILURE_THRESHOLD
+            breaker.cooldown = BREAKER_COOLDOWN
+
+    with _endpoints_lock:
+        for key in [key for key in _endpoints if key[2] != GET_RETRIES]:
+            _endpoints.pop(key).session.close()
+
 
-DEFAULT_TIMEOUT = 300  # milliseconds
+# 每个服务器地址一个熔断器对象，进程内共用（状态保存在 BREAKER_PATH，进程间共用）
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """获取服务器地址对应的熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(url, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+            _breakers[url] = breaker
+        return breaker
+
+
+# 每个 (服务器地址, token) 一个 API 连接，进程内共用（长期运行时复用已建立的 HTTP 连接）
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(url, token):
+    """获取服务器地址和 token 对应的 StreamingEndpoint（首次调用时创建）"""
+    key = (url, token, GET_RETRIES)
+    with _endpoints_lock:
+        api = _endpoints.get(key)
+        if api is None:
+            api = StreamingEndpoint(url, token)
+            _endpoints[key] = api
+        return api
 
 
 # ------------------ StreamingEndpoint 类 ------------------
@@ -48,6 +242,18 @@ class StreamingEndpoint:
         """
         self.url = url
         self.session = requests.session()
+        self.breaker = get_circuit_breaker(url)
+
+        # 连接池：多个线程共用同一会话时复用连接，避免每个请求重新握手
+        # 只有 GET 会重试（allowed_methods），POST/PATCH 不是幂等的
+        retry = Retry(total=GET_RETRIES,
+                      backoff_factor=GET_RETRY_BACKOFF,
+                      status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=frozenset(['GET']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_SIZE, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         if headers:
             # 兼容处理：如果传入字符串，自动转换为字典格式
@@ -57,16 +263,50 @@ class StreamingEndpoint:
 
         self.session.headers.update({'Content-Type': 'application/json'})
 
-    def get_data_from_site(self, payload: dict, path: str = '', timeout: int = None):
-        """从服务器获取数据"""
+    def _request(self, method: str, path: str, timeout=None, **kwargs):
+        """发送请求，经过熔断器并统一处理网络异常
+
+        Returns:
+            tuple: (response or None, error message)
+        """
+        if not self.breaker.allow():
+            return None, f"{self.url} is unavailable (circuit open), retry later"
+
+        if timeout is None:
+            timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
         try:
-            req = self.session.get(self.url + path, params=payload, timeout=timeout, verify=False)
+            req = self.session.request(method, self.url + path, timeout=timeout, verify=False, **kwargs)
         except requests.exceptions.ConnectTimeout:
-            return False, f"Connection timed out for {self.url}"
-        except requests.exceptions.ConnectionError:
-            return False, f"Server address error for {self.url}"
+            self.breaker.record_failure()
+            return None, f"Connection timed out for {self.url}"
         except requests.exceptions.ReadTimeout:
-            return False, f"{self.url} server response time out"
+            self.breaker.record_failure()
+            return None, f"{self.url} server response time out"
+        except requests.exceptions.RetryError:
+            self.breaker.record_failure()
+            return None, f"{self.url} retries exhausted"
+        except requests.exceptions.ConnectionError:
+            self.breaker.record_failure()
+            return None, f"Server address error for {self.url}"
+        except requests.exceptions.RequestException as e:
+            # 其他请求异常（如响应中断 ChunkedEncodingError）同样计为失败，探测请求不会一直处于未结束状态
+            self.breaker.record_failure()
+            return None, f"Request to {self.url} failed: {e}"
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+
+        if req.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return req, ''
+
+    def get_data_from_site(self, payload: dict, path: str = '', timeout=None):
+        """从服务器获取数据"""
+        req, error = self._request('GET', path, timeout, params=payload)
+        if req is None:
+            return False, error
 
         if req.status_code == 200:
             result = json.loads(req.text)
@@ -77,17 +317,14 @@ class StreamingEndpoint:
         else:
             return False, f"Failed to get data {req.status_code}: {req.reason}"
 
-    def post_data_to_site(self, payload: dict, path: str = '', timeout: int = None, file=None, useJson: bool = False):
+    def post_data_to_site(self, payload: dict, path: str = '', timeout=None, file=None, useJson: bool = False):
         """向服务器POST数据"""
-        try:
-            if useJson:
-                req = self.session.post(self.url + path, json=payload, files=file, timeout=timeout, verify=False)
-            else:
-                req = self.session.post(self.url + path, data=payload, files=file, timeout=timeout, verify=False)
-        except requests.exceptions.ConnectTimeout:
-            return False, f"Connection timed out for {self.url}"
-        except requests.exceptions.ConnectionError:
-            return False, f"Server address error for {self.url}"
+        if useJson:
+            req, error = self._request('POST', path, timeout, json=payload, files=file)
+        else:
+            req, error = self._request('POST', path, timeout, data=payload, files=file)
+        if req is None:
+            return False, error
 
         if req.status_code < 300:
             result = json.loads(req.text)
@@ -100,6 +337,23 @@ class StreamingEndpoint:
             except:
                 return False, f"Failed to post data {req.status_code}: {req.reason}. Response: {req.text}"
 
+    def patch_data_to_site(self, payload: dict, path: str = '', timeout=None):
+        """向服务器PATCH数据（部分更新）"""
+        req, error = self._request('PATCH', path, timeout, json=payload)
+        if req is None:
+            return False, error
+
+        if req.status_code < 300:
+            result = json.loads(req.text)
+            return True, result
+        else:
+            # 尝试获取详细错误信息
+            try:
+                error_detail = req.json()
+                return False, f"Failed to patch data {req.status_code}: {req.reason}. Detail: {error_detail}"
+            except:
+                return False, f"Failed to patch data {req.status_code}: {req.reason}. Response: {req.text}"
+
 
 # ------------------ Token 获取函数 ------------------
 
@@ -155,13 +409,42 @@ def generate_password_from_sn(u_sn: str) -> str:
 
 # ------------------ API 函数：查询摄像头 ------------------
 
-def query_camera(api: StreamingEndpoint, c_sn: str, timeout: int = DEFAULT_TIMEOUT):
+def find_camera(api: StreamingEndpoint, c_sn: str, timeout=DEFAULT_TIMEOUT):
+    """查询摄像头记录
+
+    Args:
+        api: StreamingEndpoint API连接实例
+        c_sn: 摄像头序列号
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
+
+    Returns:
+        tuple: (success: bool, camera: dict or None, message: str)
+            - success: 是否成功查询
+            - camera: 摄像头记录（包含 id、c_sensor 等），未注册返回 None
+            - message: 错误消息或成功提示
+    """
+    print(f"Querying camera with c_sn: {c_sn}")
+
+    ret, result = api.get_data_from_site({'c_sn': c_sn}, path=API_CAMERA, timeout=timeout)
+
+    if not ret:
+        return False, None, f"Query camera failed: {result}"
+
+    # 只接受 c_sn 完全一致的记录
+    for camera_data in (result.get('results', []) if isinstance(result, dict) else []):
+        if camera_data.get('c_sn') == c_sn:
+            return True, camera_data, f"Camera already registered with ID: {camera_data.get('id', 0)}"
+
+    return True, None, "Camera not found in database"
+
+
+def query_camera(api: StreamingEndpoint, c_sn: str, timeout=DEFAULT_TIMEOUT):
     """查询摄像头是否已注册
 
     Args:
         api: StreamingEndpoint API连接实例
         c_sn: 摄像头序列号
-        timeout: 超时时间（毫秒）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
 
     Returns:
         tuple: (success: bool, camera_id: int or 0, message: str)
@@ -169,32 +452,85 @@ def query_camera(api: StreamingEndpoint, c_sn: str, timeout: int = DEFAULT_TIMEO
             - camera_id: 如果已注册返回 camera_id，否则返回 0
             - message: 错误消息或成功提示
     """
-    print(f"Querying camera with c_sn: {c_sn}")
+    success, camera_data, message = find_camera(api, c_sn, timeout)
+    return success, camera_data.get('id', 0) if camera_data else 0, message
 
-    ret, result = api.get_data_from_site({'c_sn': c_sn}, path=API_CAMERA, timeout=timeout)
+
+# ------------------ API 函数：查询 Unit ------------------
+
+def query_unit(api: StreamingEndpoint, u_sn: str, timeout=DEFAULT_TIMEOUT):
+    """查询 Unit 是否已创建
+
+    Args:
+        api: StreamingEndpoint API连接实例
+        u_sn: Unit序列号
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
+
+    Returns:
+        tuple: (success: bool, unit: dict or None, message: str)
+            - success: 是否成功查询
+            - unit: Unit 记录（包含 id、u_camera 等），不存在返回 None
+            - message: 错误消息或成功提示
+    """
+    print(f"Querying Unit with u_sn: {u_sn}")
+
+    ret, result = api.get_data_from_site({'u_sn': u_sn}, path=API_UNIT, timeout=timeout)
 
     if not ret:
-        return False, 0, f"Query camera failed: {result}"
+        return False, None, f"Query Unit failed: {result}"
+
+    # 只接受 u_sn 完全一致的记录
+    for unit_data in (result.get('results', []) if isinstance(result, dict) else []):
+        if unit_data.get('u_sn') == u_sn:
+            return True, unit_data, f"Unit already created with ID: {unit_data.get('id', 0)}"
 
-    # 检查摄像头是否已存在
-    if isinstance(result, dict) and len(result.get('results', [])) > 0:
-        camera_data = result.get('results', [])[0]
-        existing_camera_id = camera_data.get('id', 0)
-        return True, existing_camera_id, f"Camera already registered with ID: {existing_camera_id}"
+    return True, None, "Unit not found in database"
 
-    return True, 0, "Camera not found in database"
+
+# ------------------ API 函数：查询账户 ------------------
+
+def query_account(api: StreamingEndpoint, u_sn: str, timeout=DEFAULT_TIMEOUT):
+    """查询账户是否已创建
+
+    Args:
+        api: StreamingEndpoint API连接实例
+        u_sn: Unit序列号（用作用户名）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
+
+    Returns:
+        tuple: (success: bool, account_id: int or 0, message: str)
+            - success: 是否成功查询
+            - account_id: 已创建返回账户ID，否则返回 0
+            - message: 错误消息或成功提示
+    """
+    print(f"Querying account for username: {u_sn}")
+
+    ret, result = api.get_data_from_site({'username': u_sn}, path=API_ACCOUNT, timeout=timeout)
+
+    if not ret:
+        return False, 0, f"Query account failed: {result}"
+
+    # 只接受用户名完全一致的记录（a_user 可能是嵌套的用户信息）
+    for account_data in (result.get('results', []) if isinstance(result, dict) else []):
+        a_user = account_data.get('a_user')
+        username = a_user.get('username') if isinstance(a_user, dict) else account_data.get('username')
+        if username == u_sn:
+            u_account_id = account_data.get('id', 0)
+            return True, u_account_id, f"Account already created with ID: {u_account_id}"
+
+    return True, 0, "Account not found in database"
 
 
 # ------------------ API 函数：创建摄像头 ------------------
 
-def create_camera(api: StreamingEndpoint, c_sn: str, g_camera_id: str = None, timeout: int = DEFAULT_TIMEOUT):
+def create_camera(api: StreamingEndpoint, c_sn: str, g_camera_id: str = None, timeout=DEFAULT_TIMEOUT):
     """创建摄像头
 
     Args:
         api: StreamingEndpoint API连接实例
         c_sn: 摄像头序列号
         g_camera_id: 全局摄像头ID（可选，从NVS读取）
-        timeout: 超时时间（毫秒）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
 
     Returns:
         tuple: (success: bool, camera_id: int or 0, message: str)
@@ -228,9 +564,36 @@ def create_camera(api: StreamingEndpoint, c_sn: str, g_camera_id: str = None, ti
     return True, u_camera_id, "Camera created successfully"
 
 
+# ------------------ API 函数：更新摄像头 c_sensor ------------------
+
+def update_camera_sensor(api: StreamingEndpoint, u_camera_id: int, g_camera_id: str, timeout=DEFAULT_TIMEOUT):
+    """更新已注册摄像头的 c_sensor（全局摄像头ID）
+
+    用于预注册的摄像头：生产时只需把设备 NVS 中的 g_camera_id 写到服务器
+
+    Args:
+        api: StreamingEndpoint API连接实例
+        u_camera_id: 摄像头ID
+        g_camera_id: 全局摄像头ID（从NVS读取）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    print(f"Updating camera {u_camera_id} with c_sensor: {g_camera_id}")
+
+    ret, result = api.patch_data_to_site({'c_sensor': str(g_camera_id)}, f"{API_CAMERA}{u_camera_id}/", timeout)
+
+    if not ret:
+        return False, f"Update camera failed: {result}"
+
+    print(f"Camera {u_camera_id} updated successfully")
+    return True, "Camera updated successfully"
+
+
 # ------------------ API 函数：创建 Unit ------------------
 
-def create_unit(api: StreamingEndpoint, u_sn: str, u_camera_id: int, u_url: str = '', timeout: int = DEFAULT_TIMEOUT):
+def create_unit(api: StreamingEndpoint, u_sn: str, u_camera_id: int, u_url: str = '', timeout=DEFAULT_TIMEOUT):
     """创建 Unit
 
     Args:
@@ -238,7 +601,7 @@ def create_unit(api: StreamingEndpoint, u_sn: str, u_camera_id: int, u_url: str
         u_sn: Unit序列号
         u_camera_id: 关联的摄像头ID
         u_url: Unit URL（可选）
-        timeout: 超时时间（毫秒）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
 
     Returns:
         tuple: (success: bool, unit_id: int or 0, message: str)
@@ -277,13 +640,13 @@ def create_unit(api: StreamingEndpoint, u_sn: str, u_camera_id: int, u_url: str
 
 # ------------------ API 函数：创建账户 ------------------
 
-def create_account(api: StreamingEndpoint, u_sn: str, timeout: int = DEFAULT_TIMEOUT):
+def create_account(api: StreamingEndpoint, u_sn: str, timeout=DEFAULT_TIMEOUT):
     """创建账户
 
     Args:
         api: StreamingEndpoint API连接实例
         u_sn: Unit序列号（用作用户名）
-        timeout: 超时时间（毫秒）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
 
     Returns:
         tuple: (success: bool, account_id: int or 0, password: str, message: str)
@@ -326,14 +689,14 @@ def create_account(api: StreamingEndpoint, u_sn: str, timeout: int = DEFAULT_TIM
 
 # ------------------ API 函数：获取设备 Token ------------------
 
-def get_device_token(api: StreamingEndpoint, u_sn: str, password: str, timeout: int = DEFAULT_TIMEOUT):
+def get_device_token(api: StreamingEndpoint, u_sn: str, password: str, timeout=DEFAULT_TIMEOUT):
     """使用用户名/密码获取设备 token
 
     Args:
         api: StreamingEndpoint API连接实例
         u_sn: Unit序列号（用作用户名）
         password: 密码
-        timeout: 超时时间（毫秒）
+        timeout: 超时时间（秒，或 (连接, 读取) 元组；None 使用网络策略）
 
     Returns:
         tuple: (success: bool, token: str, message: str)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+MS500 DM Batch Pre-Registration Script
+
+批量预注册：在生产之前为一段序列号（c_sn/u_sn 成对）完成摄像头、Unit、账户的创建并获取设备 token，
+结果保存到本地存储（as_dm_store.py）。生产时 register_device 按 c_sn 查到预注册记录后，
+只需向服务器写入一次 c_sensor（g_camera_id），不再受服务器延迟和故障影响
+
+序列号格式: 前缀 + 定长序号，例如 CA500-MIPI-zlxc-1001 / MS500-H120-EP-zlxu-1001
+
+Usage:
+    python -m as_dm_register.as_dm_batch --server-url https://dm-be.leopardaws.com \\
+        --c-prefix CA500-MIPI-zlxc- --u-prefix MS500-H120-EP-zlxu- --start 1001 --count 100
+"""
+
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .as_dm_api import (
+    StreamingEndpoint,
+    get_endpoint,
+    get_admin_token_for_server,
+    SESSION_POOL_SIZE,
+)
+from .as_dm_register import check_camera_registered, record_attempt, create_camera_and_unit, create_account_and_token
+from .as_dm_ledger import PREREGISTER_OWNER
+from .as_dm_store import RegistrationStore, STORE_PATH
+
+# ------------------ 配置区 ------------------
+
+# 并发注册的序列号对数（不超过连接池大小）
+BATCH_WORKERS = SESSION_POOL_SIZE
+
+# 序号位数
+SN_NUMBER_WIDTH = 4
+
+
+# ------------------ 辅助函数 ------------------
+
+def generate_sn_pairs(c_prefix, u_prefix, start, count, width=SN_NUMBER_WIDTH):
+    """生成成对的序列号
+
+    Args:
+        c_prefix: 摄像头序列号前缀
+        u_prefix: Unit序列号前缀
+        start: 起始序号
+        count: 数量
+        width: 序号位数（不足补零）
+
+    Returns:
+        list: [(c_sn, u_sn), ...]
+    """
+    return [(f"{c_prefix}{number:0{width}d}", f"{u_prefix}{number:0{width}d}")
+            for number in range(start, start + count)]
+
+
+def pre_register_pair(api: StreamingEndpoint, server_url, c_sn, u_sn, u_url=''):
+    """预注册一对序列号（不写入 c_sensor）
+
+    上一次预注册中途失败留下的摄像头、Unit、账户会被复用（台账中有预注册的注册尝试时）
+
+    Returns:
+        tuple: (success: bool, record: dict or None, message: str)
+    """
+    can_register, camera_id, message = check_camera_registered(api, c_sn, owner=PREREGISTER_OWNER)
+    if not can_register:
+        return False, None, message
+
+    if not record_attempt(server_url, c_sn, PREREGISTER_OWNER):
+        return False, None, "Failed to record registration attempt"
+
+    success, u_camera_id, u_unit_id, message = create_camera_and_unit(api, c_sn, u_sn, None, u_url, camera_id)
+    if not success:
+        return False, None, message
+
+    success, u_account_id, password, device_token, message = create_account_and_token(api, u_sn)
+    if not success:
+        return False, None, message
+
+    record = {
+        'c_sn': c_sn,
+        'u_sn': u_sn,
+        'server_url': server_url,
+        'u_url': u_url,
+        'u_camera_id': u_camera_id,
+        'u_unit_id': u_unit_id,
+        'u_account_id': u_account_id,
+        'password': password,
+        'device_token': device_token
+    }
+    return True, record, "Pre-registered successfully"
+
+
+# ------------------ 批量预注册函数 ------------------
+
+def pre_register_batch(server_url, sn_pairs, u_url='', store_path=STORE_PATH, workers=BATCH_WORKERS):
+    """批量预注册序列号，结果写入本地存储
+
+    已在本地存储中的 c_sn 会被跳过，中断后可直接重新运行同一批次
+
+    Args:
+        server_url: 服务器地址
+        sn_pairs: [(c_sn, u_sn), ...]
+        u_url: Unit URL（可选）
+        store_path: 本地存储路径
+        workers: 并发数
+
+    Returns:
+        dict: {'registered': [c_sn, ...], 'skipped': [c_sn, ...], 'failed': {c_sn: message}}
+    """
+    summary = {'registered': [], 'skipped': [], 'failed': {}}
+
+    admin_token = get_admin_token_for_server(server_url)
+    api = get_endpoint(server_url, admin_token)
+
+    # 数据库连接只在当前线程中使用：工作线程只负责服务器请求，结果在这里写入
+    with RegistrationStore(store_path) as store:
+        pending = []
+        for c_sn, u_sn in sn_pairs:
+            if store.contains(c_sn):
+                summary['skipped'].append(c_sn)
+            else:
+                pending.append((c_sn, u_sn))
+
+        print(f"Pre-registering {len(pending)} pairs ({len(summary['skipped'])} already in store)")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, SESSION_POOL_SIZE))) as executor:
+            futures = {executor.submit(pre_register_pair, api, server_url, c_sn, u_sn, u_url): c_sn
+                       for c_sn, u_sn in pending}
+            for future in as_completed(futures):
+                c_sn = futures[future]
+                try:
+                    success, record, message = future.result()
+                except Exception as e:
+                    success, record, message = False, None, str(e)
+
+                if success:
+                    store.add(record)
+                    summary['registered'].append(c_sn)
+                else:
+                    print(f"ERROR: {c_sn}: {message}")
+                    summary['failed'][c_sn] = message
+
+    return summary
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='Pre-register a range of c_sn/u_sn pairs on the DM server')
+    parser.add_argument('--server-url', required=True, help='DM server address')
+    parser.add_argument('--c-prefix', required=True, help='Camera serial number prefix')
+    parser.add_argument('--u-prefix', required=True, help='Unit serial number prefix')
+    parser.add_argument('--start', type=int, required=True, help='First serial number')
+    parser.add_argument('--count', type=int, required=True, help='Number of serial number pairs')
+    parser.add_argument('--width', type=int, default=SN_NUMBER_WIDTH, help='Digits of the serial number')
+    parser.add_argument('--u-url', default='', help='Unit URL')
+    parser.add_argument('--store', default=STORE_PATH, help='Local registration store path')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='Concurrent registrations')
+    args = parser.parse_args()
+
+    sn_pairs = generate_sn_pairs(args.c_prefix, args.u_prefix, args.start, args.count, args.width)
+    summary = pre_register_batch(args.server_url, sn_pairs, args.u_url, args.store, args.workers)
+
+    print("\n" + "-"*70)
+    print("Batch Pre-Registration Completed")
+    print("-" * 60)
+    print(f"Registered    : {len(summary['registered'])}")
+    print(f"Skipped       : {len(summary['skipped'])}")
+    print(f"Failed        : {len(summary['failed'])}")
+    for c_sn, message in sorted(summary['failed'].items()):
+        print(f"  {c_sn}: {message}")
+    print("-" * 60)
+
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\nBatch pre-registration interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n\nUnexpected error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+MS500 DM Registration Ledger
+
+注册台账：每次注册成功的结果都追加一条记录（SQLite，WAL 模式），从不修改或删除，
+按 MAC、c_sn、u_sn、g_camera_id 建立索引
+    - 已注册过的设备重新处理时，直接使用台账中的结果，不再访问服务器
+    - 售后和审计时按任一字段快速查询设备的注册历史
+    - 开始向服务器创建记录前先追加一条注册尝试（服务器、c_sn、MAC），中途失败后只有同一设备
+      可以复用服务器上留下的摄像头，其他设备使用相同 c_sn 时视为已注册
+
+多个工位同时写入时由 SQLite 保证一致性（不再依赖单个 as_respond.json 文件）
+
+Usage:
+    python -m as_dm_register.as_dm_ledger --mac 30:ed:a0:12:34:56
+    python -m as_dm_register.as_dm_ledger --c-sn CA500-MIPI-zlxc-1001
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+# ------------------ 配置区 ------------------
+
+# 默认台账路径（当前目录下的 as_dm_ledger.db）
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_dm_ledger.db')
+
+# 批量预注册的注册方（没有设备 MAC）
+PREREGISTER_OWNER = 'preregister'
+
+# 可用于查询的索引字段
+LOOKUP_FIELDS = ('mac', 'c_sn', 'u_sn', 'g_camera_id')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at   REAL NOT NULL,
+    source       TEXT NOT NULL,
+    mac          TEXT,
+    c_sn         TEXT NOT NULL,
+    u_sn         TEXT NOT NULL,
+    g_camera_id  TEXT,
+    server_url   TEXT NOT NULL,
+    u_url        TEXT NOT NULL DEFAULT '',
+    u_camera_id  INTEGER NOT NULL,
+    u_unit_id    INTEGER NOT NULL,
+    u_account_id INTEGER NOT NULL,
+    password     TEXT NOT NULL,
+    device_token TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_mac ON ledger (mac);
+CREATE INDEX IF NOT EXISTS ledger_c_sn ON ledger (c_sn);
+CREATE INDEX IF NOT EXISTS ledger_u_sn ON ledger (u_sn);
+CREATE INDEX IF NOT EXISTS ledger_g_camera_id ON ledger (g_camera_id);
+CREATE TABLE IF NOT EXISTS attempts (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at   REAL NOT NULL,
+    server_url   TEXT NOT NULL,
+    c_sn         TEXT NOT NULL,
+    owner        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_c_sn ON attempts (server_url, c_sn);
+"""
+
+
+# ------------------ 辅助函数 ------------------
+
+def normalize_mac(mac):
+    """统一 MAC 地址格式（小写、冒号分隔），无效时返回 None"""
+    if not mac:
+        return None
+    digits = ''.join(ch for ch in str(mac).lower() if ch in '0123456789abcdef')
+    if len(digits) != 12:
+        return str(mac).strip().lower()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+# ------------------ RegistrationLedger 类 ------------------
+
+class RegistrationLedger:
+    """注册台账，每个实例持有一个数据库连接（仅在创建它的线程中使用）"""
+
+    def __init__(self, path=LEDGER_PATH):
+        """打开（或创建）台账
+
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        # WAL 模式：多个工位并发追加时读取不被阻塞
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, result: dict, mac=None, source='server'):
+        """追加一条注册结果
+
+        Args:
+            result: register_device 的成功结果
+            mac: 设备 MAC 地址（可选）
+            source: 结果来源（server / preregistered）
+
+        Returns:
+            int: 记录ID
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO ledger '
+                '(created_at, source, mac, c_sn, u_sn, g_camera_id, server_url, u_url, '
+                'u_camera_id, u_unit_id, u_account_id, password, device_token) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (time.time(), source, normalize_mac(mac), result['c_sn'], result['u_sn'],
+                 None if not result.get('c_sensor') else str(result['c_sensor']),
+                 result['server_url'], result.get('u_url', ''),
+                 result['u_camera_id'], result['u_unit_id'], result['u_account_id'],
+                 result['password'], result['device_token'])
+            )
+        return cursor.lastrowid
+
+    def record_attempt(self, server_url, c_sn, owner):
+        """追加一条注册尝试（向服务器创建摄像头之前调用）
+
+        Args:
+            server_url: 服务器地址
+            c_sn: 摄像头序列号
+            owner: 注册方（设备 MAC 地址，批量预注册为 PREREGISTER_OWNER）
+        """
+        with self.conn:
+            self.conn.execute('INSERT INTO attempts (created_at, server_url, c_sn, owner) VALUES (?, ?, ?, ?)',
+                              (time.time(), server_url, c_sn, normalize_mac(owner)))
+
+    def owns(self, server_url, c_sn, owner) -> bool:
+        """服务器上该 c_sn 的记录是否由 owner 创建（有注册尝试或注册成功的记录）"""
+        owner = normalize_mac(owner)
+        if not owner:
+            return False
+        if self.conn.execute('SELECT 1 FROM attempts WHERE server_url = ? AND c_sn = ? AND owner = ?',
+                             (server_url, c_sn, owner)).fetchone():
+            return True
+        return self.conn.execute('SELECT 1 FROM ledger WHERE server_url = ? AND c_sn = ? AND mac = ?',
+                                 (server_url, c_sn, owner)).fetchone() is not None
+
+    def find(self, **criteria):
+        """按索引字段查询记录（多个条件同时满足），最新的在前
+
+        Args:
+            criteria: mac / c_sn / u_sn / g_camera_id
+
+        Returns:
+            list: 记录列表
+        """
+        unknown = set(criteria) - set(LOOKUP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unsupported lookup fields: {', '.join(sorted(unknown))}")
+        if 'mac' in criteria:
+            criteria['mac'] = normalize_mac(criteria['mac'])
+
+        query = 'SELECT * FROM ledger'
+        if criteria:
+            query += ' WHERE ' + ' AND '.join(f'{field} = ?' for field in criteria)
+        query += ' ORDER BY id DESC'
+        return [dict(row) for row in self.conn.execute(query, [str(value) for value in criteria.values()])]
+
+    def latest(self, **criteria):
+        """返回满足条件的最新记录，没有时返回 None"""
+        records = self.find(**criteria)
+        return records[0] if records else None
+
+
+# ------------------ 命令行查询 ------------------
+
+def main():
+    """命令行入口：按 MAC / SN / g_camera_id 查询注册历史"""
+    parser = argparse.ArgumentParser(description='Look up registrations in the local ledger')
+    parser.add_argument('--mac', help='Device MAC address')
+    parser.add_argument('--c-sn', dest='c_sn', help='Camera serial number')
+    parser.add_argument('--u-sn', dest='u_sn', help='Unit serial number')
+    parser.add_argument('--g-camera-id', dest='g_camera_id', help='Global camera ID')
+    parser.add_argument('--ledger', default=LEDGER_PATH, help='Ledger path')
+    args = parser.parse_args()
+
+    criteria = {field: getattr(args, field) for field in LOOKUP_FIELDS if getattr(args, field)}
+    if not criteria:
+        parser.error('at least one of --mac, --c-sn, --u-sn, --g-camera-id is required')
+
+    if not os.path.exists(args.ledger):
+        print(f"Ledger not found: {args.ledger}")
+        return 1
+
+    with RegistrationLedger(args.ledger) as ledger:
+        records = ledger.find(**criteria)
+
+    print(f"Found {len(records)} record(s)")
+    for record in records:
+        print("-" * 60)
+        print(f"Time          : {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['created_at']))}")
+        print(f"Source        : {record['source']}")
+        print(f"MAC           : {record['mac'] or ''}")
+        print(f"Camera SN     : {record['c_sn']}")
+        print(f"Unit SN       : {record['u_sn']}")
+        print(f"Global Camera ID : {record['g_camera_id'] or ''}")
+        print(f"Server URL    : {record['server_url']}")
+        print(f"Camera ID     : {record['u_camera_id']}")
+        print(f"Unit ID       : {record['u_unit_id']}")
+        print(f"Account ID    : {record['u_account_id']}")
+        print(f"Device Token  : {record['device_token']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
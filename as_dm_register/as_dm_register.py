@@ -7,35 +7,62 @@ MS500 DM Register Script
 
 注册步骤:
 1. 参数检测和打印
-2. 查询摄像头是否已注册（如果已注册则提示并退出）
+2. 查询摄像头是否已注册（已被其他设备使用或查询失败则提示并退出）
 3. 创建摄像头
 4. 创建 Unit
 5. 创建账户
 6. 使用用户名/密码获取设备 token
 7. 保存结果到响应配置文件
 
+幂等注册:
+    步骤 3-5 先查询已有记录，已存在的摄像头、Unit、账户直接复用，只创建缺少的部分，
+    上一次注册中途失败后可以直接重试，不需要在服务器上手动清理。
+    摄像头只在能证明属于本设备时复用（c_sensor 与 g_camera_id 相同，或台账中有本设备 MAC 对该 c_sn 的注册尝试），
+    其他情况视为已被占用，仍然提示并退出
+
+步骤 5-6 只依赖 u_sn，与步骤 3-4 无关：查询通过后，
+摄像头 → Unit 和 账户 → Token 两条链在同一个 StreamingEndpoint 会话上并发执行，
+任一条链失败则注册失败
+
+注册台账（as_dm_ledger.py）:
+    每次注册成功的结果都追加到本地台账（按 MAC、c_sn、u_sn、g_camera_id 索引），
+    as_respond.json 只保存最近一次的结果。传入 mac 且台账中已有该设备相同参数的记录时，直接返回台账中的结果，
+    不访问服务器
+
+预注册（as_dm_batch.py）:
+    本地存储中已有该 c_sn 的预注册记录时，跳过步骤 2-6，只向服务器写入 c_sensor（g_camera_id）
+
 Usage:
     python as_dm_register.py
     或者从外部调用:
     from as_dm_register import register_device
-    result = register_device(server_url, c_sn, u_sn, g_camera_id, u_url)
+    result = register_device(server_url, c_sn, u_sn, g_camera_id, u_url, mac)
 """
 
 import json
 import os
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 # 导入 as_dm_api 模块
 from .as_dm_api import (
     StreamingEndpoint,
+    get_endpoint,
     get_admin_token_for_server,
     DEFAULT_TIMEOUT,
-    query_camera,
+    find_camera,
+    query_unit,
+    query_account,
     create_camera,
     create_unit,
     create_account,
-    get_device_token
+    get_device_token,
+    generate_password_from_sn,
+    update_camera_sensor
 )
+from .as_dm_store import RegistrationStore, STORE_PATH, STATUS_REGISTERED
+from .as_dm_ledger import RegistrationLedger, LEDGER_PATH
 
 # ------------------ 配置文件路径 ------------------
 
@@ -43,6 +70,17 @@ from .as_dm_api import (
 REQUEST_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_request.json')
 RESPOND_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_respond.json')
 
+# ------------------ 配置区 ------------------
+
+# 摄像头/Unit 与账户/Token 两条链是否并发执行（False 时按步骤顺序执行）
+PARALLEL_REGISTRATION = True
+
+# 优先使用本地存储中的预注册记录（as_dm_batch.py 生成）
+USE_PREREGISTERED = True
+
+# 已在台账中注册过的设备（MAC 和参数一致）直接使用台账中的结果
+USE_LEDGER_CACHE = True
+
 
 # ------------------ 辅助函数 ------------------
 
@@ -103,34 +141,74 @@ def print_parameters(server_url, c_sn, u_sn, g_camera_id=None, u_url=''):
     return True
 
 
-def check_camera_registered(api: StreamingEndpoint, c_sn: str):
+def check_camera_registered(api: StreamingEndpoint, c_sn: str, g_camera_id=None, owner=None,
+                            ledger_path=LEDGER_PATH):
     """查询摄像头是否已注册
 
+    已存在的摄像头只在能证明属于本设备时复用:
+        - c_sensor 与本设备的 g_camera_id 相同
+        - 未写入 c_sensor，且台账中有 owner 对该 c_sn 的注册尝试或注册记录（上一次未完成的注册）
+    其他情况（包括相同 c_sn 的其他设备留下的未完成注册）都视为已注册
+
     Args:
         api: StreamingEndpoint API连接实例
         c_sn: 摄像头序列号
+        g_camera_id: 本设备的全局摄像头ID（可选）
+        owner: 注册方（设备 MAC 地址，批量预注册为 PREREGISTER_OWNER）
+        ledger_path: 台账路径
 
     Returns:
-        tuple: (is_registered: bool, camera_id: int, message: str)
+        tuple: (can_register: bool, camera_id: int, message: str)
+            - can_register: 可以继续注册；摄像头已被其他设备使用或查询失败时为 False
+            - camera_id: 可复用的摄像头ID，需要新建时为 0
     """
     print("\n" + "-"*70)
     print("Step 1: Check if Camera is Already Registered")
     print("-" * 60)
 
-    success, camera_id, message = query_camera(api, c_sn)
+    success, camera_data, message = find_camera(api, c_sn)
 
     if not success:
         print(f"ERROR: {message}")
         return False, 0, message
 
-    if camera_id > 0:
+    if not camera_data:
+        print("Camera not found in database, continue registration...")
+        return True, 0, "Camera not registered"
+
+    camera_id = camera_data.get('id', 0)
+    c_sensor = camera_data.get('c_sensor') or ''
+    if c_sensor:
+        owned = bool(g_camera_id) and str(c_sensor) == str(g_camera_id)
+    else:
+        owned = False
+        if owner and os.path.exists(ledger_path):
+            with RegistrationLedger(ledger_path) as ledger:
+                owned = ledger.owns(api.url, c_sn, owner)
+
+    if not owned:
         print(f"WARNING: Camera already registered with ID: {camera_id}")
         print(f"Camera SN '{c_sn}' is already in the system!")
         print("Please modify the serial number in configuration file.")
-        return True, camera_id, f"Camera SN '{c_sn}' already registered"
+        return False, camera_id, f"Camera SN '{c_sn}' already registered"
+
+    print(f"Camera found with ID: {camera_id}, resume registration...")
+    return True, camera_id, "Camera registration incomplete"
 
-    print("Camera not found in database, continue registration...")
-    return False, 0, "Camera not registered"
+
+def record_attempt(server_url, c_sn, owner, ledger_path=LEDGER_PATH):
+    """向服务器创建记录之前在台账中追加注册尝试，中途失败后同一注册方可以复用已创建的摄像头
+
+    Returns:
+        bool: 是否记录成功
+    """
+    try:
+        with RegistrationLedger(ledger_path) as ledger:
+            ledger.record_attempt(server_url, c_sn, owner)
+        return True
+    except Exception as e:
+        print(f"ERROR: Failed to record registration attempt: {e}")
+        return False
 
 
 def save_response_config(respond_path, request_config, response_data):
@@ -150,10 +228,16 @@ def save_response_config(respond_path, request_config, response_data):
         'response': response_data
     }
 
-    # 写入响应配置文件
+    # 写入响应配置文件：先写临时文件再替换，多个工位同时写入时文件始终完整
     try:
-        with open(respond_path, 'w', encoding='utf-8') as file:
-            json.dump(respond_config, file, indent=4, ensure_ascii=False)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(respond_path), prefix='.as_respond_', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(respond_config, file, indent=4, ensure_ascii=False)
+            os.replace(temp_path, respond_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
         print(f"Response configuration saved successfully: {respond_path}")
         return True
     except Exception as e:
@@ -161,83 +245,103 @@ def save_response_config(respond_path, request_config, response_data):
         return False
 
 
-# ------------------ 主注册函数 ------------------
-
-def register_device(server_url, c_sn, u_sn, g_camera_id=None, u_url=''):
-    """设备注册函数（可从外部调用）
+def create_camera_and_unit(api: StreamingEndpoint, c_sn: str, u_sn: str, g_camera_id=None, u_url='',
+                           u_camera_id=0):
+    """创建摄像头，再创建关联该摄像头的 Unit（已存在的直接复用）
 
     Args:
-        server_url: 服务器地址
+        api: StreamingEndpoint API连接实例
         c_sn: 摄像头序列号
         u_sn: Unit序列号
-        g_camera_id: 全局摄像头ID（可选，从NVS读取）
+        g_camera_id: 全局摄像头ID（可选）
         u_url: Unit URL（可选）
+        u_camera_id: 已存在的摄像头ID，为 0 时新建
 
     Returns:
-        dict: 注册结果
-            - success: 是否成功
-            - error: 错误消息（如果失败）
-            - c_sn: 摄像头序列号
-            - u_sn: Unit序列号
-            - device_token: 设备令牌
-            - u_camera_id: 摄像头ID
-            - u_unit_id: Unit ID
-            - u_account_id: 账户ID
-            - password: 密码
-            - u_url: Unit URL
-            - server_url: 服务器地址
+        tuple: (success: bool, camera_id: int, unit_id: int, message: str)
     """
-
-    # 1. 打印并检测参数
-    if not print_parameters(server_url, c_sn, u_sn, g_camera_id, u_url):
-        return create_error_result("Parameter validation failed")
-
-    # 根据 server_url 自动获取对应的管理员 token
-    try:
-        admin_token = get_admin_token_for_server(server_url)
-    except ValueError as e:
-        print(f"ERROR: {e}")
-        return create_error_result(str(e))
-
-    # 使用动态获取的管理员 token 创建 API 连接
-    api = StreamingEndpoint(server_url, admin_token)
-
-    # 2. 查询摄像头是否已注册
-    is_registered, camera_id, message = check_camera_registered(api, c_sn)
-    if is_registered:
-        return create_error_result(message)
-
-    # 3. 创建摄像头
     print("\n" + "-"*70)
     print("Step 2: Create Camera")
     print("-" * 60)
 
-    success, u_camera_id, message = create_camera(api, c_sn, g_camera_id, DEFAULT_TIMEOUT)
-    if not success:
-        print(f"ERROR: {message}")
-        return create_error_result(message)
+    if u_camera_id:
+        print(f"Reusing camera with ID: {u_camera_id}")
+        # 复用的摄像头可能还没有写入 c_sensor
+        if g_camera_id:
+            success, message = update_camera_sensor(api, u_camera_id, g_camera_id, DEFAULT_TIMEOUT)
+            if not success:
+                print(f"ERROR: {message}")
+                return False, u_camera_id, 0, message
+    else:
+        success, u_camera_id, message = create_camera(api, c_sn, g_camera_id, DEFAULT_TIMEOUT)
+        if not success:
+            print(f"ERROR: {message}")
+            return False, 0, 0, message
 
-    # 4. 创建 Unit
     print("\n" + "-"*70)
     print("Step 3: Create Unit")
     print("-" * 60)
 
+    success, unit_data, message = query_unit(api, u_sn, DEFAULT_TIMEOUT)
+    if not success:
+        print(f"ERROR: {message}")
+        return False, u_camera_id, 0, message
+
+    if unit_data:
+        u_unit_id = unit_data.get('id', 0)
+        bound_camera_ids = [camera.get('id') if isinstance(camera, dict) else camera
+                            for camera in unit_data.get('u_camera', [])]
+        if u_camera_id not in bound_camera_ids:
+            message = f"Unit SN '{u_sn}' (ID: {u_unit_id}) is bound to another camera"
+            print(f"ERROR: {message}")
+            return False, u_camera_id, u_unit_id, message
+        print(f"Reusing Unit with ID: {u_unit_id}")
+        return True, u_camera_id, u_unit_id, message
+
     success, u_unit_id, message = create_unit(api, u_sn, u_camera_id, u_url, DEFAULT_TIMEOUT)
     if not success:
         print(f"ERROR: {message}")
-        return create_error_result(message)
+        return False, u_camera_id, 0, message
+
+    return True, u_camera_id, u_unit_id, message
+
 
-    # 5. 创建账户
+def create_account_and_token(api: StreamingEndpoint, u_sn: str):
+    """创建账户（已存在的直接复用），再使用用户名/密码获取设备 token
+
+    密码由 u_sn 生成，复用已有账户时不需要保存过的密码
+
+    Args:
+        api: StreamingEndpoint API连接实例
+        u_sn: Unit序列号
+
+    Returns:
+        tuple: (success: bool, account_id: int, password: str, device_token: str, message: str)
+    """
     print("\n" + "-"*70)
     print("Step 4: Create Account")
     print("-" * 60)
 
-    success, u_account_id, password, message = create_account(api, u_sn, DEFAULT_TIMEOUT)
+    success, u_account_id, message = query_account(api, u_sn, DEFAULT_TIMEOUT)
     if not success:
         print(f"ERROR: {message}")
-        return create_error_result(message)
+        return False, 0, '', '', message
+
+    if u_account_id:
+        print(f"Reusing account with ID: {u_account_id}")
+        password = generate_password_from_sn(u_sn)
+    else:
+        success, u_account_id, password, message = create_account(api, u_sn, DEFAULT_TIMEOUT)
+        if not success:
+            # 账户查询不到但创建失败：用生成的密码探测账户是否已存在
+            print(f"Create account failed, probing existing account: {message}")
+            probe_success, device_token, _ = get_device_token(api, u_sn, password, DEFAULT_TIMEOUT)
+            if not probe_success:
+                print(f"ERROR: {message}")
+                return False, 0, password, '', message
+            print("Existing account verified by token (account ID unknown)")
+            return True, 0, password, device_token, "Device token retrieved successfully"
 
-    # 6. 获取设备 token
     print("\n" + "-"*70)
     print("Step 5: Get Device Token")
     print("-" * 60)
@@ -245,8 +349,78 @@ def register_device(server_url, c_sn, u_sn, g_camera_id=None, u_url=''):
     success, device_token, message = get_device_token(api, u_sn, password, DEFAULT_TIMEOUT)
     if not success:
         print(f"ERROR: {message}")
-        return create_error_result(message)
+        return False, u_account_id, password, '', message
+
+    return True, u_account_id, password, device_token, message
+
+
+def find_preregistered(server_url, c_sn, u_sn, store_path=STORE_PATH):
+    """在本地存储中查找可用的预注册记录
+
+    Args:
+        server_url: 服务器地址
+        c_sn: 摄像头序列号
+        u_sn: Unit序列号
+        store_path: 本地存储路径
+
+    Returns:
+        dict: 服务器、u_sn 一致且尚未使用的记录，没有时返回 None
+    """
+    if not os.path.exists(store_path):
+        return None
+
+    with RegistrationStore(store_path) as store:
+        record = store.get(c_sn)
+
+    if not record or record['status'] != STATUS_REGISTERED:
+        return None
+    if record['server_url'] != server_url or record['u_sn'] != u_sn:
+        print(f"WARNING: Pre-registered record of '{c_sn}' does not match server_url/u_sn, ignored")
+        return None
+    return record
+
+
+def find_in_ledger(server_url, c_sn, u_sn, g_camera_id, mac, ledger_path=LEDGER_PATH):
+    """在台账中查找该设备相同参数的最近一次注册
+
+    Args:
+        server_url: 服务器地址
+        c_sn: 摄像头序列号
+        u_sn: Unit序列号
+        g_camera_id: 全局摄像头ID（可选）
+        mac: 设备 MAC 地址
+        ledger_path: 台账路径
+
+    Returns:
+        dict: 台账记录，没有时返回 None
+    """
+    if not mac or not os.path.exists(ledger_path):
+        return None
+
+    with RegistrationLedger(ledger_path) as ledger:
+        record = ledger.latest(mac=mac)
+
+    if not record:
+        return None
+    if (record['server_url'], record['c_sn'], record['u_sn']) != (server_url, c_sn, u_sn):
+        return None
+    if (record['g_camera_id'] or '') != str(g_camera_id or ''):
+        return None
+    return record
+
+
+def finish_registration(server_url, c_sn, u_sn, g_camera_id, u_url,
+                        u_camera_id, u_unit_id, u_account_id, password, device_token,
+                        mac=None, source='server'):
+    """保存响应配置、追加台账记录、打印注册结果并返回统一格式的结果
 
+    Args:
+        mac: 设备 MAC 地址（可选）
+        source: 结果来源（server / preregistered / ledger），来自台账的结果不再重复追加
+
+    Returns:
+        dict: 注册结果（格式同 register_device）
+    """
     # 7. 保存结果到响应配置文件
     print("\n" + "-"*70)
     print("Saving Response Configuration")
@@ -308,9 +482,127 @@ def register_device(server_url, c_sn, u_sn, g_camera_id=None, u_url=''):
     if g_camera_id:
         result['c_sensor'] = g_camera_id
 
+    # 追加到注册台账
+    if source != 'ledger':
+        try:
+            with RegistrationLedger() as ledger:
+                ledger.append(result, mac=mac, source=source)
+        except Exception as e:
+            print(f"ERROR: Failed to append registration ledger: {e}")
+            return create_error_result("Failed to append registration ledger")
+
     return result
 
 
+# ------------------ 主注册函数 ------------------
+
+def register_device(server_url, c_sn, u_sn, g_camera_id=None, u_url='', mac=None):
+    """设备注册函数（可从外部调用）
+
+    Args:
+        server_url: 服务器地址
+        c_sn: 摄像头序列号
+        u_sn: Unit序列号
+        g_camera_id: 全局摄像头ID（可选，从NVS读取）
+        u_url: Unit URL（可选）
+        mac: 设备 MAC 地址（可选，用于台账索引和缓存）
+
+    Returns:
+        dict: 注册结果
+            - success: 是否成功
+            - error: 错误消息（如果失败）
+            - c_sn: 摄像头序列号
+            - u_sn: Unit序列号
+            - device_token: 设备令牌
+            - u_camera_id: 摄像头ID
+            - u_unit_id: Unit ID
+            - u_account_id: 账户ID
+            - password: 密码
+            - u_url: Unit URL
+            - server_url: 服务器地址
+    """
+
+    # 1. 打印并检测参数
+    if not print_parameters(server_url, c_sn, u_sn, g_camera_id, u_url):
+        return create_error_result("Parameter validation failed")
+
+    # 台账中已有该设备相同参数的注册结果：直接使用，不访问服务器
+    record = find_in_ledger(server_url, c_sn, u_sn, g_camera_id, mac) if USE_LEDGER_CACHE else None
+    if record:
+        print(f"\nRegistration of {record['mac']} found in ledger, skip server requests")
+        return finish_registration(server_url, c_sn, u_sn, g_camera_id, record['u_url'],
+                                   record['u_camera_id'], record['u_unit_id'], record['u_account_id'],
+                                   record['password'], record['device_token'], mac=mac, source='ledger')
+
+    # 根据 server_url 自动获取对应的管理员 token
+    try:
+        admin_token = get_admin_token_for_server(server_url)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return create_error_result(str(e))
+
+    # 使用动态获取的管理员 token 创建 API 连接
+    api = get_endpoint(server_url, admin_token)
+
+    # 预注册记录：摄像头、Unit、账户和 token 已就绪，只需写入 c_sensor
+    record = find_preregistered(server_url, c_sn, u_sn) if USE_PREREGISTERED else None
+    if record:
+        print("\n" + "-"*70)
+        print("Pre-registered Record Found, Update Camera Sensor")
+        print("-" * 60)
+
+        # 先在本地存储中原子地占用记录，再写入 c_sensor：同一 c_sn 只有一个设备能使用该记录
+        with RegistrationStore() as store:
+            if not store.mark_used(c_sn, g_camera_id):
+                message = f"Pre-registered record of '{c_sn}' is already used by another device"
+                print(f"ERROR: {message}")
+                return create_error_result(message)
+
+        if g_camera_id:
+            success, message = update_camera_sensor(api, record['u_camera_id'], g_camera_id, DEFAULT_TIMEOUT)
+            if not success:
+                print(f"ERROR: {message}")
+                with RegistrationStore() as store:
+                    store.unmark_used(c_sn, record['c_sensor'])
+                return create_error_result(message)
+
+        return finish_registration(server_url, c_sn, u_sn, g_camera_id, record['u_url'] or u_url,
+                                   record['u_camera_id'], record['u_unit_id'], record['u_account_id'],
+                                   record['password'], record['device_token'], mac=mac, source='preregistered')
+
+    # 2. 查询摄像头是否已注册（查询失败时不继续创建）
+    can_register, camera_id, message = check_camera_registered(api, c_sn, g_camera_id, mac)
+    if not can_register:
+        return create_error_result(message)
+
+    # 没有 MAC 时无法证明服务器上的记录属于本设备，中途失败后需要人工清理
+    if mac and not record_attempt(server_url, c_sn, mac):
+        return create_error_result("Failed to record registration attempt")
+
+    # 3-6. 创建摄像头/Unit 和 账户/Token（两条链互不依赖）
+    if PARALLEL_REGISTRATION:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            camera_unit_future = executor.submit(create_camera_and_unit, api, c_sn, u_sn, g_camera_id, u_url,
+                                                 camera_id)
+            account_token_future = executor.submit(create_account_and_token, api, u_sn)
+            camera_unit_result = camera_unit_future.result()
+            account_token_result = account_token_future.result()
+    else:
+        camera_unit_result = create_camera_and_unit(api, c_sn, u_sn, g_camera_id, u_url, camera_id)
+        account_token_result = create_account_and_token(api, u_sn) if camera_unit_result[0] else None
+
+    # 任一条链失败则注册失败，两条链都失败时合并错误消息
+    errors = [result[-1] for result in (camera_unit_result, account_token_result) if result and not result[0]]
+    if errors:
+        return create_error_result("; ".join(errors))
+
+    _, u_camera_id, u_unit_id, _ = camera_unit_result
+    _, u_account_id, password, device_token, _ = account_token_result
+
+    return finish_registration(server_url, c_sn, u_sn, g_camera_id, u_url,
+                               u_camera_id, u_unit_id, u_account_id, password, device_token, mac=mac)
+
+
 def main():
     """主函数，从配置文件读取参数并执行注册"""
 
@@ -334,9 +626,10 @@ def main():
     u_sn = request_config.get('u_sn', '').strip()
     g_camera_id = request_config.get('g_camera_id', None)  # 可选参数
     u_url = request_config.get('u_url', '').strip()
+    mac = request_config.get('mac', None)  # 可选参数
 
     # 调用注册函数
-    return register_device(server_url, c_sn, u_sn, g_camera_id, u_url)
+    return register_device(server_url, c_sn, u_sn, g_camera_id, u_url, mac)
 
 
 if __name__ == "__main__":
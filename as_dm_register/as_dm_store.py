@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+MS500 DM Registration Store
+
+预注册记录的本地存储（SQLite）
+批量预注册（as_dm_batch.py）把每对 c_sn/u_sn 的注册结果写入本地数据库，
+生产时按 c_sn 查找记录，不再依赖服务器完成整条注册流程
+
+记录状态:
+    registered: 已预注册，尚未分配给设备
+    used: 已在生产中使用（已写入 c_sensor）
+"""
+
+import os
+import sqlite3
+import time
+
+# ------------------ 配置区 ------------------
+
+# 默认数据库路径（当前目录下的 as_dm_store.db）
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_dm_store.db')
+
+# 记录状态
+STATUS_REGISTERED = 'registered'
+STATUS_USED = 'used'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    c_sn         TEXT PRIMARY KEY,
+    u_sn         TEXT NOT NULL UNIQUE,
+    server_url   TEXT NOT NULL,
+    u_url        TEXT NOT NULL DEFAULT '',
+    u_camera_id  INTEGER NOT NULL,
+    u_unit_id    INTEGER NOT NULL,
+    u_account_id INTEGER NOT NULL,
+    password     TEXT NOT NULL,
+    device_token TEXT NOT NULL,
+    c_sensor     TEXT,
+    status       TEXT NOT NULL DEFAULT 'registered',
+    created_at   REAL NOT NULL,
+    used_at      REAL
+);
+CREATE INDEX IF NOT EXISTS registrations_status ON registrations (server_url, status);
+"""
+
+
+# ------------------ RegistrationStore 类 ------------------
+
+class RegistrationStore:
+    """预注册记录存储，每个实例持有一个数据库连接（仅在创建它的线程中使用）"""
+
+    def __init__(self, path=STORE_PATH):
+        """打开（或创建）数据库
+
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        # WAL 模式：批量预注册写入时，产线工位仍可并发读取
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, record: dict):
+        """保存一条预注册记录（同一 c_sn 已存在时覆盖）
+
+        Args:
+            record: 注册结果，包含 c_sn, u_sn, server_url, u_camera_id, u_unit_id,
+                    u_account_id, password, device_token, u_url（可选）
+        """
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO registrations '
+                '(c_sn, u_sn, server_url, u_url, u_camera_id, u_unit_id, u_account_id, password, device_token, '
+                'c_sensor, status, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (record['c_sn'], record['u_sn'], record['server_url'], record.get('u_url', ''),
+                 record['u_camera_id'], record['u_unit_id'], record['u_account_id'],
+                 record['password'], record['device_token'],
+                 record.get('c_sensor'), STATUS_REGISTERED, time.time())
+            )
+
+    def get(self, c_sn: str):
+        """按 c_sn 查找记录
+
+        Returns:
+            dict: 记录，不存在时返回 None
+        """
+        row = self.conn.execute('SELECT * FROM registrations WHERE c_sn = ?', (c_sn,)).fetchone()
+        return dict(row) if row else None
+
+    def contains(self, c_sn: str) -> bool:
+        """c_sn 是否已有记录"""
+        return self.conn.execute('SELECT 1 FROM registrations WHERE c_sn = ?', (c_sn,)).fetchone() is not None
+
+    def mark_used(self, c_sn: str, c_sensor=None) -> bool:
+        """原子地把尚未使用的记录标记为已使用（在向服务器写入 c_sensor 之前调用）
+
+        多个工位同时使用同一 c_sn 的预注册记录时，只有一个能标记成功
+
+        Args:
+            c_sn: 摄像头序列号
+            c_sensor: 写入服务器的全局摄像头ID（可选）
+
+        Returns:
+            bool: 是否标记成功（记录不存在或已被使用时返回 False）
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                'UPDATE registrations SET status = ?, c_sensor = COALESCE(?, c_sensor), used_at = ? '
+                'WHERE c_sn = ? AND status = ?',
+                (STATUS_USED, None if c_sensor is None else str(c_sensor), time.time(), c_sn, STATUS_REGISTERED)
+            )
+        return cursor.rowcount == 1
+
+    def unmark_used(self, c_sn: str, c_sensor=None):
+        """撤销 mark_used（向服务器写入 c_sensor 失败时调用），记录恢复为未使用
+
+        Args:
+            c_sn: 摄像头序列号
+            c_sensor: 标记前记录中的 c_sensor
+        """
+        with self.conn:
+            self.conn.execute(
+                'UPDATE registrations SET status = ?, c_sensor = ?, used_at = NULL WHERE c_sn = ? AND status = ?',
+                (STATUS_REGISTERED, c_sensor, c_sn, STATUS_USED)
+            )
+
+    def count(self, server_url: str = None, status: str = None) -> int:
+        """统计记录数量
+
+        Args:
+            server_url: 只统计该服务器的记录（可选）
+            status: 只统计该状态的记录（可选）
+        """
+        query = 'SELECT COUNT(*) FROM registrations WHERE 1 = 1'
+        params = []
+        if server_url is not None:
+            query += ' AND server_url = ?'
+            params.append(server_url)
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        return self.conn.execute(query, params).fetchone()[0]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+MS500 Serial Number Pool
+
+序列号池：预先导入成对的 c_sn/u_sn（序号区间或显式列表），每台设备注册前从池中领取下一对，
+注册参数写入设备 NVS 后提交，注册或写入失败后释放。领取在 SQLite 事务中完成，多个工位共用一个池也不会拿到同一对序列号
+
+序列号状态:
+    free: 可领取
+    claimed: 已被某个工位领取，正在注册和写入 NVS（超过 LEASE_SECONDS 未提交视为工位异常退出，可被重新领取）
+    used: 已注册并写入设备 NVS
+
+同一台设备（MAC）重试时优先领回它上次释放的序列号，服务器上注册了一半的记录可以继续使用
+
+Usage:
+    python -m as_dm_register.as_sn_pool add --c-prefix CA500-MIPI-zlxc- --u-prefix MS500-H120-EP-zlxu- \\
+        --start 1001 --count 100
+    python -m as_dm_register.as_sn_pool add --file sn_pairs.csv
+    python -m as_dm_register.as_sn_pool status
+"""
+
+import argparse
+import csv
+import os
+import socket
+import sqlite3
+import sys
+import time
+
+from .as_dm_batch import generate_sn_pairs, SN_NUMBER_WIDTH
+
+# ------------------ 配置区 ------------------
+
+# 默认序列号池路径（当前目录下的 as_sn_pool.db）
+POOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'as_sn_pool.db')
+
+# 领取后未提交/释放的最长时间（秒），超时的序列号可被其他工位重新领取
+LEASE_SECONDS = 30 * 60
+
+# 序列号状态
+STATUS_FREE = 'free'
+STATUS_CLAIMED = 'claimed'
+STATUS_USED = 'used'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sn_pool (
+    c_sn         TEXT PRIMARY KEY,
+    u_sn         TEXT NOT NULL UNIQUE,
+    status       TEXT NOT NULL DEFAULT 'free',
+    owner        TEXT,
+    mac          TEXT,
+    claimed_at   REAL,
+    committed_at REAL
+);
+CREATE INDEX IF NOT EXISTS sn_pool_status ON sn_pool (status, c_sn);
+CREATE INDEX IF NOT EXISTS sn_pool_mac ON sn_pool (mac);
+"""
+
+
+# ------------------ 辅助函数 ------------------
+
+def default_owner(port=''):
+    """工位标识：主机名、进程号和串口"""
+    return f"{socket.gethostname()}:{os.getpid()}:{port}"
+
+
+# ------------------ SNPool 类 ------------------
+
+class SNPool:
+    """序列号池，每个实例持有一个数据库连接（仅在创建它的线程中使用）"""
+
+    def __init__(self, path=POOL_PATH, lease_seconds=LEASE_SECONDS):
+        """打开（或创建）序列号池
+
+        Args:
+            path: 数据库文件路径
+            lease_seconds: 领取租期（秒）
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # isolation_level=None：事务由 claim 显式控制（BEGIN IMMEDIATE）
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_pairs(self, sn_pairs):
+        """导入序列号对，已存在的 c_sn 或 u_sn 会被跳过
+
+        Args:
+            sn_pairs: [(c_sn, u_sn), ...]
+
+        Returns:
+            int: 新导入的数量
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO sn_pool (c_sn, u_sn) VALUES (?, ?)', sn_pairs)
+            added = self.conn.total_changes - before
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def add_range(self, c_prefix, u_prefix, start, count, width=SN_NUMBER_WIDTH):
+        """按序号区间导入序列号对（格式同 as_dm_batch.generate_sn_pairs）
+
+        Returns:
+            int: 新导入的数量
+        """
+        return self.add_pairs(generate_sn_pairs(c_prefix, u_prefix, start, count, width))
+
+    def claim(self, owner, mac=None):
+        """原子地领取下一对可用的序列号
+
+        优先领回该 MAC 上次释放的序列号，其次是从未分配过设备的序列号，最后是其他已释放或租期已过的序列号
+
+        Args:
+            owner: 工位标识
+            mac: 设备 MAC 地址（可选）
+
+        Returns:
+            tuple: (c_sn, u_sn)，池已用完时返回 None
+        """
+        now = time.time()
+        stale_before = now - self.lease_seconds
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                'SELECT c_sn, u_sn FROM sn_pool '
+                'WHERE status = ? OR (status = ? AND claimed_at < ?) '
+                'ORDER BY (mac IS NOT NULL AND mac = ?) DESC, mac IS NOT NULL, c_sn '
+                'LIMIT 1',
+                (STATUS_FREE, STATUS_CLAIMED, stale_before, mac)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    'UPDATE sn_pool SET status = ?, owner = ?, mac = COALESCE(?, mac), claimed_at = ? WHERE c_sn = ?',
+                    (STATUS_CLAIMED, owner, mac, now, row['c_sn'])
+                )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return (row['c_sn'], row['u_sn']) if row else None
+
+    def hold(self, c_sn, owner, mac=None):
+        """确认序列号仍归该工位/设备所有并重新开始租期（写入 NVS 前调用）
+
+        该工位领取中的序列号，或绑定该 MAC、已释放或租期已过的序列号，可以继续由该工位持有
+
+        Returns:
+            bool: 是否持有成功（已提交或已被其他工位/设备领取时返回 False）
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            'UPDATE sn_pool SET status = ?, owner = ?, claimed_at = ? '
+            'WHERE c_sn = ? AND ((status = ? AND owner = ?) '
+            'OR (mac IS NOT NULL AND mac = ? AND (status = ? OR (status = ? AND claimed_at < ?))))',
+            (STATUS_CLAIMED, owner, now, c_sn, STATUS_CLAIMED, owner,
+             mac, STATUS_FREE, STATUS_CLAIMED, now - self.lease_seconds)
+        )
+        return cursor.rowcount == 1
+
+    def commit(self, c_sn, owner):
+        """提交已领取的序列号（注册参数已写入设备 NVS）
+
+        Returns:
+            bool: 是否提交成功（序列号不属于该工位时返回 False）
+        """
+        cursor = self.conn.execute(
+            'UPDATE sn_pool SET status = ?, committed_at = ? WHERE c_sn = ? AND status = ? AND owner = ?',
+            (STATUS_USED, time.time(), c_sn, STATUS_CLAIMED, owner)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, c_sn, owner):
+        """释放已领取的序列号（注册失败），保留 MAC 以便同一设备重试时领回
+
+        Returns:
+            bool: 是否释放成功（序列号不属于该工位时返回 False）
+        """
+        cursor = self.conn.execute(
+            'UPDATE sn_pool SET status = ?, owner = NULL, claimed_at = NULL WHERE c_sn = ? AND status = ? AND owner = ?',
+            (STATUS_FREE, c_sn, STATUS_CLAIMED, owner)
+        )
+        return cursor.rowcount == 1
+
+    def counts(self):
+        """各状态的序列号数量
+
+        Returns:
+            dict: {status: count}
+        """
+        counts = {STATUS_FREE: 0, STATUS_CLAIMED: 0, STATUS_USED: 0}
+        for row in self.conn.execute('SELECT status, COUNT(*) AS n FROM sn_pool GROUP BY status'):
+            counts[row['status']] = row['n']
+        return counts
+
+
+# ------------------ 命令行 ------------------
+
+def read_sn_pairs_file(path):
+    """读取序列号对文件（CSV，每行 c_sn,u_sn，# 开头为注释）"""
+    sn_pairs = []
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if not row or row[0].strip().startswith('#'):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"Invalid line in {path}: {','.join(row)}")
+            sn_pairs.append((row[0].strip(), row[1].strip()))
+    return sn_pairs
+
+
+def main():
+    """命令行入口：导入序列号、查看池状态"""
+    parser = argparse.ArgumentParser(description='Manage the c_sn/u_sn pool')
+    parser.add_argument('--pool', default=POOL_PATH, help='Pool database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='Add serial number pairs (range or CSV file)')
+    add_parser.add_argument('--c-prefix', help='Camera serial number prefix')
+    add_parser.add_argument('--u-prefix', help='Unit serial number prefix')
+    add_parser.add_argument('--start', type=int, help='First serial number')
+    add_parser.add_argument('--count', type=int, help='Number of serial number pairs')
+    add_parser.add_argument('--width', type=int, default=SN_NUMBER_WIDTH, help='Digits of the serial number')
+    add_parser.add_argument('--file', help='CSV file with c_sn,u_sn lines')
+
+    subparsers.add_parser('status', help='Show the pool status')
+    args = parser.parse_args()
+
+    with SNPool(args.pool) as pool:
+        if args.command == 'add':
+            if args.file:
+                added = pool.add_pairs(read_sn_pairs_file(args.file))
+            elif None not in (args.c_prefix, args.u_prefix, args.start, args.count):
+                added = pool.add_range(args.c_prefix, args.u_prefix, args.start, args.count, args.width)
+            else:
+                add_parser.error('either --file or --c-prefix/--u-prefix/--start/--count is required')
+            print(f"Added {added} serial number pairs")
+
+        counts = pool.counts()
+        print(f"Free          : {counts[STATUS_FREE]}")
+        print(f"Claimed       : {counts[STATUS_CLAIMED]}")
+        print(f"Used          : {counts[STATUS_USED]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
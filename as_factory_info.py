@@ -1,4 +1,5 @@
 import os
+import socket
 import sys
 import subprocess
 import time
@@ -107,48 +108,75 @@ def test_read_mac(port):
 
 #------------------ 步骤3：调用服务器注册 ------------------
 
-def request_server(mac, existing_info=None):
+def request_server(mac, existing_info=None, owner=None):
     """
     调用 as_dm_register.register_device() 注册设备并获取设备信息
 
+    配置 SN_POOL 为 true 时从序列号池领取 c_sn/u_sn：注册失败后释放，注册成功后保持领取，
+    由 flash_registration 在 NVS 烧录成功后提交，多个工位可以共用一个序列号池连续生产
+
     Args:
         mac: MAC 地址
         existing_info: 可选，从 NVS 读取的现有信息
+        owner: 可选，领取序列号的工位标识（默认为主机名和进程号）
     """
     print("\n" + "=" * 60)
     print("步骤3: 向服务器注册设备")
     print("-" * 60)
 
+    pool = None
+    c_sn = None
     try:
         # 从配置模块读取参数
         server_url = as_ms500_config.get_server_url()
-        c_sn = as_ms500_config.get_c_sn()
-        u_sn = as_ms500_config.get_u_sn()
         u_url = as_ms500_config.get_u_url()
 
+        if as_ms500_config.get_sn_pool_enabled():
+            from as_dm_register.as_sn_pool import SNPool, default_owner
+
+            owner = owner or default_owner()
+            pool = SNPool()
+            claimed = pool.claim(owner, mac)
+            if not claimed:
+                raise RuntimeError("序列号池已用完，请导入新的序列号")
+            c_sn, u_sn = claimed
+            print(f"从序列号池领取: {c_sn} / {u_sn}")
+        else:
+            c_sn = as_ms500_config.get_c_sn()
+            u_sn = as_ms500_config.get_u_sn()
+
         print(f"Reading parameters from configuration:")
         print(f"  server_url: {server_url}")
         print(f"  c_sn: {c_sn}")
         print(f"  u_sn: {u_sn}")
         print(f"  u_url: {u_url}")
 
-        # 从 existing_info 中提取 g_camera_id
+        # 从 existing_info 中提取 g_camera_id（格式无效的不上报给服务器）
         g_camera_id = None
-        if existing_info and existing_info.get("decoded") and existing_info.get("info"):
+        if existing_info and existing_info.get("g_camera_id_valid") and existing_info.get("info"):
             g_camera_id = existing_info.get("info", {}).get("g_camera_id")
             if g_camera_id:
                 print(f"从 NVS 中读取到 g_camera_id: {g_camera_id}")
 
         # 导入 as_dm_register 模块
         from as_dm_register import register_device
+        from as_dm_register.as_dm_api import apply_network_policy
+
+        # 应用配置文件中的 DM 服务器网络策略（超时、重试、熔断）
+        apply_network_policy(as_ms500_config.get_dm_network_policy())
 
         # 调用注册函数，传入参数
-        result = register_device(server_url, c_sn, u_sn, g_camera_id, u_url)
+        result = register_device(server_url, c_sn, u_sn, g_camera_id, u_url, mac=mac)
 
         if not result.get('success'):
             error_msg = result.get('error', 'Unknown error')
             raise RuntimeError(f"服务器注册失败: {error_msg}")
 
+        # 注册成功：序列号保持领取，NVS 烧录成功后再提交
+        if pool is not None:
+            pool.close()
+            pool = None
+
         print("✓ 设备注册成功!")
 
         # 返回统一格式的数据
@@ -165,24 +193,123 @@ def request_server(mac, existing_info=None):
             "mac": mac
         }
 
-    except Exception as e:
+    except BaseException as e:
+        # 注册失败（包括被用户中断）：释放领取的序列号
+        if pool is not None:
+            if c_sn:
+                pool.release(c_sn, owner)
+                print(f"已释放序列号: {c_sn}")
+            pool.close()
+        if not isinstance(e, Exception):
+            raise
         print(f"错误: 设备注册失败 - {e}")
         raise RuntimeError(f"无法注册设备: {e}")
 
 
-#------------------ 步骤5：烧录 NVS 数据 ------------------
-# 此功能已移至 as_nvs_flash.flash_nvs()
+#------------------ 步骤4-5：生成并烧录 NVS 数据 ------------------
+# 生成和烧录已移至 as_nvs_flash.generate_nvs_data() / flash_nvs()
+
+def flash_registration(port, bin_type, device_info, existing_info=None, owner=None):
+    """
+    生成并烧录注册参数 NVS
+
+    配置 SN_POOL 为 true 时，烧录前确认序列号仍归本设备所有（已被其他工位领取则不写入 NVS），
+    烧录成功后提交序列号，失败后释放（保留 MAC，同一设备重试时领回）
+
+    Args:
+        port: 串口号
+        bin_type: 固件类型
+        device_info: request_server() 的返回值
+        existing_info: 可选，从 NVS 读取的现有信息（保留原有参数）
+        owner: 领取序列号时使用的工位标识（与 request_server 相同）
+    """
+    if not as_ms500_config.get_sn_pool_enabled():
+        generate_nvs_data(device_info, existing_nvs=existing_info, bin_type=bin_type)
+        flash_nvs(port, bin_type)
+        return
+
+    from as_dm_register.as_sn_pool import SNPool, default_owner
+
+    owner = owner or default_owner()
+    c_sn = device_info.get("c_sn")
+    with SNPool() as pool:
+        if not pool.hold(c_sn, owner, device_info.get("mac")):
+            raise RuntimeError(f"序列号 {c_sn} 已被其他工位领取或已提交，不写入 NVS，请重新注册")
+        try:
+            generate_nvs_data(device_info, existing_nvs=existing_info, bin_type=bin_type)
+            flash_nvs(port, bin_type)
+        except BaseException:
+            pool.release(c_sn, owner)
+            print(f"已释放序列号: {c_sn}")
+            raise
+        if not pool.commit(c_sn, owner):
+            raise RuntimeError(f"序列号 {c_sn} 提交失败（租期已被其他工位收回），请检查设备 NVS 和序列号池")
+        print(f"✓ 序列号已提交: {c_sn}")
 
 
 #------------------ 主流程 ------------------
 
-def main(port, bin_type):
+def _result(status, mac=None, error='', device_info=None):
+    """
+    生成参数注册结果
+
+    Args:
+        status: registered（已注册并烧录）/ skipped（按策略跳过）/ failed（失败）
+    """
+    return {
+        "success": status != "failed",
+        "status": status,
+        "error": error,
+        "mac": mac,
+        "device_info": device_info,
+    }
+
+
+def apply_registration_policy(existing_info, policy):
+    """
+    根据注册策略决定已有 NVS 数据的设备如何处理
+
+    Returns:
+        tuple: (action, message)，action 为 register / skip / fail
+    """
+    if existing_info.get("g_camera_id_valid"):
+        print("\n✓ 设备已注册且 g_camera_id 有效")
+        action = policy['on_registered']
+        if action == "ask":
+            if not sys.stdin or not sys.stdin.isatty():
+                return "fail", "设备已注册，策略为 ask 但当前不是交互终端"
+            response = input("\n是否继续重新注册? (y/n): ")
+            action = "reregister" if response.lower() == "y" else "skip"
+        if action == "reregister":
+            return "register", "设备已注册，按策略重新注册"
+        if action == "skip":
+            return "skip", "设备已注册，按策略跳过"
+        return "fail", "设备已注册（ON_REGISTERED = fail）"
+
+    print("\n⚠ 设备已有 NVS 数据，但 g_camera_id 无效")
+    action = policy['on_invalid_camera_id']
+    if action == "register":
+        return "register", "g_camera_id 无效，按策略不带 g_camera_id 注册"
+    if action == "skip":
+        return "skip", "g_camera_id 无效，按策略跳过"
+    return "fail", "g_camera_id 无效，需要先启动MS500设备进行camera_id的生成"
+
+
+def main(port, bin_type, policy=None):
     """
     工厂生产流程主函数
 
+    不会等待操作员输入（除非策略为 ask 且在交互终端中运行），也不会退出进程，
+    结果以字典返回，调度程序可以据此继续处理其他设备
+
     Args:
         port: 串口号（必需）
         bin_type: 固件类型（必需）
+        policy: 可选，注册策略 {'on_registered', 'on_invalid_camera_id'}，
+                默认读取 as_ms500_config.get_registration_policy()
+
+    Returns:
+        dict: {success, status, error, mac, device_info}，status 为 registered / skipped / failed
     """
     use_port = port
     use_bin_type = bin_type
@@ -194,7 +321,11 @@ def main(port, bin_type):
     print(f"固件类型: {use_bin_type}")
     print("-" * 60)
 
+    mac = None
     try:
+        use_policy = as_ms500_config.get_registration_policy()
+        use_policy.update(policy or {})
+
         # 步骤1：读取 MAC 和 NVS 数据
         mac = read_flash_and_mac(use_port, use_bin_type)
 
@@ -202,39 +333,33 @@ def main(port, bin_type):
         existing_info = check_nvs_data()
 
         if existing_info:
-            # 检查 g_camera_id 是否有效
-            if existing_info.get("g_camera_id_valid"):
-                print("\n✓ 设备已注册且 g_camera_id 有效")
-                response = input("\n是否继续重新注册? (y/n): ")
-                if response.lower() != "y":
-                    print("操作已取消")
-                    return
-            else:
-                # g_camera_id 无效，需要重新注册
-                print("\n⚠ 设备已有 NVS 数据，但 g_camera_id 无效，需要先启动MS500设备进行camera_id的生成")
-                return
+            action, message = apply_registration_policy(existing_info, use_policy)
+            print(message)
+            if action == "skip":
+                return _result("skipped", mac=mac)
+            if action == "fail":
+                return _result("failed", mac=mac, error=message)
 
         # 步骤3：向服务器注册设备
         # 传入 existing_info 以便从中提取 g_camera_id 用于 c_sensor 参数
-        device_info = request_server(mac, existing_info=existing_info)
+        owner = f"{socket.gethostname()}:{use_port}"
+        device_info = request_server(mac, existing_info=existing_info, owner=owner)
 
-        # 步骤4：生成 NVS 数据（CSV 和 BIN）
+        # 步骤4-5：生成并烧录 NVS 数据（CSV 和 BIN），烧录成功后提交领取的序列号
         # 传入 existing_info 以保留原有参数（如 g_camera_id, wake_count 等）
-        generate_nvs_data(device_info, existing_nvs=existing_info, bin_type=use_bin_type)
-
-        # 步骤5：烧录 NVS 数据
-        flash_nvs(use_port, use_bin_type)
+        flash_registration(use_port, use_bin_type, device_info, existing_info=existing_info, owner=owner)
 
         # 完成
         print("\n" + "=" * 60)
         print("  ✓ 参数注册 完成")
+        return _result("registered", mac=mac, device_info=device_info)
 
     except KeyboardInterrupt:
         print("\n\n操作被用户中断")
-        sys.exit(1)
+        return _result("failed", mac=mac, error="操作被用户中断")
     except Exception as e:
         print(f"\n\n错误: {e}")
-        sys.exit(1)
+        return _result("failed", mac=mac, error=str(e))
 
 
 if __name__ == "__main__":
@@ -244,5 +369,5 @@ if __name__ == "__main__":
     BIN_TYPE = as_ms500_config.get_bin_type()
 
     # 执行主函数
-    sys.exit(main(PORT, BIN_TYPE))
-
+    result = main(PORT, BIN_TYPE)
+    sys.exit(0 if result["success"] else 1)
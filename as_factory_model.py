@@ -3,8 +3,8 @@
 MS500 AI 模型工厂烧录工具
 
 功能说明:
-1. 调用 as_model_down.py 获取 g_camera_id 并下载生成模型，得到 spiffs_dl 目录
-2. 调用 as_model_flash.py 创建 storage_dl.bin 并烧录
+1. 调用 as_model_down.py 获取 g_camera_id 并下载生成模型，烧录文件直接从转换结果 ZIP 读入内存
+2. 调用 as_model_flash.py 在进程内创建 storage_dl.bin 并烧录
 3. 调用 as_model_flag.py 添加 is_model_update=1 并更新烧录 NVS bin
 
 使用前准备:
@@ -65,13 +65,14 @@ def main(port, model_type, bin_type):
         print("【步骤 1/3】 获取 device_id 并生成模型")
         print("-" * 60)
 
-        spiffs_dl_dir = as_model_down.main(use_port, use_model_type, use_bin_type)
-        if not spiffs_dl_dir:
+        model_files = as_model_down.main(use_port, use_model_type, use_bin_type, in_memory=True)
+        if not model_files:
             print("\n✗ 步骤 1 失败: 生成模型失败")
             return 1
 
-        print(f"\n✓ 步骤 1 完成: spiffs_dl 目录已生成")
-        print(f"  路径: {spiffs_dl_dir}")
+        print(f"\n✓ 步骤 1 完成: 烧录文件已生成")
+        for name in sorted(model_files):
+            print(f"  {name} ({len(model_files[name])} 字节)")
 
 
         # 步骤3: 调用 as_model_flag.py 添加 is_model_update=1 并更新 NVS
@@ -90,7 +91,7 @@ def main(port, model_type, bin_type):
         print("【步骤 2/3】 创建并烧录 storage_dl.bin")
         print("-" * 60)
 
-        if not as_model_flash.main(use_port, spiffs_dl_dir, use_bin_type):
+        if not as_model_flash.main(use_port, model_files, use_bin_type):
             print("\n✗ 步骤 2 失败: 烧录模型失败")
             return 1
 
@@ -101,7 +102,7 @@ def main(port, model_type, bin_type):
         # 完成
         print("\n" + "=" * 80)
         print("  ✓ AI 模型工厂烧录完成")
-        print(f"SPIFFS DL 目录: {spiffs_dl_dir}")
+        print(f"烧录文件: {', '.join(sorted(model_files))}")
         print(f"is_model_update: 1")
         print("-" * 60)
 
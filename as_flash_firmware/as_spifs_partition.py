@@ -6,6 +6,14 @@
 
 import os
 import csv
+import threading
+
+
+#------------------  分区表缓存  ------------------
+
+# 已解析的分区表 {路径: (修改时间, 文件大小, 分区信息)}，文件变化时重新解析
+_partitions_cache = {}
+_partitions_lock = threading.Lock()
 
 
 #------------------  分区信息解析  ------------------
@@ -70,6 +78,19 @@ def parse_partitions_csv(csv_path):
     return partitions
 
 
+def _load_partitions(csv_path):
+    """返回缓存的分区表，文件不存在时抛出 FileNotFoundError"""
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Partition table file not found: {csv_path}")
+    stat = os.stat(csv_path)
+    with _partitions_lock:
+        cached = _partitions_cache.get(csv_path)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            cached = (stat.st_mtime_ns, stat.st_size, parse_partitions_csv(csv_path))
+            _partitions_cache[csv_path] = cached
+        return cached[2]
+
+
 def get_partition_info(bin_type, partition_name):
     """
     获取指定固件类型和分区的信息
@@ -86,11 +107,12 @@ def get_partition_info(bin_type, partition_name):
     bin_dir = os.path.join(os.path.dirname(__file__), "bin_type", bin_type)
     csv_path = os.path.join(bin_dir, "partitions.csv")
 
-    # 解析分区表
-    partitions = parse_partitions_csv(csv_path)
+    # 解析分区表（同一文件只解析一次，文件变化时重新解析）
+    partitions = _load_partitions(csv_path)
 
-    # 返回指定分区的信息
-    return partitions.get(partition_name)
+    # 返回指定分区的信息（副本，调用方修改不影响缓存）
+    info = partitions.get(partition_name)
+    return dict(info) if info is not None else None
 
 
 def get_nvs_info(bin_type):
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+MS500 生产日志（断点续做）
+
+功能说明:
+按设备 MAC 保存生产流水线（as_pipeline.py）中每个已完成步骤的输出、输入摘要和产物 sha256，
+再次处理同一台设备时跳过已完成的步骤、复用之前的结果，从第一个未完成的步骤继续
+（例如 storage_dl 烧录到 90% 失败后重新运行，不会再次注册、烧录固件或云端转换）
+
+日志文件:
+    journal/{mac}.json，每次更新先写临时文件再替换，进程中断时文件始终完整
+
+日志内容:
+    {
+        "mac": "30:ed:a0:12:34:56",
+        "context": {"bin_type": ..., "model_type": ...},
+        "finished": false,
+        "steps": {
+            "firmware": {"completed_at": ..., "inputs": {...}, "output": ..., "artifacts": {文件名: sha256}},
+            ...
+        }
+    }
+
+固件类型或模型类型变化、或上次已全部完成时，日志重新开始
+
+使用方法:
+    python as_journal.py 30:ed:a0:12:34:56          # 查看设备日志
+    python as_journal.py 30:ed:a0:12:34:56 --reset  # 删除设备日志，下次从头开始
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from as_dm_register.as_dm_ledger import normalize_mac
+from as_model_conversion.as_model_cache import file_sha256
+
+
+#------------------  配置区  ------------------
+
+# 日志目录
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal")
+
+
+#------------------  辅助函数  ------------------
+
+def directory_sha256(dir_path):
+    """计算目录下所有文件（相对路径和内容）的 sha256，目录不存在时返回空字符串"""
+    if not os.path.isdir(dir_path):
+        return ""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            rel_path = os.path.relpath(file_path, dir_path).replace(os.sep, "/")
+            digest.update(rel_path.encode("utf-8"))
+            digest.update(file_sha256(file_path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def unfinished_macs(journal_dir=JOURNAL_DIR):
+    """返回有已完成步骤、但整体尚未完成的设备 MAC 集合（日志目录不存在时为空）"""
+    macs = set()
+    if not os.path.isdir(journal_dir):
+        return macs
+    for file_name in os.listdir(journal_dir):
+        if not file_name.endswith(".json") or file_name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(journal_dir, file_name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not data.get("finished") and data.get("steps"):
+                macs.add(normalize_mac(data["mac"]))
+        except (OSError, ValueError, KeyError):
+            continue
+    return macs
+
+
+#------------------  ProductionJournal 类  ------------------
+
+class ProductionJournal:
+    """单台设备的生产日志"""
+
+    def __init__(self, mac, journal_dir=JOURNAL_DIR):
+        """
+        打开（或新建）设备日志
+
+        参数:
+            mac: 设备 MAC 地址
+            journal_dir: 日志目录
+        """
+        self.mac = normalize_mac(mac)
+        self.path = os.path.join(journal_dir, self.mac.replace(":", "") + ".json")
+        self.data = self._load()
+
+    def _new(self, context=None):
+        return {"mac": self.mac, "context": context or {}, "finished": False,
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "steps": {}}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return self._new()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 生产日志无法读取，重新开始: {self.path} ({e})")
+            return self._new()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".journal_", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def begin(self, context):
+        """
+        开始处理设备：上下文（固件类型、模型类型等）变化或上次已全部完成时清空日志
+
+        返回:
+            list: 可以复用的已完成步骤名
+        """
+        if self.data.get("finished") or self.data.get("context") != context:
+            self.data = self._new(context)
+            self._save()
+        return list(self.data["steps"])
+
+    def step(self, name):
+        """返回已完成步骤的记录 {completed_at, inputs, output, artifacts}，未完成返回 None"""
+        return self.data["steps"].get(name)
+
+    def record(self, name, output=None, inputs=None, artifacts=None):
+        """记录步骤完成（立即写入文件）"""
+        self.data["steps"][name] = {
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "inputs": inputs or {},
+            "output": output,
+            "artifacts": artifacts or {},
+        }
+        self._save()
+
+    def discard(self, name):
+        """删除步骤记录（输入已变化或产物无法复用）"""
+        if self.data["steps"].pop(name, None) is not None:
+            self._save()
+
+    def finish(self):
+        """标记设备已全部完成，下次处理时重新开始"""
+        self.data["finished"] = True
+        self._save()
+
+    def reset(self):
+        """删除设备日志"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = self._new()
+
+
+#------------------  命令行  ------------------
+
+def main():
+    """命令行入口：查看或删除设备日志"""
+    parser = argparse.ArgumentParser(description="Show or reset the production journal of a device")
+    parser.add_argument("mac", help="Device MAC address")
+    parser.add_argument("--reset", action="store_true", help="Delete the journal")
+    parser.add_argument("--journal-dir", default=JOURNAL_DIR, help="Journal directory")
+    args = parser.parse_args()
+
+    journal = ProductionJournal(args.mac, args.journal_dir)
+    if args.reset:
+        journal.reset()
+        print(f"Journal deleted: {journal.path}")
+        return 0
+
+    if not os.path.exists(journal.path):
+        print(f"Journal not found: {journal.path}")
+        return 1
+
+    print(f"MAC           : {journal.mac}")
+    print(f"Context       : {json.dumps(journal.data.get('context', {}), ensure_ascii=False)}")
+    print(f"Finished      : {journal.data.get('finished', False)}")
+    for name, entry in journal.data["steps"].items():
+        print(f"  {name:<12} {entry['completed_at']}")
+        for artifact, sha256 in entry.get("artifacts", {}).items():
+            print(f"      {artifact}: {sha256}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,6 @@ as_model_conversion 模块
 """
 
 # 导出模型认证函数
-from .as_model_auth import generate_model_by_device_id
+from .as_model_auth import generate_model_by_device_id, generate_model_files_by_device_id
 
-__all__ = ["generate_model_by_device_id"]
+__all__ = ["generate_model_by_device_id", "generate_model_files_by_device_id"]
@@ -9,6 +9,10 @@ AI 模型认证和打包工具（优化版本）
 - type_model 目录仅存放模型文件（packerOut.zip 和 network_info.txt）
 - 工作目录统一在 as_model_conversion/temp/{device_id}/ 下
 - 分层处理：目录创建 → 模型转换 → ZIP解压 → 文件复制 → 组装spiffs_dl
+- 转换结果按 (device_id, model_type, packerOut.zip sha256, packager_version) 缓存，
+  同一设备重烧时命中缓存直接跳过云端转换（见 as_model_cache.py）
+- generate_model_files_by_device_id 直接从转换结果 ZIP 读取 .fpk 到内存，
+  不再解压和复制到 spiffs_dl，结果交给 as_model_flash 直接生成 storage_dl.bin
 
 使用方法:
     from as_model_auth import generate_model_by_device_id
@@ -17,18 +21,25 @@ AI 模型认证和打包工具（优化版本）
         device_id="100B50501A2101059064011000000000",
         model_type="ped_alarm"
     )
+
+    # 内存组装：{文件名: bytes}
+    files = generate_model_files_by_device_id(device_id, model_type)
 """
 
 import os
 import sys
 import zipfile
 import shutil
+import posixpath
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 # 导入 model_conversion 模块
 from .model_conversion import model_convert
 
+# 导入转换模型缓存
+from .as_model_cache import ModelArtifactCache
+
 
 #------------------  步骤 1: 创建工作目录  ------------------
 
@@ -301,19 +312,119 @@ def assemble_spiffs_dl(spiffs_dl_dir: str) -> bool:
     return True
 
 
+#------------------  内存组装：直接从 ZIP 读取烧录文件  ------------------
+
+def read_flash_files_from_zip(zip_file_path: str, model_type: str, base_path: Optional[str] = None) -> Optional[Dict[str, bytes]]:
+    """
+    直接从转换结果 ZIP 中读取烧录文件到内存（替代 步骤 3 解压 + 步骤 4 复制）
+
+    需要的文件：
+    1. ZIP 中的 .fpk 成员（按 ZIP 目录顺序取第一个）
+    2. type_model 目录下的 network_info.txt（不存在时从 ZIP 中查找）
+
+    参数:
+        zip_file_path: ZIP 文件路径
+        model_type: 模型类型
+        base_path: 基础路径
+
+    返回:
+        {文件名: 文件内容}，失败返回 None
+    """
+    print("\n" + "=" * 60)
+    print("  步骤 3: 从 ZIP 读取烧录文件（内存组装）")
+    print("-" * 60)
+
+    # 确定基础路径（当前文件在 as_model_conversion 目录下）
+    if base_path is None:
+        base_path = os.path.dirname(__file__)
+
+    files: Dict[str, bytes] = {}
+    try:
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            members = [info for info in zip_ref.infolist() if not info.is_dir()]
+
+            # 1. 读取 .fpk 成员
+            fpk_info = next((info for info in members if info.filename.endswith('.fpk')), None)
+            if fpk_info is None:
+                print("错误: 在 ZIP 文件中未找到 network.fpk")
+                return None
+            fpk_name = posixpath.basename(fpk_info.filename)
+            files[fpk_name] = zip_ref.read(fpk_info)
+            print(f"✓ 已读取 {fpk_name} ({len(files[fpk_name])} 字节)")
+            print(f"  ZIP 成员: {fpk_info.filename}")
+
+            # 2. 读取 network_info.txt
+            network_info_source = os.path.join(base_path, "type_model", model_type, "network_info.txt")
+            if os.path.exists(network_info_source):
+                with open(network_info_source, 'rb') as f:
+                    files['network_info.txt'] = f.read()
+                print(f"✓ 已读取 network_info.txt")
+                print(f"  源路径: {network_info_source}")
+            else:
+                print(f"警告: network_info.txt 未找到: {network_info_source}")
+                print("检查 ZIP 文件中是否存在 network_info.txt...")
+                info_member = next((info for info in members
+                                    if posixpath.basename(info.filename) == 'network_info.txt'), None)
+                if info_member is None:
+                    print("错误: 无法在任何位置找到 network_info.txt")
+                    return None
+                files['network_info.txt'] = zip_ref.read(info_member)
+                print(f"✓ 从 ZIP 文件中读取了 network_info.txt")
+                print(f"  ZIP 成员: {info_member.filename}")
+
+    except Exception as e:
+        print(f"读取 ZIP 文件时发生错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+    return files
+
+
+def check_flash_files(files: Dict[str, bytes]) -> bool:
+    """
+    校验内存中的烧录文件是否齐全（对应 步骤 5 的目录校验）
+
+    参数:
+        files: {文件名: 文件内容}
+
+    返回:
+        齐全返回 True，否则返回 False
+    """
+    print("\n" + "=" * 60)
+    print("  步骤 4: 校验烧录文件")
+    print("-" * 60)
+
+    for name, content in files.items():
+        print(f"  - {name} ({len(content)} 字节)")
+
+    if not any(name.endswith('.fpk') for name in files):
+        print("错误: 未找到 .fpk 文件")
+        return False
+
+    if 'network_info.txt' not in files:
+        print("错误: 未找到 network_info.txt")
+        return False
+
+    print(f"\n✓ 烧录文件齐全")
+    print(f"✓ 准备烧录")
+    return True
+
+
 #------------------  核心函数：整合所有步骤  ------------------
 
 def generate_model_by_device_id(
     device_id: str,
     model_type: str,
-    base_path: Optional[str] = None
+    base_path: Optional[str] = None,
+    use_cache: bool = True
 ) -> Optional[str]:
     """
     根据传入的 device_id 和 model_type 生成模型文件
 
     【5步分层处理】
     1. 创建工作目录（temp/{device_id}/output 和 temp/{device_id}/spiffs_dl）
-    2. 模型转换（调用 model_convert）
+    2. 模型转换（调用 model_convert）；命中缓存时跳过 2~4 步
     3. ZIP 解压缩
     4. 复制烧录文件（network.fpk + network_info.txt）
     5. 组装 spiffs_dl 目录
@@ -322,6 +433,7 @@ def generate_model_by_device_id(
         device_id: 设备 ID（32位十六进制字符串）
         model_type: 模型类型（如 "ped_alarm"），对应 type_model 下的目录名
         base_path: 基础路径，默认为 as_model_conversion 目录
+        use_cache: 是否使用转换模型缓存（默认 True）
 
     返回:
         生成的 spiffs_dl 目录路径，失败返回 None
@@ -340,6 +452,20 @@ def generate_model_by_device_id(
         # 步骤 1: 创建工作目录
         device_work_dir, output_dir, spiffs_dl_dir = create_work_directories(device_id, base_path)
 
+        # 查询转换模型缓存
+        cache = None
+        cache_key = None
+        packerOut_path = os.path.join(base_path, "type_model", model_type, "packerOut.zip")
+        if use_cache and os.path.exists(packerOut_path):
+            cache = ModelArtifactCache()
+            cache_key = cache.build_key(device_id, model_type, packerOut_path)
+            if cache.restore(cache_key, spiffs_dl_dir):
+                print("\n✓ 命中转换模型缓存，跳过云端转换")
+                if assemble_spiffs_dl(spiffs_dl_dir):
+                    return str(spiffs_dl_dir)
+                # 缓存内容不可用时回退到完整流程
+                create_work_directories(device_id, base_path)
+
         # 步骤 2: 模型转换
         converted_file = convert_model(device_id, model_type, output_dir, base_path)
         if not converted_file:
@@ -358,6 +484,10 @@ def generate_model_by_device_id(
         if not assemble_spiffs_dl(spiffs_dl_dir):
             return None
 
+        # 写入转换模型缓存
+        if cache is not None:
+            cache.store(cache_key, spiffs_dl_dir)
+
         # 返回 spiffs_dl 目录路径
         print("\n" + "=" * 80)
         print("  ✓ 所有步骤已成功完成")
@@ -373,6 +503,91 @@ def generate_model_by_device_id(
         return None
 
 
+def generate_model_files_by_device_id(
+    device_id: str,
+    model_type: str,
+    base_path: Optional[str] = None,
+    use_cache: bool = True
+) -> Optional[Dict[str, bytes]]:
+    """
+    根据传入的 device_id 和 model_type 生成烧录文件（内存组装版本）
+
+    与 generate_model_by_device_id 相同的转换流程，但不再解压 ZIP、不再复制到 spiffs_dl，
+    .fpk 直接从转换结果 ZIP 中读取，返回值可直接交给 as_model_flash 生成 storage_dl.bin
+
+    【4步处理】
+    1. 创建工作目录（仅用于存放下载的转换结果 ZIP）
+    2. 模型转换（调用 model_convert）；命中缓存时跳过 2~3 步
+    3. 从 ZIP 读取烧录文件（network.fpk + network_info.txt）
+    4. 校验烧录文件
+
+    参数:
+        device_id: 设备 ID（32位十六进制字符串）
+        model_type: 模型类型（如 "ped_alarm"），对应 type_model 下的目录名
+        base_path: 基础路径，默认为 as_model_conversion 目录
+        use_cache: 是否使用转换模型缓存（默认 True）
+
+    返回:
+        {文件名: 文件内容}，失败返回 None
+    """
+    print("\n" + "=" * 80)
+    print("  根据设备 ID 生成模型 - 内存组装流程")
+    print("-" * 60)
+    print(f"设备 ID: {device_id}")
+    print(f"模型类型: {model_type}")
+
+    try:
+        # 确定基础路径（当前文件在 as_model_conversion 目录下）
+        if base_path is None:
+            base_path = os.path.dirname(__file__)
+
+        # 查询转换模型缓存
+        cache = None
+        cache_key = None
+        packerOut_path = os.path.join(base_path, "type_model", model_type, "packerOut.zip")
+        if use_cache and os.path.exists(packerOut_path):
+            cache = ModelArtifactCache()
+            cache_key = cache.build_key(device_id, model_type, packerOut_path)
+            files = cache.load(cache_key)
+            if files is not None:
+                print("\n✓ 命中转换模型缓存，跳过云端转换")
+                if check_flash_files(files):
+                    return files
+
+        # 步骤 1: 创建工作目录
+        device_work_dir, output_dir, spiffs_dl_dir = create_work_directories(device_id, base_path)
+
+        # 步骤 2: 模型转换
+        converted_file = convert_model(device_id, model_type, output_dir, base_path)
+        if not converted_file:
+            return None
+
+        # 步骤 3: 从 ZIP 读取烧录文件
+        files = read_flash_files_from_zip(converted_file, model_type, base_path)
+        if files is None:
+            return None
+
+        # 步骤 4: 校验烧录文件
+        if not check_flash_files(files):
+            return None
+
+        # 写入转换模型缓存
+        if cache is not None:
+            cache.store_files(cache_key, files)
+
+        print("\n" + "=" * 80)
+        print("  ✓ 所有步骤已成功完成")
+        print("-" * 60)
+
+        return files
+
+    except Exception as e:
+        print(f"\n发生错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
 #------------------  主函数  ------------------
 
 def main():
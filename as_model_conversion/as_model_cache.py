@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+转换模型缓存模块
+
+功能说明:
+缓存 AITRIOS 云端转换后的烧录文件（network.fpk + network_info.txt），
+设备返修、重烧或 storage_dl 烧录失败后再次运行时，命中缓存即可跳过云端转换。
+
+缓存键:
+    (device_id, model_type, packerOut.zip 的 sha256, packager_version)
+
+缓存目录结构:
+    as_model_conversion/cache/{key_hash}/
+        manifest.json       # 缓存键、文件大小、sha256、最近访问时间
+        network.fpk
+        network_info.txt
+
+【完整性校验】命中时重新计算每个文件的 sha256，与 manifest 不一致则删除该条目并视为未命中
+【容量控制】写入后按最近访问时间（LRU）淘汰，保证缓存总大小不超过 MAX_CACHE_BYTES
+
+使用方法:
+    from as_model_conversion.as_model_cache import ModelArtifactCache
+
+    cache = ModelArtifactCache()
+    key = cache.build_key(device_id, model_type, packerOut_path)
+    if not cache.restore(key, spiffs_dl_dir):
+        ...  # 云端转换后
+        cache.store(key, spiffs_dl_dir)
+
+    # 内存组装流程
+    files = cache.load(key)              # {文件名: bytes}，未命中返回 None
+    cache.store_files(key, files)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from typing import Dict, List, Optional
+
+from .model_conversion import PACKAGER_VERSION
+
+
+#------------------  配置区  ------------------
+
+# 缓存根目录（as_model_conversion/cache）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# 缓存总大小上限（字节），超过后按 LRU 淘汰
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+
+# manifest 文件名
+MANIFEST_NAME = "manifest.json"
+
+# 计算 sha256 时的读取块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+#------------------  辅助函数  ------------------
+
+def file_sha256(file_path: str) -> str:
+    """分块计算文件的 sha256（避免把整个模型读入内存）"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_flash_file(file_name: str) -> bool:
+    """判断是否为需要缓存的烧录文件"""
+    return file_name.endswith('.fpk') or file_name == 'network_info.txt'
+
+
+#------------------  缓存类  ------------------
+
+class ModelArtifactCache:
+    """转换模型缓存，按缓存键保存烧录文件并做完整性校验和 LRU 淘汰"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = MAX_CACHE_BYTES):
+        """
+        参数:
+            cache_dir: 缓存根目录，默认为 as_model_conversion/cache
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def build_key(self, device_id: str, model_type: str, packerOut_path: str,
+                  packager_version: str = PACKAGER_VERSION) -> Dict[str, str]:
+        """
+        构建缓存键
+
+        参数:
+            device_id: 设备 ID
+            model_type: 模型类型
+            packerOut_path: packerOut.zip 路径（计算其 sha256）
+            packager_version: 云端打包版本
+
+        返回:
+            缓存键字典
+        """
+        return {
+            'device_id': device_id,
+            'model_type': model_type,
+            'packerOut_sha256': file_sha256(packerOut_path),
+            'packager_version': packager_version,
+        }
+
+    def _entry_dir(self, key: Dict[str, str]) -> str:
+        key_text = json.dumps(key, sort_keys=True)
+        key_hash = hashlib.sha256(key_text.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.cache_dir, key_hash)
+
+    @staticmethod
+    def _read_manifest(entry_dir: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(entry_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_manifest(entry_dir: str, manifest: dict) -> None:
+        # 先写临时文件再替换，避免并发读取到半个 manifest
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(entry_dir, MANIFEST_NAME))
+
+    def _remove_entry(self, entry_dir: str) -> None:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def _check_manifest(self, key: Dict[str, str], entry_dir: str) -> Optional[dict]:
+        """读取并检查条目的 manifest，不合法时删除条目并返回 None"""
+        manifest = self._read_manifest(entry_dir)
+        if manifest is None:
+            return None
+
+        if manifest.get('key') != key:
+            print(f"警告: 缓存键不一致，删除缓存条目: {entry_dir}")
+            self._remove_entry(entry_dir)
+            return None
+
+        files = manifest.get('files', {})
+        if not any(name.endswith('.fpk') for name in files) or 'network_info.txt' not in files:
+            print(f"警告: 缓存条目文件不完整，删除缓存条目: {entry_dir}")
+            self._remove_entry(entry_dir)
+            return None
+        return manifest
+
+    def _touch(self, entry_dir: str, manifest: dict) -> None:
+        """更新最近访问时间（LRU）"""
+        manifest['last_access'] = time.time()
+        try:
+            self._write_manifest(entry_dir, manifest)
+        except OSError:
+            pass
+
+    def lookup(self, key: Dict[str, str]) -> Optional[str]:
+        """
+        查找缓存条目并校验完整性
+
+        返回:
+            命中返回条目目录路径，未命中或校验失败返回 None
+        """
+        entry_dir = self._entry_dir(key)
+        manifest = self._check_manifest(key, entry_dir)
+        if manifest is None:
+            return None
+
+        for name, info in manifest['files'].items():
+            file_path = os.path.join(entry_dir, name)
+            if (not os.path.isfile(file_path)
+                    or os.path.getsize(file_path) != info.get('size')
+                    or file_sha256(file_path) != info.get('sha256')):
+                print(f"警告: 缓存文件校验失败 ({name})，删除缓存条目: {entry_dir}")
+                self._remove_entry(entry_dir)
+                return None
+
+        self._touch(entry_dir, manifest)
+        return entry_dir
+
+    def load(self, key: Dict[str, str]) -> Optional[Dict[str, bytes]]:
+        """
+        命中缓存时将烧录文件读入内存（每个文件只读取一次，校验与读取合并）
+
+        返回:
+            {文件名: 文件内容}，未命中或校验失败返回 None
+        """
+        entry_dir = self._entry_dir(key)
+        manifest = self._check_manifest(key, entry_dir)
+        if manifest is None:
+            return None
+
+        files = {}
+        for name, info in manifest['files'].items():
+            try:
+                with open(os.path.join(entry_dir, name), 'rb') as f:
+                    content = f.read()
+            except OSError:
+                content = None
+            if (content is None or len(content) != info.get('size')
+                    or hashlib.sha256(content).hexdigest() != info.get('sha256')):
+                print(f"警告: 缓存文件校验失败 ({name})，删除缓存条目: {entry_dir}")
+                self._remove_entry(entry_dir)
+                return None
+            files[name] = content
+
+        self._touch(entry_dir, manifest)
+        return files
+
+    def restore(self, key: Dict[str, str], spiffs_dl_dir: str) -> bool:
+        """
+        命中缓存时将烧录文件写入 spiffs_dl 目录
+
+        返回:
+            命中并写入成功返回 True，否则返回 False
+        """
+        files = self.load(key)
+        if files is None:
+            return False
+
+        os.makedirs(spiffs_dl_dir, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(spiffs_dl_dir, name), 'wb') as f:
+                f.write(content)
+            print(f"✓ 从缓存恢复 {name}")
+        return True
+
+    def store(self, key: Dict[str, str], spiffs_dl_dir: str) -> bool:
+        """
+        将 spiffs_dl 目录中的烧录文件写入缓存
+
+        返回:
+            写入成功返回 True，失败返回 False
+        """
+        files = {}
+        for name in sorted(os.listdir(spiffs_dl_dir)):
+            file_path = os.path.join(spiffs_dl_dir, name)
+            if _is_flash_file(name) and os.path.isfile(file_path):
+                with open(file_path, 'rb') as f:
+                    files[name] = f.read()
+        return self.store_files(key, files)
+
+    def store_files(self, key: Dict[str, str], files: Dict[str, bytes]) -> bool:
+        """
+        将内存中的烧录文件 {文件名: 内容} 写入缓存，并执行 LRU 淘汰
+
+        返回:
+            写入成功返回 True，失败返回 False
+        """
+        files = {name: content for name, content in files.items() if _is_flash_file(name)}
+        if not files:
+            print("警告: 没有可缓存的烧录文件")
+            return False
+
+        entry_dir = self._entry_dir(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # 先写入临时目录，完成后整体替换，保证其他进程看不到写了一半的条目
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.staging_')
+        try:
+            manifest_files = {}
+            for name, content in files.items():
+                with open(os.path.join(staging_dir, name), 'wb') as f:
+                    f.write(content)
+                manifest_files[name] = {'size': len(content), 'sha256': hashlib.sha256(content).hexdigest()}
+
+            now = time.time()
+            self._write_manifest(staging_dir, {
+                'key': key,
+                'files': manifest_files,
+                'created': now,
+                'last_access': now,
+            })
+
+            if os.path.exists(entry_dir):
+                self._remove_entry(entry_dir)
+            os.replace(staging_dir, entry_dir)
+        except OSError as e:
+            print(f"警告: 写入模型缓存失败: {e}")
+            self._remove_entry(staging_dir)
+            return False
+
+        print(f"✓ 转换结果已写入缓存: {entry_dir}")
+        self.evict()
+        return True
+
+    def _entries(self) -> List[dict]:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            manifest = self._read_manifest(entry_dir)
+            if manifest is None:
+                # 没有 manifest 的条目视为损坏
+                self._remove_entry(entry_dir)
+                continue
+            size = sum(info.get('size', 0) for info in manifest.get('files', {}).values())
+            entries.append({'dir': entry_dir, 'size': size, 'last_access': manifest.get('last_access', 0)})
+        return entries
+
+    def evict(self) -> int:
+        """
+        按最近访问时间淘汰缓存条目，直到总大小不超过 max_bytes
+
+        返回:
+            被淘汰的条目数量
+        """
+        entries = sorted(self._entries(), key=lambda e: e['last_access'])
+        total = sum(e['size'] for e in entries)
+        evicted = 0
+        while entries and total > self.max_bytes:
+            oldest = entries.pop(0)
+            self._remove_entry(oldest['dir'])
+            total -= oldest['size']
+            evicted += 1
+            print(f"淘汰缓存条目: {oldest['dir']}")
+        return evicted
@@ -6,6 +6,9 @@ from urllib.parse import urlparse
 from datetime import datetime
 import time
 import os
+import hashlib
+import threading
+import zipfile
 
 # 定义常量
 TENANT_ID = "00g4kibanoaacZRcb697"
@@ -18,9 +21,35 @@ PORTAL_OKTA_DOMAIN = "https://auth.aitrios.sony-semicon.com"
 PARENT_META_FIELD = "aitriosPortalConverterPackager"    
 CHILD_META_FIELD_Conveter = "aitriosPortalConverter"    
 CHILD_META_FIELD_Packager = "aitriosPortalPackager"
+KEY_GENERATION = "0001"
+PACKAGER_VERSION = "4.00.00"
 
-# 获取访问令牌
+# 访问令牌在过期前多少秒重新获取
+TOKEN_REFRESH_MARGIN = 60
+
+# 进程内缓存的访问令牌（长期运行时多台设备共用，过期前重新获取）
+_token_cache = {"access_token": None, "expires_at": 0.0}
+_token_lock = threading.Lock()
+
+# 获取访问令牌（缓存未过期时直接返回）
 def get_access_token():
+    with _token_lock:
+        if _token_cache["access_token"] and time.monotonic() < _token_cache["expires_at"]:
+            return _token_cache["access_token"]
+        access_token, expires_in = _request_access_token()
+        if access_token and expires_in:
+            _token_cache["access_token"] = access_token
+            _token_cache["expires_at"] = time.monotonic() + expires_in - TOKEN_REFRESH_MARGIN
+        return access_token
+
+# 丢弃缓存的访问令牌（令牌可能已被服务器撤销或提前过期，下次调用重新获取）
+def invalidate_access_token():
+    with _token_lock:
+        _token_cache["access_token"] = None
+        _token_cache["expires_at"] = 0.0
+
+# 向认证服务器申请访问令牌，返回 (令牌, 有效期秒数)
+def _request_access_token():
     print("### 获取访问令牌")
     credentials = f"{CLIENT_ID}:{SECRET}".encode("utf-8")
     authorization_code = base64.b64encode(credentials).decode("utf-8")
@@ -37,10 +66,11 @@ def get_access_token():
 
     try:
         response = subprocess.run(command, capture_output=True, text=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-        return json.loads(response.stdout)["access_token"]
+        token_data = json.loads(response.stdout)
+        return token_data["access_token"], int(token_data.get("expires_in", 0))
     except subprocess.CalledProcessError as e:
         print(f"获取访问令牌时出错: {e.stderr}")
-        return None
+        return None, 0
 
 # 上传文件
 def upload_file(access_token, model_path):
@@ -105,8 +135,8 @@ def publish_model(access_token, device_id, model_id):
         "--header", f"child_meta_field: {CHILD_META_FIELD_Packager}",
         "--data-raw", json.dumps({
             "device_id": device_id,
-            "key_generation": "0001",
-            "packager_version": "4.00.00"
+            "key_generation": KEY_GENERATION,
+            "packager_version": PACKAGER_VERSION
         })
     ]
 
@@ -152,13 +182,121 @@ def get_publish_status(access_token, transaction_id):
             print(f"获取发布状态时出错: {e.stderr}")
             return None
 
-def download_model(publish_url, output_dir=None):
+# 下载参数
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_MAX_RETRIES = 5
+DOWNLOAD_TIMEOUT = (10, 60)  # (连接超时, 读取超时) 秒
+
+
+def print_download_progress(downloaded, total, bytes_per_sec):
     """
-    下载模型文件
+    默认下载进度回调：打印已下载字节数、百分比和速率
+
+    Args:
+        downloaded: 已下载字节数
+        total: 文件总字节数，未知时为 None
+        bytes_per_sec: 当前平均速率（字节/秒）
+    """
+    speed = f"{bytes_per_sec / 1024 / 1024:.2f} MB/s"
+    if total:
+        print(f"  下载进度: {downloaded}/{total} 字节 ({downloaded * 100 / total:.1f}%), {speed}")
+    else:
+        print(f"  下载进度: {downloaded} 字节, {speed}")
+
+
+def _parse_content_range(content_range):
+    """
+    解析 Content-Range 响应头，例如 "bytes 100-199/1000"
+
+    Returns:
+        (start, total)，解析失败返回 (None, None)；总长度未知（*）时 total 为 None
+    """
+    try:
+        unit, range_spec = content_range.split(' ', 1)
+        if unit.strip().lower() != 'bytes':
+            return None, None
+        span, total = range_spec.split('/', 1)
+        start = int(span.split('-', 1)[0])
+        return start, (None if total.strip() == '*' else int(total))
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def _load_part_source(source_path):
+    """
+    读取 .part 文件的来源记录（下载地址和 ETag）
+
+    Returns:
+        dict: {"url", "etag"}，不存在或无法读取时返回 None
+    """
+    try:
+        with open(source_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_part_source(source_path, url, etag):
+    """记录 .part 文件的来源，下次续传前确认仍是同一个文件"""
+    with open(source_path, 'w', encoding='utf-8') as file:
+        json.dump({"url": url, "etag": etag}, file)
+
+
+def _discard_part(part_path, source_path):
+    """删除 .part 文件及其来源记录"""
+    for path in (part_path, source_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _verify_download(file_path, total, expected_sha256):
+    """
+    校验下载文件：长度、sha256（如提供）；zip 文件额外校验各成员的 CRC
+
+    Returns:
+        校验通过返回 True，否则返回 False
+    """
+    file_size = os.path.getsize(file_path)
+    if total is not None and file_size != total:
+        print(f"下载文件长度不一致: {file_size} != {total}")
+        return False
+
+    if expected_sha256:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        if digest.hexdigest().lower() != expected_sha256.lower():
+            print(f"下载文件 sha256 校验失败: {digest.hexdigest()}")
+            return False
+
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as zip_file:
+            bad_member = zip_file.testzip()
+        if bad_member is not None:
+            print(f"下载文件 CRC 校验失败: {bad_member}")
+            return False
+
+    return True
+
+
+def download_model(publish_url, output_dir=None, expected_sha256=None, progress_callback=print_download_progress,
+                   max_retries=DOWNLOAD_MAX_RETRIES, chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=DOWNLOAD_TIMEOUT):
+    """
+    下载模型文件（分块流式写盘，断线后使用 HTTP Range 断点续传）
+
+    下载过程中数据写入 {文件名}.part，校验通过后再重命名为最终文件；
+    上次中断遗留的 .part 文件会在下次下载时继续续传。下载地址和 ETag 记录在 {文件名}.part.src 中，
+    与本次下载地址不一致（或服务器文件的 ETag 已变化）时丢弃 .part 从头下载。
 
     Args:
         publish_url: 下载URL
         output_dir: 输出目录，如果为None则保存到当前目录
+        expected_sha256: 期望的 sha256（可选），提供时校验下载结果
+        progress_callback: 进度回调 callback(downloaded, total, bytes_per_sec)，为 None 时不报告进度
+        max_retries: 网络中断后的最大续传次数
+        chunk_size: 每次写盘的块大小（字节）
+        timeout: requests 超时 (连接超时, 读取超时)，单位秒
 
     Returns:
         下载的文件路径，失败返回None
@@ -173,27 +311,115 @@ def download_model(publish_url, output_dir=None):
         output_path = os.path.join(output_dir, file_name)
     else:
         output_path = file_name
+    part_path = output_path + '.part'
+    source_path = part_path + '.src'
 
     print(f"文件名 = {file_name}")
     print(f"输出路径 = {output_path}")
 
-    try:
-        # 发送 GET 请求下载文件
-        response = requests.get(publish_url, allow_redirects=True)
-
-        # 检查响应状态
-        if response.status_code == 200:
-            with open(output_path, 'wb') as file:
-                file.write(response.content)
-            print(f"文件 {file_name} 下载成功")
-            return output_path
-        else:
-            print(f"下载文件失败。状态码: {response.status_code}")
+    # 遗留的 .part 只在来自同一下载地址时续传
+    source = _load_part_source(source_path) if os.path.exists(part_path) else None
+    if os.path.exists(part_path) and (source is None or source.get("url") != publish_url):
+        print("遗留的 .part 文件来自其他下载地址，重新下载")
+        _discard_part(part_path, source_path)
+    etag = source.get("etag") if source else None
+
+    downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    total = None
+    attempt = 0
+    start_time = time.monotonic()
+    start_bytes = downloaded
+    last_report = 0.0
+
+    while True:
+        headers = {'Range': f'bytes={downloaded}-'} if downloaded > 0 else {}
+        if downloaded > 0 and etag:
+            # 服务器文件已变化时返回完整文件（200）而不是续传片段
+            headers['If-Range'] = etag
+        try:
+            with requests.get(publish_url, headers=headers, stream=True,
+                              allow_redirects=True, timeout=timeout) as response:
+                if response.status_code == 416 and downloaded > 0:
+                    # 请求范围超出文件长度：.part 已完整或与服务器文件不一致，重新下载
+                    print("续传范围无效，重新下载")
+                    downloaded = 0
+                    _discard_part(part_path, source_path)
+                    continue
+
+                if response.status_code == 206:
+                    range_start, total = _parse_content_range(response.headers.get('Content-Range'))
+                    if range_start != downloaded:
+                        print("服务器返回的续传位置不一致，重新下载")
+                        downloaded = 0
+                        _discard_part(part_path, source_path)
+                        continue
+                    if etag and response.headers.get('ETag') not in (None, etag):
+                        print("服务器文件已变化（ETag 不一致），重新下载")
+                        downloaded = 0
+                        etag = None
+                        _discard_part(part_path, source_path)
+                        continue
+                    mode = 'ab'
+                elif response.status_code == 200:
+                    if downloaded > 0:
+                        print("服务器不支持断点续传，从头下载")
+                    downloaded = 0
+                    content_length = response.headers.get('Content-Length')
+                    total = int(content_length) if content_length else None
+                    mode = 'wb'
+                    etag = response.headers.get('ETag')
+                    _save_part_source(source_path, publish_url, etag)
+                else:
+                    print(f"下载文件失败。状态码: {response.status_code}")
+                    if response.status_code < 500:
+                        return None
+                    raise requests.exceptions.RetryError(f"HTTP {response.status_code}")
+
+                if downloaded > 0:
+                    print(f"从 {downloaded} 字节处继续下载")
+                start_time = time.monotonic()
+                start_bytes = downloaded
+
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        file.write(chunk)
+                        downloaded += len(chunk)
+                        now = time.monotonic()
+                        if progress_callback and (now - last_report >= 1.0 or downloaded == total):
+                            last_report = now
+                            elapsed = max(now - start_time, 1e-6)
+                            progress_callback(downloaded, total, (downloaded - start_bytes) / elapsed)
+
+            if total is None or downloaded >= total:
+                break
+            raise requests.exceptions.ChunkedEncodingError(f"连接提前关闭: {downloaded}/{total}")
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.RetryError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                print(f"下载文件时发生错误，已重试 {max_retries} 次: {e}")
+                return None
+            delay = min(2 ** attempt, 30)
+            print(f"下载中断: {e}，{delay} 秒后续传（第 {attempt}/{max_retries} 次）")
+            time.sleep(delay)
+        except Exception as e:
+            print(f"下载文件时发生错误: {e}")
             return None
-    except Exception as e:
-        print(f"下载文件时发生错误: {e}")
+
+    if not _verify_download(part_path, total, expected_sha256):
+        _discard_part(part_path, source_path)
         return None
 
+    os.replace(part_path, output_path)
+    if os.path.exists(source_path):
+        os.remove(source_path)
+    elapsed = max(time.monotonic() - start_time, 1e-6)
+    print(f"文件 {file_name} 下载成功 ({downloaded} 字节, {(downloaded - start_bytes) / elapsed / 1024 / 1024:.2f} MB/s)")
+    return output_path
+
 # 模型转换主函数
 def model_convert(device_id, model_path, output_dir=None):
     """
@@ -214,20 +440,25 @@ Args:
     if not access_token:
         return None
 
+    # 使用令牌的请求失败时丢弃缓存的令牌，避免后续设备一直使用失效的令牌
     file_id = upload_file(access_token, model_path)
     if not file_id:
+        invalidate_access_token()
         return None
 
     if not import_model(access_token, model_id, file_id):
+        invalidate_access_token()
         return None
 
     transaction_id = publish_model(access_token, device_id, model_id)
     if not transaction_id:
+        invalidate_access_token()
         return None
 
     publish_url = get_publish_status(access_token, transaction_id)
-    if publish_url:
-        return download_model(publish_url, output_dir)
-    return None
+    if not publish_url:
+        invalidate_access_token()
+        return None
+    return download_model(publish_url, output_dir)
 
 
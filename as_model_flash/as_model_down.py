@@ -23,7 +23,7 @@ from as_nvs_flash import (
 )
 
 # 导入 as_model_conversion/as_model_auth 模块
-from as_model_conversion import generate_model_by_device_id
+from as_model_conversion import generate_model_by_device_id, generate_model_files_by_device_id
 
 
 #------------------  配置区  ------------------
@@ -109,22 +109,40 @@ def read_device_id_from_nvs(port, bin_type):
 
 #------------------  步骤2: 调用 as_model_auth.py 生成模型  ------------------
 
-def generate_model_files(device_id, model_type):
+def generate_model_files(device_id, model_type, in_memory=False):
     """
     调用 as_model_conversion/as_model_auth.py 生成 AI 模型文件
 
     参数:
         device_id: 设备 ID
         model_type: 模型类型（如 "ped_alarm"）
+        in_memory: 为 True 时直接从转换结果 ZIP 读取烧录文件到内存，不生成 spiffs_dl 目录
 
     返回:
-        生成的 spiffs_dl 目录路径，失败返回 None
+        生成的 spiffs_dl 目录路径（in_memory=True 时为 {文件名: bytes}），失败返回 None
     """
     print("\n" + "=" * 60)
     print("步骤 2: 生成 AI 模型文件")
     print("-" * 60)
 
     try:
+        if in_memory:
+            print(f"\n调用 generate_model_files_by_device_id(device_id={device_id}, model_type={model_type})...")
+
+            model_files = generate_model_files_by_device_id(
+                device_id=device_id,
+                model_type=model_type
+            )
+
+            if not model_files:
+                print("\n错误: 模型生成失败")
+                return None
+
+            print(f"\n✓ 模型生成成功!")
+            print(f"烧录文件: {', '.join(sorted(model_files))}")
+
+            return model_files
+
         # 调用 as_model_auth.py 的 generate_model_by_device_id 函数
         print(f"\n调用 generate_model_by_device_id(device_id={device_id}, model_type={model_type})...")
 
@@ -151,7 +169,7 @@ def generate_model_files(device_id, model_type):
 
 #------------------  主函数  ------------------
 
-def main(port, model_type, bin_type):
+def main(port, model_type, bin_type, in_memory=False):
     """
     主函数 - 读取 device_id 并生成模型
 
@@ -159,9 +177,10 @@ def main(port, model_type, bin_type):
         port: 串口号
         model_type: 模型类型名
         bin_type: 固件类型（用于获取分区信息）
+        in_memory: 为 True 时返回内存中的烧录文件，不生成 spiffs_dl 目录
 
     返回:
-        生成的 spiffs_dl 目录路径，失败返回 None
+        生成的 spiffs_dl 目录路径（in_memory=True 时为 {文件名: bytes}），失败返回 None
     """
     try:
         # 初始化临时目录
@@ -174,7 +193,7 @@ def main(port, model_type, bin_type):
             return None
 
         # 步骤2: 生成模型文件
-        spiffs_dl_dir = generate_model_files(device_id, model_type)
+        spiffs_dl_dir = generate_model_files(device_id, model_type, in_memory=in_memory)
         if not spiffs_dl_dir:
             print("\n✗ 生成模型文件失败")
             return None
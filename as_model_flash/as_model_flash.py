@@ -1,25 +1,50 @@
 #!/usr/bin/env python3
 """
 模型烧录模块
-功能：使用 spiffs_dl 目录创建 storage_dl.bin 并烧录到设备
+功能：使用 spiffs_dl 目录（或内存中的烧录文件）创建 storage_dl.bin 并烧录到设备
+
+镜像生成：
+    通过 esp_components.fatfs_tools.build_fatfs_image 在进程内生成 FAT 镜像，
+    不再复制 storage_dl_content 目录，也不再启动 wl_fatfsgen.py 子进程
+镜像模板：
+    同一 (bin_type, 分区大小, .fpk 名称和大小, 其余固定文件内容) 的镜像布局完全相同，
+    首次生成时缓存模板镜像和 .fpk 数据在镜像中的偏移，之后每台设备只需复制模板并写入 .fpk 内容
+稀疏烧录：
+    镜像中只有引导扇区、FAT 表、根目录、已分配簇和 WL 状态/配置扇区有内容，其余均为 0xFF（与擦除后的 Flash 相同），
+    按生成器给出的分配表只烧录这些区段，其余区域擦除，串口传输量从整个分区降到约等于模型大小
+内存组装：
+    传入 {文件名: bytes}（as_model_conversion.generate_model_files_by_device_id 的返回值）时，
+    镜像生成后只写一次 storage_dl.bin
+可复现镜像：
+    生成镜像时使用固定时间戳、固定卷 ID 和 WL 设备 ID，相同烧录文件生成的镜像逐字节相同，
+    镜像摘要（sha256）可用于缓存、去重和比对设备上的内容
+烧录前校验：
+    使用 FATFSReader 读回生成的镜像（去除 WL 层、遍历 FAT 链），逐个比对 dnn/ 下文件的 sha256，
+    不一致时不烧录
 """
 
 import os
 import sys
-import subprocess
-import shutil
+import glob
+import hashlib
 from pathlib import Path
 
 # 导入 ESP 组件工具
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from esp_components import (
-    get_esp_idf_python,
-    get_fatfs_gen_tool,
     get_esptool,
     get_baud_rate,
     run_command,
 )
 
+# 导入进程内 FAT 镜像生成接口
+from esp_components.fatfs_tools import (
+    build_fatfs_image_and_map,
+    build_fatfs_template,
+    image_digest,
+    verify_fatfs_image,
+)
+
 # 导入分区工具
 from as_flash_firmware import get_storage_dl_info
 
@@ -30,11 +55,27 @@ from as_flash_firmware import get_storage_dl_info
 TEMP_DIR = "temp"
 
 # 使用 esp_components 提供的工具路径
-ESP_IDF_PYTHON = get_esp_idf_python()
-FATFS_GEN_TOOL = get_fatfs_gen_tool()
 ESPTOOL = get_esptool()
 BAUD_RATE = get_baud_rate()
 
+# storage_dl 镜像模板缓存的最大条目数（每个条目约为一个分区大小）
+TEMPLATE_CACHE_MAX_ENTRIES = 4
+
+# storage_dl 镜像模板缓存：{模板键: (模板镜像, .fpk 数据在镜像中的偏移, 分配表)}
+_storage_dl_templates = {}
+
+# 稀疏烧录：只烧录分配表中有内容的区段（False 时烧录整个镜像）
+SPARSE_FLASH = True
+
+# 稀疏烧录时先擦除整个 storage_dl 分区，保证未烧录区域与完整镜像一致（均为 0xFF）
+ERASE_UNUSED_REGIONS = True
+
+# 生成可复现镜像（固定时间戳和卷 ID/WL 设备 ID），相同内容的镜像摘要相同
+DETERMINISTIC_IMAGE = True
+
+# 烧录前读回镜像并校验文件内容
+VERIFY_STORAGE_DL_IMAGE = True
+
 
 #------------------  初始化  ------------------
 
@@ -47,6 +88,169 @@ def init_temp_dir():
 
 #------------------  步骤3: 创建 storage_dl.bin  ------------------
 
+def _find_fpk_name(model_files):
+    """返回烧录文件中的 .fpk 文件名，没有时返回 None"""
+    return next((name for name in sorted(model_files) if name.endswith('.fpk')), None)
+
+
+def _template_key(bin_type, storage_dl_size, model_files, fpk_name):
+    """
+    构建 storage_dl 镜像模板键
+
+    除 .fpk 以外的文件（network_info.txt 等，同一模型类型内容固定）按内容参与计算，
+    .fpk 只有名称和大小参与计算
+    """
+    fixed_digest = hashlib.sha256()
+    for name in sorted(model_files):
+        if name == fpk_name:
+            continue
+        fixed_digest.update(name.encode('utf-8') + b'\0')
+        fixed_digest.update(hashlib.sha256(model_files[name]).digest())
+    return (bin_type, storage_dl_size, fpk_name, len(model_files[fpk_name]), fixed_digest.hexdigest())
+
+
+def _get_storage_dl_template(key, model_files, fpk_name, storage_dl_size):
+    """
+    获取 storage_dl 镜像模板，未命中时生成并缓存
+
+    模板使用与 .fpk 等长的占位内容生成，FAT 表、目录项、WL 扇区和固定文件数据都已就位
+
+    返回:
+        (模板镜像, .fpk 数据在镜像中的偏移, 分配表)
+    """
+    template = _storage_dl_templates.get(key)
+    if template is not None:
+        print("✓ 命中 storage_dl 镜像模板")
+        return template
+
+    print("生成 storage_dl 镜像模板...")
+    placeholder_files = dict(model_files)
+    placeholder_files[fpk_name] = bytes(len(model_files[fpk_name]))
+    image, fpk_offset, extents = build_fatfs_template({"dnn": placeholder_files},
+                                             ["dnn", fpk_name],
+                                             size=int(storage_dl_size, 0),
+                                             long_names_enabled=True,
+                                             deterministic=DETERMINISTIC_IMAGE)
+
+    # 超出上限时淘汰最早生成的模板
+    while len(_storage_dl_templates) >= TEMPLATE_CACHE_MAX_ENTRIES:
+        _storage_dl_templates.pop(next(iter(_storage_dl_templates)))
+
+    template = (bytes(image), fpk_offset, extents)
+    _storage_dl_templates[key] = template
+    print(f"✓ storage_dl 镜像模板已缓存 (.fpk 偏移: 0x{fpk_offset:X})")
+    return template
+
+
+def build_storage_dl_image(model_files, bin_type, use_template=True):
+    """
+    在进程内生成 storage_dl 分区镜像（磨损均衡 FAT 文件系统），不写磁盘
+
+    镜像结构: dnn/文件，启用长文件名（LFN），与 wl_fatfsgen.py --long_name_support 的结果一致
+
+    参数:
+        model_files: {文件名: bytes 或二进制文件对象}（包含 network.fpk 和 network_info.txt）
+        bin_type: 固件类型（用于获取分区信息）
+        use_template: 是否使用镜像模板（仅在文件内容均为 bytes 时生效）
+
+    返回:
+        (镜像内容, 分配表 [(偏移, 长度), ...])，失败返回 (None, None)
+    """
+    # 获取 storage_dl 分区信息
+    storage_dl_info = get_storage_dl_info(bin_type)
+    if not storage_dl_info:
+        raise RuntimeError(f"Failed to get storage_dl partition info for bin_type: {bin_type}")
+
+    storage_dl_size = storage_dl_info["size"]
+    print(f"\nstorage_dl partition size (from {bin_type}): {storage_dl_size}")
+
+    if not model_files:
+        print("\n错误: 没有需要写入的烧录文件")
+        return None, None
+
+    for name in sorted(model_files):
+        print(f"  写入: {name} -> dnn/{name}")
+
+    # 使用镜像模板：复制模板后写入本设备的 .fpk 内容
+    fpk_name = _find_fpk_name(model_files)
+    all_bytes = all(isinstance(content, (bytes, bytearray)) for content in model_files.values())
+    if use_template and fpk_name and all_bytes and model_files[fpk_name]:
+        key = _template_key(bin_type, storage_dl_size, model_files, fpk_name)
+        template, fpk_offset, extents = _get_storage_dl_template(key, model_files, fpk_name, storage_dl_size)
+        fpk = model_files[fpk_name]
+        image = bytearray(template)
+        image[fpk_offset:fpk_offset + len(fpk)] = fpk
+        return image, extents
+
+    # 注意：启用长文件名支持（LFN），支持 network_info.txt 等超过 8.3 格式的文件名
+    return build_fatfs_image_and_map({"dnn": model_files},
+                                     size=int(storage_dl_size, 0),
+                                     long_names_enabled=True,
+                                     deterministic=DETERMINISTIC_IMAGE)
+
+
+def verify_storage_dl_image(image, model_files):
+    """
+    读回 storage_dl 镜像，校验 dnn/ 下的文件与烧录文件一致
+
+    参数:
+        image: 镜像内容
+        model_files: {文件名: bytes}
+
+    返回:
+        一致返回 True，否则返回 False
+    """
+    problems = verify_fatfs_image(image, {"dnn": model_files}, wl_support=True)
+    if problems:
+        print("\n错误: storage_dl 镜像校验失败")
+        for problem in problems:
+            print(f"  {problem}")
+        return False
+
+    print(f"✓ storage_dl 镜像校验通过 ({len(model_files)} 个文件)")
+    if DETERMINISTIC_IMAGE:
+        print(f"  镜像 SHA256: {image_digest(image)}")
+    return True
+
+
+def write_storage_dl_bin(image, extents=None):
+    """
+    将镜像写入 temp 目录（供 esptool write_flash 使用）
+
+    参数:
+        image: 镜像内容
+        extents: 分配表 [(偏移, 长度), ...]；为 None 或关闭稀疏烧录时写入完整的 storage_dl.bin
+
+    返回:
+        烧录段列表 [(分区内偏移, 文件路径), ...]
+    """
+    # 清理上一次的稀疏烧录段文件
+    for old_segment in glob.glob(os.path.join(TEMP_DIR, "storage_dl_0x*.bin")):
+        os.remove(old_segment)
+
+    if not SPARSE_FLASH or extents is None:
+        storage_dl_bin = os.path.join(TEMP_DIR, "storage_dl.bin")
+        with open(storage_dl_bin, 'wb') as f:
+            f.write(image)
+
+        print(f"✓ storage_dl.bin 已生成: {storage_dl_bin}")
+        print(f"  文件大小: {len(image)} 字节 ({len(image) / 1024 / 1024:.2f} MB)")
+        return [(0, storage_dl_bin)]
+
+    segments = []
+    image_view = memoryview(image)
+    for offset, size in extents:
+        segment_bin = os.path.join(TEMP_DIR, f"storage_dl_0x{offset:06X}.bin")
+        with open(segment_bin, 'wb') as f:
+            f.write(image_view[offset:offset + size])
+        segments.append((offset, segment_bin))
+
+    total = sum(size for _, size in extents)
+    print(f"✓ storage_dl 稀疏烧录段已生成: {len(segments)} 段")
+    print(f"  烧录数据: {total} 字节 ({total / 1024 / 1024:.2f} MB)，镜像大小: {len(image)} 字节")
+    return segments
+
+
 def create_storage_dl_bin(spiffs_dl_dir, bin_type):
     """
     使用 spiffs_dl 目录创建 storage_dl.bin 文件（FAT 文件系统镜像）
@@ -56,20 +260,13 @@ def create_storage_dl_bin(spiffs_dl_dir, bin_type):
         bin_type: 固件类型（用于获取分区信息）
 
     返回:
-        生成的 storage_dl.bin 文件路径，失败返回 None
+        烧录段列表 [(分区内偏移, 文件路径), ...]，失败返回 None
     """
     print("\n" + "=" * 60)
     print("步骤 3: 创建 storage_dl.bin")
     print("-" * 60)
 
     try:
-        # 获取 storage_dl 分区信息
-        storage_dl_info = get_storage_dl_info(bin_type)
-        if not storage_dl_info:
-            raise RuntimeError(f"Failed to get storage_dl partition info for bin_type: {bin_type}")
-
-        storage_dl_size = storage_dl_info["size"]
-        print(f"\nstorage_dl partition size (from {bin_type}): {storage_dl_size}")
         # 验证 spiffs_dl 目录存在
         if not os.path.exists(spiffs_dl_dir):
             print(f"\n错误: spiffs_dl 目录未找到: {spiffs_dl_dir}")
@@ -77,70 +274,56 @@ def create_storage_dl_bin(spiffs_dl_dir, bin_type):
 
         print(f"\nspiffs_dl 目录: {spiffs_dl_dir}")
 
-        # 创建 FAT 文件系统目录结构
-        # 目标结构: storage_dl_content/dnn/文件
-        storage_dir = os.path.join(TEMP_DIR, "storage_dl_content")
-        if os.path.exists(storage_dir):
-            shutil.rmtree(storage_dir)
-        os.makedirs(storage_dir, exist_ok=True)
-
-        # 创建 dnn 子目录
-        dnn_dir = os.path.join(storage_dir, "dnn")
-        os.makedirs(dnn_dir, exist_ok=True)
-
-        # 复制 spiffs_dl 目录下的所有文件到 dnn 目录
-        copied_count = 0
+        # 读取 spiffs_dl 目录下的所有文件
+        model_files = {}
         for item in Path(spiffs_dl_dir).iterdir():
             if item.is_file():
-                dest_path = os.path.join(dnn_dir, item.name)
-                shutil.copy2(item, dest_path)
-                print(f"  已复制: {item.name} -> dnn/{item.name}")
-                copied_count += 1
+                model_files[item.name] = item.read_bytes()
 
-        if copied_count == 0:
+        if not model_files:
             print("\n错误: spiffs_dl 目录中没有文件")
             return None
 
-        print(f"\n✓ 共 {copied_count} 个文件复制到 {storage_dir}")
+        image, extents = build_storage_dl_image(model_files, bin_type)
+        if image is None:
+            return None
 
-        # 生成 storage_dl.bin 文件
-        storage_dl_bin = os.path.join(TEMP_DIR, "storage_dl.bin")
+        if VERIFY_STORAGE_DL_IMAGE and not verify_storage_dl_image(image, model_files):
+            return None
 
-        # 检查 FATFS 生成工具是否存在
-        if not os.path.exists(FATFS_GEN_TOOL):
-            print(f"\n错误: FATFS 生成工具未找到: {FATFS_GEN_TOOL}")
-            raise RuntimeError("FATFS 生成工具未找到")
-
-        # 使用 wl_fatfsgen.py 生成 FAT 镜像
-        # 注意：使用 --long_name_support 启用长文件名支持（LFN）
-        # 这样可以支持 network_info.txt 等超过 8.3 格式的文件名
-        cmd = [
-            ESP_IDF_PYTHON,
-            FATFS_GEN_TOOL,
-            storage_dir,  # 输入目录
-            "--output_file", storage_dl_bin,  # 输出文件
-            "--partition_size", storage_dl_size,  # 分区大小（从分区表获取）
-            "--long_name_support",  # 启用长文件名支持
-        ]
-
-        result = run_command(cmd)
+        return write_storage_dl_bin(image, extents)
 
-        if result.returncode != 0:
-            print("\n错误: 生成 storage_dl.bin 失败")
-            print(f"STDOUT: {result.stdout}")
-            print(f"STDERR: {result.stderr}")
-            raise RuntimeError("生成 storage_dl.bin 失败")
+    except Exception as e:
+        print(f"\n错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
 
-        print(f"✓ storage_dl.bin 已生成: {storage_dl_bin}")
 
-        # 验证文件
-        if os.path.exists(storage_dl_bin):
-            file_size = os.path.getsize(storage_dl_bin)
-            print(f"  文件大小: {file_size} 字节 ({file_size / 1024 / 1024:.2f} MB)")
-        else:
-            raise RuntimeError("storage_dl.bin 文件未生成")
+def create_storage_dl_bin_from_files(model_files, bin_type):
+    """
+    使用内存中的烧录文件直接创建 storage_dl.bin 文件（FAT 文件系统镜像）
 
-        return storage_dl_bin
+    参数:
+        model_files: {文件名: 文件内容}（包含 network.fpk 和 network_info.txt）
+        bin_type: 固件类型（用于获取分区信息）
+
+    返回:
+        烧录段列表 [(分区内偏移, 文件路径), ...]，失败返回 None
+    """
+    print("\n" + "=" * 60)
+    print("步骤 3: 创建 storage_dl.bin（内存组装）")
+    print("-" * 60)
+
+    try:
+        image, extents = build_storage_dl_image(model_files, bin_type)
+        if image is None:
+            return None
+
+        if VERIFY_STORAGE_DL_IMAGE and not verify_storage_dl_image(image, model_files):
+            return None
+
+        return write_storage_dl_bin(image, extents)
 
     except Exception as e:
         print(f"\n错误: {e}")
@@ -157,7 +340,7 @@ def flash_storage_dl_bin(port, storage_dl_bin, bin_type):
 
     参数:
         port: 串口号
-        storage_dl_bin: storage_dl.bin 文件路径
+        storage_dl_bin: storage_dl.bin 文件路径，或烧录段列表 [(分区内偏移, 文件路径), ...]
         bin_type: 固件类型（用于获取分区信息）
 
     返回:
@@ -176,8 +359,28 @@ def flash_storage_dl_bin(port, storage_dl_bin, bin_type):
         storage_dl_offset = storage_dl_info["offset"]
         print(f"\nstorage_dl partition offset (from {bin_type}): {storage_dl_offset}")
 
-        cmd = [*ESPTOOL, "--port", port, "--baud", BAUD_RATE, "write_flash", storage_dl_offset, storage_dl_bin]
+        segments = [(0, storage_dl_bin)] if isinstance(storage_dl_bin, str) else storage_dl_bin
+        partition_offset = int(storage_dl_offset, 0)
+        is_sparse = sum(os.path.getsize(path) for _, path in segments) < int(storage_dl_info["size"], 0)
+
+        # 稀疏烧录：先擦除整个分区，未烧录的区域与完整镜像一样为 0xFF
+        if is_sparse and ERASE_UNUSED_REGIONS:
+            print(f"擦除 storage_dl 分区: {storage_dl_offset} (大小 {storage_dl_info['size']})")
+            cmd = [*ESPTOOL, "--port", port, "--baud", BAUD_RATE,
+                   "erase_region", storage_dl_offset, storage_dl_info["size"]]
+            result = run_command(cmd, print_cmd=False, realtime_output=True)
+            if result.returncode != 0:
+                print("\n错误: 擦除 storage_dl 分区失败")
+                return False
+
+        addr_files = []
+        for offset, segment_bin in segments:
+            addr_files += [f"0x{partition_offset + offset:X}", segment_bin]
+
+        cmd = [*ESPTOOL, "--port", port, "--baud", BAUD_RATE, "write_flash", *addr_files]
         print(f"使用波特率: {BAUD_RATE}")
+        if is_sparse:
+            print(f"稀疏烧录: {len(segments)} 段")
         print("正在烧录... (可能需要一段时间)\n")
 
         # 不捕获输出，让 esptool 的进度信息实时显示
@@ -205,7 +408,7 @@ def main(port, spiffs_dl_dir, bin_type):
 
     参数:
         port: 串口号
-        spiffs_dl_dir: spiffs_dl 目录路径
+        spiffs_dl_dir: spiffs_dl 目录路径，或内存中的烧录文件 {文件名: bytes}
         bin_type: 固件类型（用于获取分区信息）
 
     返回:
@@ -216,7 +419,10 @@ def main(port, spiffs_dl_dir, bin_type):
         init_temp_dir()
 
         # 步骤3: 创建 storage_dl.bin
-        storage_dl_bin = create_storage_dl_bin(spiffs_dl_dir, bin_type)
+        if isinstance(spiffs_dl_dir, dict):
+            storage_dl_bin = create_storage_dl_bin_from_files(spiffs_dl_dir, bin_type)
+        else:
+            storage_dl_bin = create_storage_dl_bin(spiffs_dl_dir, bin_type)
         if not storage_dl_bin:
             print("\n✗ 创建 storage_dl.bin 失败")
             return False
@@ -15,15 +15,41 @@ MS500 设备配置读取模块
 - c_sn: 相机序列号 (例如: "CA500-MIPI-zlxc-0059")
 - u_sn: 单元序列号 (例如: "MS500-H120-EP-zlcu-0059")
 - u_url: 设备 URL (可选，默认: "127.0.0.1")
+- SN_POOL: 是否从序列号池领取 c_sn/u_sn (可选，默认: false；为 true 时忽略 c_sn/u_sn)
+
+注册策略（均为可选参数，无人值守时不需要操作员输入）:
+- ON_REGISTERED: 设备已注册（g_camera_id 有效）时的处理 (默认: "skip")
+    skip: 跳过注册，保留设备现有参数，视为成功
+    reregister: 重新注册并烧录 NVS
+    fail: 视为失败
+    ask: 询问操作员（仅在交互终端中可用，否则视为失败）
+- ON_INVALID_CAMERA_ID: 设备已有 NVS 数据但 g_camera_id 无效时的处理 (默认: "skip")
+    skip: 跳过注册，视为成功，继续烧录固件和模型（与未配置策略时的原有行为一致）
+    fail: 视为失败（需要先启动设备生成 camera_id）
+    register: 不带 g_camera_id 注册
+
+DM 服务器网络策略（均为可选参数）:
+- dm_connect_timeout: 连接超时，秒 (默认: 5)
+- dm_read_timeout: 读取超时，秒 (默认: 30)
+- dm_get_retries: GET 请求重试次数 (默认: 3)
+- dm_breaker_threshold: 熔断器连续失败阈值 (默认: 5)
+- dm_breaker_cooldown: 熔断持续时间，秒 (默认: 30)
 """
 
 import os
 import json
 
 
+#------------------  注册策略取值  ------------------
+
+REGISTERED_ACTIONS = ('skip', 'reregister', 'fail', 'ask')
+INVALID_CAMERA_ID_ACTIONS = ('skip', 'fail', 'register')
+
+
 #------------------  全局配置缓存  ------------------
 
 _config_cache = None
+_config_mtime = None
 
 
 #------------------  配置文件路径  ------------------
@@ -40,7 +66,7 @@ def load_config(force_reload=False):
     从 as_ms500_config.json 读取配置参数
 
     参数:
-        force_reload: 是否强制重新加载配置（默认 False，使用缓存）
+        force_reload: 是否强制重新加载配置（默认 False，使用缓存；配置文件修改后自动重新加载）
 
     返回:
         dict: 配置字典
@@ -48,23 +74,25 @@ def load_config(force_reload=False):
     异常:
         RuntimeError: 配置文件不存在或读取失败
     """
-    global _config_cache
-
-    # 如果有缓存且不强制重载，直接返回缓存
-    if _config_cache is not None and not force_reload:
-        return _config_cache
+    global _config_cache, _config_mtime
 
     config_path = get_config_path()
 
     if not os.path.exists(config_path):
         raise RuntimeError(f"Configuration file does not exist: {config_path}")
 
+    # 如果有缓存、文件未修改且不强制重载，直接返回缓存
+    mtime = os.path.getmtime(config_path)
+    if _config_cache is not None and not force_reload and mtime == _config_mtime:
+        return _config_cache
+
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
 
         # 缓存配置
         _config_cache = config
+        _config_mtime = mtime
         return config
 
     except json.JSONDecodeError as e:
@@ -126,6 +154,60 @@ def get_u_url():
     return config.get('u_url', '127.0.0.1')
 
 
+def get_sn_pool_enabled():
+    """是否从序列号池（as_dm_register.as_sn_pool）领取 c_sn/u_sn（可选参数）"""
+    config = load_config()
+    return bool(config.get('SN_POOL', False))
+
+
+def get_registration_policy():
+    """
+    获取注册策略（设备已注册、g_camera_id 无效时的处理方式）
+
+    返回:
+        dict: {'on_registered': ..., 'on_invalid_camera_id': ...}
+
+    异常:
+        RuntimeError: 配置值不在可选范围内
+    """
+    config = load_config()
+    policy = {
+        'on_registered': str(config.get('ON_REGISTERED', 'skip')).strip().lower(),
+        'on_invalid_camera_id': str(config.get('ON_INVALID_CAMERA_ID', 'skip')).strip().lower(),
+    }
+    if policy['on_registered'] not in REGISTERED_ACTIONS:
+        raise RuntimeError(f"Invalid configuration parameter: ON_REGISTERED (expected one of {', '.join(REGISTERED_ACTIONS)})")
+    if policy['on_invalid_camera_id'] not in INVALID_CAMERA_ID_ACTIONS:
+        raise RuntimeError(f"Invalid configuration parameter: ON_INVALID_CAMERA_ID (expected one of {', '.join(INVALID_CAMERA_ID_ACTIONS)})")
+    return policy
+
+
+def get_dm_network_policy():
+    """
+    获取 DM 服务器网络策略（只包含配置文件中设置了的参数）
+
+    返回:
+        dict: {connect_timeout, read_timeout, get_retries, breaker_threshold, breaker_cooldown} 的子集，
+              可直接传给 as_dm_register.as_dm_api.apply_network_policy
+    """
+    config = load_config()
+    keys = {
+        'dm_connect_timeout': ('connect_timeout', float),
+        'dm_read_timeout': ('read_timeout', float),
+        'dm_get_retries': ('get_retries', int),
+        'dm_breaker_threshold': ('breaker_threshold', int),
+        'dm_breaker_cooldown': ('breaker_cooldown', float),
+    }
+    policy = {}
+    for config_key, (policy_key, convert) in keys.items():
+        if config.get(config_key) is not None:
+            try:
+                policy[policy_key] = convert(config[config_key])
+            except (TypeError, ValueError):
+                raise RuntimeError(f"Invalid configuration parameter: {config_key}")
+    return policy
+
+
 #------------------  获取所有配置参数  ------------------
 
 def get_all_config():
@@ -154,6 +236,9 @@ def print_config():
     print(f"c_sn:        {config.get('c_sn', '')}")
     print(f"u_sn:        {config.get('u_sn', '')}")
     print(f"u_url:       {config.get('u_url', '127.0.0.1')}")
+    print(f"SN_POOL:     {config.get('SN_POOL', False)}")
+    print(f"ON_REGISTERED:        {config.get('ON_REGISTERED', 'skip')}")
+    print(f"ON_INVALID_CAMERA_ID: {config.get('ON_INVALID_CAMERA_ID', 'skip')}")
     print("-" * 60)
 
 
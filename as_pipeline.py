@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+MS500 单台设备生产流水线调度
+
+功能说明:
+把 参数注册 → 固件烧录 → 模型烧录 拆成按数据依赖连接的步骤（DAG），
+没有依赖关系的步骤并发执行：服务器注册、AITRIOS 模型转换（网络）与固件烧录（串口）同时进行
+
+步骤和依赖:
+    read_device  (串口)  读取 MAC 和 NVS（g_camera_id）
+    register     (网络)  向 DM 服务器注册设备          ← read_device
+    convert      (网络)  按 g_camera_id 生成模型文件    ← read_device
+    firmware     (串口)  烧录固件                      ← read_device
+    nvs_commit   (串口)  生成并烧录注册参数 NVS          ← register, firmware
+    model_flag   (串口)  重新读取 NVS，写入 is_model_update=1 ← nvs_commit
+    storage_dl   (串口)  创建并烧录 storage_dl.bin      ← convert, model_flag
+
+同一串口同一时间只执行一个步骤（串口资源锁），就绪的串口步骤按上表顺序执行
+运行结束后打印每个步骤的耗时和关键路径（决定总耗时的步骤链，包括等待串口的步骤）
+
+断点续做:
+    每个步骤完成后记录到设备的生产日志（as_journal.py，按 MAC 保存），
+    再次运行时跳过已完成的步骤（状态 resumed）并复用其输出，从第一个未完成的步骤继续；
+    步骤的输入（固件文件、转换缓存键）变化或依赖的步骤重新执行时，该步骤也重新执行
+
+使用方法:
+    python as_pipeline.py
+"""
+
+import hashlib
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 导入生产步骤模块
+import as_factory_info
+from as_journal import ProductionJournal, directory_sha256
+from as_nvs_flash import read_flash_and_mac, check_nvs_data, get_nvs_bin_path
+from as_flash_firmware import as_firmware_tool
+from as_flash_firmware.as_firmware_tool import flash_firmware_with_config
+from as_model_flash import as_model_down, as_model_flash, as_model_flag
+from as_model_conversion import as_model_cache
+from as_model_conversion.as_model_cache import ModelArtifactCache, file_sha256
+
+# 导入配置模块
+import as_ms500_config
+
+
+#------------------  配置区  ------------------
+
+# 同时执行的步骤数上限
+MAX_WORKERS = 4
+
+# 是否启用生产日志（断点续做）
+JOURNAL_ENABLED = True
+
+# 资源类型：串口步骤互斥执行，网络步骤可以并发
+RESOURCE_SERIAL = "serial"
+RESOURCE_NETWORK = "network"
+
+# 步骤状态
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_RESUMED = "resumed"
+
+# 视为已完成的状态
+COMPLETED_STATUSES = (STATUS_DONE, STATUS_RESUMED)
+
+
+#------------------  PipelineStep 类  ------------------
+
+class PipelineStep:
+    """流水线步骤：func(outputs) 接收依赖步骤的输出 {步骤名: 输出}，返回本步骤输出，失败时抛出异常
+
+    checkpoint 为 False 的步骤每次都执行（不从日志恢复），也不妨碍依赖它的步骤恢复
+    """
+
+    def __init__(self, name, func, deps=(), resource=None, checkpoint=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.resource = resource
+        self.checkpoint = checkpoint
+
+
+#------------------  DAG 调度  ------------------
+
+def run_pipeline(steps, max_workers=MAX_WORKERS, checkpoint=None, listener=None):
+    """
+    按依赖关系执行步骤，依赖满足且资源空闲的步骤立即开始
+
+    某个步骤失败后，依赖它的步骤标记为 cancelled，其他分支继续执行完
+
+    参数:
+        steps: [PipelineStep, ...]，列表顺序即同一资源上的优先级
+        max_workers: 同时执行的步骤数上限
+        checkpoint: 可选，提供 restore(step, outputs) -> (是否恢复, 输出) 和 record(step, output)，
+                    依赖都已恢复（或不记录）的步骤开始前先尝试恢复，每个步骤完成后记录
+        listener: 可选，listener(event) 接收步骤事件（可能在工作线程中调用）:
+                  {"event": "step_started", "step", "time"}
+                  {"event": "step_finished", "step", "status", "error", "time"}
+
+    返回:
+        dict: {步骤名: {status, output, error, start, end}}，start/end 为相对流水线开始的秒数
+    """
+    by_name = {step.name: step for step in steps}
+    names = set(by_name)
+    for step in steps:
+        unknown = [dep for dep in step.deps if dep not in names]
+        if unknown:
+            raise ValueError(f"Step {step.name} depends on unknown steps: {', '.join(unknown)}")
+
+    results = {}
+    pending = list(steps)
+    running = {}
+    busy_resources = set()
+    origin = time.monotonic()
+
+    def notify(event):
+        if listener is not None:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"警告: 步骤事件处理失败: {e}")
+
+    def finished(step, result):
+        results[step.name] = result
+        notify({"event": "step_finished", "step": step.name, "status": result["status"],
+                "error": result["error"], "time": round(result["end"], 3)})
+
+    def execute(step, outputs):
+        start = time.monotonic() - origin
+        notify({"event": "step_started", "step": step.name, "time": round(start, 3)})
+        try:
+            output = step.func(outputs)
+            return {"status": STATUS_DONE, "output": output, "error": "",
+                    "start": start, "end": time.monotonic() - origin}
+        except Exception as e:
+            return {"status": STATUS_FAILED, "output": None, "error": str(e),
+                    "start": start, "end": time.monotonic() - origin}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # 取消依赖失败步骤的步骤
+            for step in list(pending):
+                if any(results.get(dep, {}).get("status") in (STATUS_FAILED, STATUS_CANCELLED) for dep in step.deps):
+                    pending.remove(step)
+                    now = time.monotonic() - origin
+                    finished(step, {"status": STATUS_CANCELLED, "output": None,
+                                    "error": "依赖的步骤未完成", "start": now, "end": now})
+
+            # 启动依赖已满足且资源空闲的步骤
+            for step in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if not all(results.get(dep, {}).get("status") in COMPLETED_STATUSES for dep in step.deps):
+                    continue
+                if step.resource == RESOURCE_SERIAL and step.resource in busy_resources:
+                    continue
+                outputs = {dep: results[dep]["output"] for dep in step.deps}
+
+                # 依赖都是恢复的结果时，尝试从日志恢复本步骤
+                if checkpoint is not None and step.checkpoint and all(
+                        results[dep]["status"] == STATUS_RESUMED or not by_name[dep].checkpoint for dep in step.deps):
+                    restored, output = checkpoint.restore(step, outputs)
+                    if restored:
+                        pending.remove(step)
+                        now = time.monotonic() - origin
+                        finished(step, {"status": STATUS_RESUMED, "output": output, "error": "",
+                                        "start": now, "end": now})
+                        continue
+
+                pending.remove(step)
+                if step.resource == RESOURCE_SERIAL:
+                    busy_resources.add(step.resource)
+                running[executor.submit(execute, step, outputs)] = step
+
+            if not running:
+                if any(all(results.get(dep, {}).get("status") in COMPLETED_STATUSES for dep in step.deps)
+                       for step in pending):
+                    continue
+                if pending:
+                    raise ValueError(f"Dependency cycle between steps: {', '.join(step.name for step in pending)}")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                busy_resources.discard(step.resource)
+                finished(step, future.result())
+                if checkpoint is not None and results[step.name]["status"] == STATUS_DONE:
+                    checkpoint.record(step, results[step.name]["output"])
+
+    return results
+
+
+def critical_path(steps, results):
+    """
+    从最后结束的步骤向前回溯关键路径
+
+    每一步的前驱是它开始前最后结束的依赖步骤或同一串口上的步骤（等待串口也会推迟开始时间）
+
+    返回:
+        list: [步骤名, ...]，按执行顺序
+    """
+    by_name = {step.name: step for step in steps}
+    executed = [name for name in results if results[name]["status"] in (STATUS_DONE, STATUS_FAILED)]
+    if not executed:
+        return []
+
+    current = max(executed, key=lambda name: results[name]["end"])
+    path = [current]
+    while True:
+        step = by_name[current]
+        start = results[current]["start"]
+        candidates = list(step.deps)
+        if step.resource == RESOURCE_SERIAL:
+            candidates += [name for name in executed
+                           if by_name[name].resource == RESOURCE_SERIAL and name != current]
+        candidates = [name for name in candidates
+                      if name in executed and name not in path and results[name]["end"] <= start + 0.01]
+        if not candidates:
+            break
+        current = max(candidates, key=lambda name: results[name]["end"])
+        path.append(current)
+
+    return list(reversed(path))
+
+
+def print_pipeline_report(steps, results, total_time):
+    """打印每个步骤的状态、耗时和关键路径"""
+    path = critical_path(steps, results)
+
+    print("\n" + "=" * 80)
+    print("  流水线执行报告")
+    print("-" * 80)
+    print(f"{'步骤':<14}{'状态':<12}{'开始(s)':>10}{'结束(s)':>10}{'耗时(s)':>10}  关键路径")
+    for step in steps:
+        result = results.get(step.name)
+        if result is None:
+            continue
+        duration = result["end"] - result["start"]
+        mark = "*" if step.name in path else ""
+        print(f"{step.name:<14}{result['status']:<12}{result['start']:>10.1f}{result['end']:>10.1f}{duration:>10.1f}  {mark}")
+        if result["error"]:
+            print(f"    错误: {result['error']}")
+    print("-" * 80)
+
+    busy_time = sum(results[name]["end"] - results[name]["start"] for name in results)
+    print(f"关键路径: {' → '.join(path) if path else '无'}")
+    print(f"总耗时: {total_time:.1f} s（各步骤耗时合计 {busy_time:.1f} s）")
+    print("=" * 80)
+
+
+#------------------  生产日志（断点续做）  ------------------
+
+class JournalCheckpoint:
+    """把设备生产步骤的结果记录到 as_journal.ProductionJournal，并在再次运行时恢复"""
+
+    def __init__(self, bin_type, model_type, policy=None):
+        self.bin_type = bin_type
+        self.model_type = model_type
+        self.policy = policy
+        self.journal = None
+        self.device = None
+
+    def _inputs(self, step, outputs):
+        """步骤的输入摘要，与日志中的记录不一致时重新执行"""
+        if step.name == "firmware":
+            firmware_dir = os.path.join(os.path.dirname(os.path.abspath(as_firmware_tool.__file__)),
+                                        "bin_type", self.bin_type)
+            return {"firmware_sha256": directory_sha256(firmware_dir)}
+        if step.name == "convert":
+            existing_info = outputs["read_device"]["existing_info"] or {}
+            g_camera_id = existing_info.get("info", {}).get("g_camera_id", "")
+            packerOut_path = os.path.join(os.path.dirname(os.path.abspath(as_model_cache.__file__)),
+                                          "type_model", self.model_type, "packerOut.zip")
+            if not g_camera_id or not os.path.exists(packerOut_path):
+                return None
+            return {"cache_key": ModelArtifactCache().build_key(g_camera_id, self.model_type, packerOut_path)}
+        if step.name == "register":
+            # 服务器、序列号或注册策略变化后重新注册（nvs_commit 随之重新烧录）
+            policy = as_ms500_config.get_registration_policy()
+            policy.update(self.policy or {})
+            sn_pool = as_ms500_config.get_sn_pool_enabled()
+            return {
+                "server_url": as_ms500_config.get_server_url(),
+                "u_url": as_ms500_config.get_u_url(),
+                "sn_pool": sn_pool,
+                "c_sn": None if sn_pool else as_ms500_config.get_c_sn(),
+                "u_sn": None if sn_pool else as_ms500_config.get_u_sn(),
+                "policy": policy,
+            }
+        return {}
+
+    def restore(self, step, outputs):
+        if self.journal is None:
+            return False, None
+        entry = self.journal.step(step.name)
+        if entry is None:
+            return False, None
+        try:
+            inputs = self._inputs(step, outputs)
+            if inputs is None or inputs != entry["inputs"]:
+                print(f"生产日志: {step.name} 的输入已变化，重新执行")
+                self.journal.discard(step.name)
+                return False, None
+
+            output = entry["output"]
+            if step.name == "convert":
+                # 烧录文件从转换模型缓存读回，sha256 与日志一致才复用
+                output = ModelArtifactCache().load(inputs["cache_key"])
+                if output is None or {name: hashlib.sha256(data).hexdigest()
+                                      for name, data in output.items()} != entry["artifacts"]:
+                    print("生产日志: 转换模型缓存已失效，重新转换")
+                    self.journal.discard(step.name)
+                    return False, None
+        except Exception as e:
+            print(f"警告: 无法从生产日志恢复 {step.name}: {e}")
+            return False, None
+
+        print(f"生产日志: 复用 {step.name}（完成于 {entry['completed_at']}）")
+        return True, output
+
+    def record(self, step, output):
+        try:
+            if step.name == "read_device":
+                # 读到 MAC 后打开设备日志
+                self.device = output
+                self.journal = ProductionJournal(output["mac"])
+                reusable = self.journal.begin({"bin_type": self.bin_type, "model_type": self.model_type})
+                if reusable:
+                    print(f"生产日志: {self.journal.path}，已完成步骤: {', '.join(reusable)}")
+                return
+            if self.journal is None or not step.checkpoint:
+                return
+
+            artifacts = {}
+            if step.name == "convert":
+                artifacts = {name: hashlib.sha256(data).hexdigest() for name, data in output.items()}
+                output = None
+            elif step.name == "nvs_commit" and os.path.exists(get_nvs_bin_path()):
+                artifacts = {os.path.basename(get_nvs_bin_path()): file_sha256(get_nvs_bin_path())}
+            inputs = self._inputs(step, {"read_device": self.device})
+            self.journal.record(step.name, output=output, inputs=inputs, artifacts=artifacts)
+        except Exception as e:
+            print(f"警告: 无法写入生产日志 {step.name}: {e}")
+
+    def finish(self):
+        """全部步骤完成后标记日志，下次处理该设备时重新开始"""
+        if self.journal is not None:
+            self.journal.finish()
+
+
+#------------------  设备生产流水线  ------------------
+
+def build_device_pipeline(port, bin_type, model_type, policy=None,
+                          register=True, firmware=True, model=True):
+    """
+    生成单台设备的生产步骤
+
+    参数:
+        port: 串口号
+        bin_type: 固件类型
+        model_type: 模型类型
+        policy: 可选，注册策略（见 as_factory_info.main）
+        register / firmware / model: 是否包含参数注册、固件烧录、模型烧录
+
+    返回:
+        list: [PipelineStep, ...]
+    """
+    use_policy = as_ms500_config.get_registration_policy()
+    use_policy.update(policy or {})
+    # 领取和提交序列号的工位标识
+    owner = f"{socket.gethostname()}:{port}"
+
+    def read_device(outputs):
+        mac = read_flash_and_mac(port, bin_type)
+        existing_info = check_nvs_data()
+        return {"mac": mac, "existing_info": existing_info}
+
+    def register_step(outputs):
+        mac = outputs["read_device"]["mac"]
+        existing_info = outputs["read_device"]["existing_info"]
+        if existing_info:
+            action, message = as_factory_info.apply_registration_policy(existing_info, use_policy)
+            print(message)
+            if action == "fail":
+                raise RuntimeError(message)
+            if action == "skip":
+                return {"status": "skipped", "device_info": None, "existing_info": existing_info}
+        device_info = as_factory_info.request_server(mac, existing_info=existing_info, owner=owner)
+        return {"status": "registered", "device_info": device_info, "existing_info": existing_info}
+
+    def convert(outputs):
+        existing_info = outputs["read_device"]["existing_info"] or {}
+        if not existing_info.get("g_camera_id_valid"):
+            raise RuntimeError("NVS 中没有有效的 g_camera_id，需要先启动MS500设备进行camera_id的生成")
+        g_camera_id = existing_info["info"]["g_camera_id"]
+        model_files = as_model_down.generate_model_files(g_camera_id, model_type, in_memory=True)
+        if not model_files:
+            raise RuntimeError("生成模型失败")
+        return model_files
+
+    def firmware_step(outputs):
+        if not flash_firmware_with_config(port, bin_type):
+            raise RuntimeError("固件烧录失败")
+
+    def nvs_commit(outputs):
+        registration = outputs["register"]
+        if registration["device_info"] is None:
+            print("设备已有注册参数，按策略跳过 NVS 烧录")
+            return
+        # 序列号池中领取的序列号在烧录成功后提交
+        as_factory_info.flash_registration(port, bin_type, registration["device_info"],
+                                           existing_info=registration["existing_info"], owner=owner)
+
+    def model_flag(outputs):
+        # 重新读取设备 NVS，is_model_update 写在最新的参数上
+        if not as_model_down.read_device_id_from_nvs(port, bin_type):
+            raise RuntimeError("从 NVS 读取 device_id 失败")
+        if not as_model_flag.main(port, bin_type, reset_device=True):
+            raise RuntimeError("更新 NVS 标志失败")
+
+    def storage_dl(outputs):
+        if not as_model_flash.main(port, outputs["convert"], bin_type):
+            raise RuntimeError("烧录模型失败")
+
+    steps = []
+    if register or model:
+        steps.append(PipelineStep("read_device", read_device, resource=RESOURCE_SERIAL, checkpoint=False))
+    if register:
+        steps.append(PipelineStep("register", register_step, deps=["read_device"],
+                                  resource=RESOURCE_NETWORK))
+    if model:
+        steps.append(PipelineStep("convert", convert, deps=["read_device"],
+                                  resource=RESOURCE_NETWORK))
+    if firmware:
+        # 固件烧录不需要网络结果；依赖 read_device 只是为了先读到 MAC（两者都占用串口，不影响并发）
+        steps.append(PipelineStep("firmware", firmware_step, deps=["read_device"] if (register or model) else [],
+                                  resource=RESOURCE_SERIAL))
+    if register:
+        steps.append(PipelineStep("nvs_commit", nvs_commit, deps=["register"] + (["firmware"] if firmware else []),
+                                  resource=RESOURCE_SERIAL))
+    if model:
+        flag_deps = ["nvs_commit"] if register else (["firmware"] if firmware else ["read_device"])
+        steps.append(PipelineStep("model_flag", model_flag, deps=flag_deps,
+                                  resource=RESOURCE_SERIAL))
+        steps.append(PipelineStep("storage_dl", storage_dl, deps=["convert", "model_flag"],
+                                  resource=RESOURCE_SERIAL))
+    return steps
+
+
+#------------------  主函数  ------------------
+
+def run_device_pipeline(port, bin_type, model_type, policy=None, register=True, firmware=True, model=True,
+                        listener=None):
+    """
+    以流水线方式执行单台设备的生产流程并打印报告
+
+    参数:
+        listener: 可选，步骤事件回调（见 run_pipeline）
+
+    返回:
+        dict: {success, steps: {步骤名: {status, error, start, end}}, critical_path, total_time}
+    """
+    steps = build_device_pipeline(port, bin_type, model_type, policy=policy,
+                                  register=register, firmware=firmware, model=model)
+    checkpoint = JournalCheckpoint(bin_type, model_type, policy=policy) if JOURNAL_ENABLED else None
+    start = time.monotonic()
+    results = run_pipeline(steps, checkpoint=checkpoint, listener=listener)
+    total_time = time.monotonic() - start
+    print_pipeline_report(steps, results, total_time)
+
+    success = all(result["status"] in COMPLETED_STATUSES for result in results.values())
+    if success and checkpoint is not None:
+        checkpoint.finish()
+
+    return {
+        "success": success,
+        "steps": {name: {key: result[key] for key in ("status", "error", "start", "end")}
+                  for name, result in results.items()},
+        "critical_path": critical_path(steps, results),
+        "total_time": total_time,
+    }
+
+
+def main(port, bin_type, model_type, policy=None, register=True, firmware=True, model=True):
+    """
+    主函数 - 以流水线方式执行单台设备的生产流程
+
+    返回:
+        成功返回 0，失败返回 1
+    """
+    print("-" * 60)
+    print("  生产流水线 开始")
+    print(f"串口: {port}")
+    print(f"固件类型: {bin_type}")
+    print(f"模型类型: {model_type}")
+    print("-" * 60)
+
+    try:
+        result = run_device_pipeline(port, bin_type, model_type, policy=policy,
+                                     register=register, firmware=firmware, model=model)
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断")
+        return 1
+    except Exception as e:
+        print(f"\n\n错误: {e}")
+        return 1
+
+    if result["success"]:
+        print("  ✓ 生产流水线完成")
+        return 0
+    print("  ✗ 生产流水线失败")
+    return 1
+
+
+if __name__ == "__main__":
+    # 从配置文件读取参数
+    PORT = as_ms500_config.get_port()
+    BIN_TYPE = as_ms500_config.get_bin_type()
+    MODEL_TYPE = as_ms500_config.get_model_type()
+
+    sys.exit(main(PORT, BIN_TYPE, MODEL_TYPE))
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+MS500 工位守护进程
+
+功能说明:
+长期运行的生产服务，启动时加载一次所有模块和配置，之后每台设备只做实际的串口和网络工作:
+    - 模块导入、配置（文件修改后自动重新读取）
+    - 分区表解析结果（as_flash_firmware，文件变化时重新解析）
+    - DM 服务器 HTTP 连接（as_dm_api.get_endpoint）
+    - AITRIOS 访问令牌（as_model_conversion.model_conversion，过期前重新获取）
+    - storage_dl 镜像模板（as_model_flash 的进程内模板缓存）
+均在进程内保持，由本地 HTTP 接口接收设备任务，任务按 as_pipeline.py 的流水线执行
+
+HTTP 接口（默认只监听 127.0.0.1）:
+    POST /jobs               提交任务，请求体（JSON，均可选）:
+                             {"port", "bin_type", "model_type", "policy", "register", "firmware", "model"}
+                             未指定的参数从 as_ms500_config.json 读取；返回 {"id": ...}
+                             参数类型不对或策略取值无效时返回 400
+    GET  /jobs               所有任务的状态
+    GET  /jobs/{id}          单个任务的状态和结果
+    GET  /jobs/{id}/events   任务事件流（NDJSON，每行一个事件，任务结束后关闭连接）
+    GET  /status             工位状态
+
+各模块共用 temp 目录中的 NVS 和 storage_dl 文件，任务按提交顺序依次执行
+
+使用方法:
+    python as_station.py
+    python as_station.py --port 8765
+
+    curl -X POST http://127.0.0.1:8765/jobs -d '{"port": "COM5"}'
+    curl -N http://127.0.0.1:8765/jobs/1/events
+"""
+
+import argparse
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 启动时导入全部生产模块
+import as_pipeline
+import as_ms500_config
+from as_flash_firmware import get_nvs_info, get_storage_dl_info
+from as_dm_register.as_dm_api import get_admin_token_for_server, get_endpoint
+from as_model_conversion import model_conversion
+
+
+#------------------  配置区  ------------------
+
+# 监听地址和端口
+STATION_HOST = "127.0.0.1"
+STATION_PORT = 8765
+
+# 保留的已结束任务数（超过后删除最早的）
+MAX_FINISHED_JOBS = 200
+
+# 等待新事件的超时时间（秒），超时后检查连接和任务状态
+EVENT_WAIT_TIMEOUT = 1.0
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+#------------------  Job 类  ------------------
+
+class Job:
+    """一台设备的生产任务，事件列表只追加"""
+
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = ""
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def add_event(self, event):
+        """追加事件并唤醒等待事件流的连接"""
+        with self.condition:
+            self.events.append(dict(event, job=self.id))
+            self.condition.notify_all()
+
+    def set_status(self, status, result=None, error=""):
+        with self.condition:
+            self.status = status
+            if status == JOB_RUNNING:
+                self.started_at = time.time()
+            if status in (JOB_DONE, JOB_FAILED):
+                self.finished_at = time.time()
+                self.result = result
+                self.error = error
+            self.events.append({"event": "job_" + status, "job": self.id, "error": error})
+            self.condition.notify_all()
+
+    def wait_events(self, index, timeout=EVENT_WAIT_TIMEOUT):
+        """
+        返回 index 之后的事件（没有新事件时最多等待 timeout 秒）
+
+        返回:
+            tuple: (事件列表, 任务是否已结束)
+        """
+        with self.condition:
+            if len(self.events) <= index and not self.finished:
+                self.condition.wait(timeout)
+            return self.events[index:], self.finished
+
+    def snapshot(self):
+        """任务状态（可直接转为 JSON）"""
+        with self.condition:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "error": self.error,
+                "result": self.result,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "events": len(self.events),
+            }
+
+
+#------------------  Station 类  ------------------
+
+class Station:
+    """任务队列和工作线程，进程内的缓存在任务之间保持"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.ids = itertools.count(1)
+        self.started_at = time.time()
+        self.worker = threading.Thread(target=self._work, name="station-worker", daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+    def warm_up(self):
+        """预先读取配置、分区表，建立 DM 服务器连接并获取 AITRIOS 访问令牌（失败时只打印警告）"""
+        print("-" * 60)
+        print("  预热工位缓存")
+        print("-" * 60)
+        try:
+            config = as_ms500_config.load_config()
+            bin_type = as_ms500_config.get_bin_type()
+            get_nvs_info(bin_type)
+            get_storage_dl_info(bin_type)
+            print(f"✓ 分区表: {bin_type}")
+
+            server_url = config.get("server_url", "").strip()
+            if server_url:
+                get_endpoint(server_url, get_admin_token_for_server(server_url))
+                print(f"✓ DM 服务器连接: {server_url}")
+        except Exception as e:
+            print(f"警告: 预热配置失败: {e}")
+
+        if model_conversion.get_access_token():
+            print("✓ AITRIOS 访问令牌")
+        else:
+            print("警告: 无法获取 AITRIOS 访问令牌，首个任务转换模型时重试")
+
+    def submit(self, params):
+        """提交任务，返回 Job"""
+        with self.lock:
+            job = Job(str(next(self.ids)), params)
+            self.jobs[job.id] = job
+            self._prune()
+        job.add_event({"event": "job_queued", "position": self.queue.qsize() + 1})
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.snapshot() for job in jobs]
+
+    def status(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)}
+        for job in jobs:
+            counts[job.status] += 1
+        return {"started_at": self.started_at, "uptime": time.time() - self.started_at, "jobs": counts}
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            self._run(job)
+
+    def _run(self, job):
+        params = job.params
+        job.set_status(JOB_RUNNING)
+        try:
+            result = as_pipeline.run_device_pipeline(
+                params.get("port") or as_ms500_config.get_port(),
+                params.get("bin_type") or as_ms500_config.get_bin_type(),
+                params.get("model_type") or as_ms500_config.get_model_type(),
+                policy=params.get("policy"),
+                register=params.get("register", True),
+                firmware=params.get("firmware", True),
+                model=params.get("model", True),
+                listener=job.add_event,
+            )
+        except Exception as e:
+            print(f"\n错误: 任务 {job.id} 失败: {e}")
+            job.set_status(JOB_FAILED, error=str(e))
+            return
+
+        if result["success"]:
+            job.set_status(JOB_DONE, result=result)
+        else:
+            failed = [name for name, step in result["steps"].items() if step["status"] == as_pipeline.STATUS_FAILED]
+            job.set_status(JOB_FAILED, result=result, error=f"步骤失败: {', '.join(failed)}")
+
+
+#------------------  HTTP 接口  ------------------
+
+# 提交任务时接受的参数
+JOB_PARAMS = ("port", "bin_type", "model_type", "policy", "register", "firmware", "model")
+
+# 字符串参数（null 表示从配置读取）和开关参数
+JOB_STR_PARAMS = ("port", "bin_type", "model_type")
+JOB_FLAG_PARAMS = ("register", "firmware", "model")
+
+# 注册策略中每项可选的取值
+POLICY_ACTIONS = {
+    "on_registered": as_ms500_config.REGISTERED_ACTIONS,
+    "on_invalid_camera_id": as_ms500_config.INVALID_CAMERA_ID_ACTIONS,
+}
+
+
+def validate_job_params(params):
+    """
+    检查提交任务的参数
+
+    返回:
+        str: 错误信息，参数有效时返回 None
+    """
+    unknown = set(params) - set(JOB_PARAMS)
+    if unknown:
+        return f"unsupported parameters: {', '.join(sorted(unknown))}"
+    for name in JOB_STR_PARAMS:
+        if params.get(name) is not None and not isinstance(params[name], str):
+            return f"{name} must be a string"
+    for name in JOB_FLAG_PARAMS:
+        if name in params and not isinstance(params[name], bool):
+            return f"{name} must be true or false"
+
+    policy = params.get("policy")
+    if policy is None:
+        return None
+    if not isinstance(policy, dict):
+        return "policy must be a JSON object"
+    for key, value in policy.items():
+        if key not in POLICY_ACTIONS:
+            return f"unsupported policy: {key}"
+        if value not in POLICY_ACTIONS[key]:
+            return f"invalid policy {key} (expected one of {', '.join(POLICY_ACTIONS[key])})"
+    return None
+
+
+class StationHandler(BaseHTTPRequestHandler):
+    """本地 HTTP 接口，station 属性在 serve() 中设置"""
+
+    station = None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        index = 0
+        try:
+            while True:
+                events, finished = job.wait_events(index)
+                for event in events:
+                    self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                index += len(events)
+                if finished and not events:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["status"]:
+            return self._send_json(200, self.station.status())
+        if parts == ["jobs"]:
+            return self._send_json(200, self.station.list())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.station.get(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": f"job not found: {parts[1]}"})
+            if len(parts) == 2:
+                return self._send_json(200, job.snapshot())
+            if parts[2] == "events":
+                return self._stream_events(job)
+        self._send_json(404, {"error": f"not found: {self.path}"})
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != "/jobs":
+            return self._send_json(404, {"error": f"not found: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if not isinstance(params, dict):
+                raise ValueError("request body must be a JSON object")
+        except ValueError as e:
+            return self._send_json(400, {"error": f"invalid request body: {e}"})
+
+        error = validate_job_params(params)
+        if error:
+            return self._send_json(400, {"error": error})
+
+        job = self.station.submit(params)
+        self._send_json(202, {"id": job.id})
+
+
+#------------------  主函数  ------------------
+
+def serve(host=STATION_HOST, port=STATION_PORT, warm_up=True):
+    """启动工位守护进程（阻塞，Ctrl+C 退出）"""
+    station = Station()
+    if warm_up:
+        station.warm_up()
+    station.start()
+
+    StationHandler.station = station
+    server = ThreadingHTTPServer((host, port), StationHandler)
+    server.daemon_threads = True
+    print(f"\n工位守护进程已启动: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\n工位守护进程退出")
+    finally:
+        server.server_close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MS500 station daemon")
+    parser.add_argument("--host", default=STATION_HOST, help="Listen address")
+    parser.add_argument("--port", type=int, default=STATION_PORT, help="Listen port")
+    parser.add_argument("--no-warm-up", action="store_true", help="Skip warming caches at startup")
+    args = parser.parse_args()
+    return serve(args.host, args.port, warm_up=not args.no_warm_up)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ ESP-IDF 工具路径配置模块
 """
 
 import os
+import sys
 from pathlib import Path
 
 # 获取esp_components目录的绝对路径
@@ -14,8 +15,29 @@ PROJECT_ROOT = ESP_COMPONENTS_DIR.parent
 
 # ========== ESP-IDF 工具路径配置 ==========
 
-# ESP-IDF Python 环境路径（使用项目根目录的.venv虚拟环境）
-ESP_IDF_PYTHON = str(PROJECT_ROOT / ".venv" / "Scripts" / "python.exe")
+# 项目虚拟环境目录
+VENV_DIR = PROJECT_ROOT / ".venv"
+
+
+def _find_venv_python():
+    """
+    按平台查找虚拟环境中的 Python 解释器
+
+    Windows 为 .venv/Scripts/python.exe，Linux/Mac 为 .venv/bin/python；
+    虚拟环境不存在时回退到当前解释器（sys.executable）
+    """
+    if os.name == "nt":
+        candidates = [VENV_DIR / "Scripts" / "python.exe", VENV_DIR / "bin" / "python"]
+    else:
+        candidates = [VENV_DIR / "bin" / "python", VENV_DIR / "Scripts" / "python.exe"]
+    for candidate in candidates:
+        if candidate.exists():
+            return str(candidate)
+    return sys.executable
+
+
+# ESP-IDF Python 环境路径（优先使用项目根目录的.venv虚拟环境）
+ESP_IDF_PYTHON = _find_venv_python()
 
 # ESP-IDF NVS 工具路径（使用本地工具）
 NVS_TOOL_PATH = str(ESP_COMPONENTS_DIR / "nvs_tools" / "nvs_tool.py")
@@ -25,7 +47,7 @@ FATFS_GEN_TOOL = str(ESP_COMPONENTS_DIR / "fatfs_tools" / "wl_fatfsgen.py")
 
 # ESP32 烧录工具（使用 Python 模块方式调用，避免 Windows WinError 2）
 # 注意：返回列表格式 [python.exe, -m, esptool]
-ESPTOOL = [str(PROJECT_ROOT / ".venv" / "Scripts" / "python.exe"), "-m", "esptool"]
+ESPTOOL = [ESP_IDF_PYTHON, "-m", "esptool"]
 
 # 使用 ESP-IDF 的 NVS 分区生成模块（仅用于生成 BIN）
 NVS_GEN_MODULE = "esp_idf_nvs_partition_gen"
@@ -236,9 +258,9 @@ def verify_python_environment():
     验证 Python 虚拟环境是否正确配置
 
     检查项:
-        1. .venv 目录是否存在
-        2. python.exe 是否存在
-        3. esptool.exe 是否存在
+        1. .venv 目录是否存在（不存在时使用当前解释器）
+        2. python 解释器是否存在
+        3. esptool 是否可用
 
     Returns:
         bool: 环境验证成功返回 True
@@ -248,18 +270,9 @@ def verify_python_environment():
     """
     errors = []
 
-    # 检查 .venv 目录
-    venv_dir = PROJECT_ROOT / ".venv"
-    if not venv_dir.exists():
-        errors.append(f"虚拟环境目录不存在: {venv_dir}")
-        errors.append("\n解决方法:")
-        errors.append("  1. 在项目根目录创建虚拟环境:")
-        errors.append("     python -m venv .venv")
-        errors.append("  2. 安装项目依赖:")
-        errors.append("     .venv\\Scripts\\activate")
-        errors.append("     pip install -r requirements.txt")
-        errors.append("\n详细说明请查看: PYTHON_ENV_SETUP.md")
-        raise RuntimeError("\n".join(errors))
+    # 检查 .venv 目录（不存在时回退到当前解释器，只给出提示）
+    if not VENV_DIR.exists():
+        print(f"提示: 虚拟环境目录不存在: {VENV_DIR}，使用当前 Python 解释器: {ESP_IDF_PYTHON}")
 
     # 检查 Python 解释器
     if not os.path.exists(ESP_IDF_PYTHON):
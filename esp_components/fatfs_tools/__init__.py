@@ -1 +1,57 @@
 # FATFS 工具模块
+"""
+FATFS 工具包
+提供进程内生成（磨损均衡）FAT 镜像的接口，无需启动 wl_fatfsgen.py 子进程，
+以及离线读取、校验镜像内容的接口（FATFSReader）
+
+使用方法:
+    from esp_components.fatfs_tools import build_fatfs_image
+
+    image = build_fatfs_image({"dnn": {"network.fpk": fpk_bytes}}, size=0x700000, long_names_enabled=True)
+
+    # 可复现镜像：相同内容生成的镜像逐字节相同，可按摘要缓存/去重
+    image = build_fatfs_image(tree, size=0x700000, deterministic=True)
+    key = image_digest(image)
+
+    # 读取/校验镜像（支持磨损均衡镜像和设备回读的镜像）
+    with FATFSReader.open("storage_dl.bin") as reader:
+        print(reader.file_digest("dnn/network.fpk"))
+"""
+
+import os
+import sys
+
+# fatfsgen.py / wl_fatfsgen.py 使用顶层导入（from fatfs_utils... / from fatfsgen ...），
+# 需要把本目录加入 sys.path，保证与命令行方式加载的是同一份模块
+_fatfs_tools_dir = os.path.dirname(os.path.abspath(__file__))
+if _fatfs_tools_dir not in sys.path:
+    sys.path.insert(0, _fatfs_tools_dir)
+
+from fatfs_image import (
+    build_fatfs_image,
+    build_fatfs_image_and_map,
+    build_fatfs_template,
+    file_data_offset,
+    image_digest,
+    populate_fatfs,
+    verify_fatfs_image,
+    write_fatfs_image,
+)
+from fatfsgen import FATFS
+from fatfsparse import DirectoryEntry, FATFSReader
+from wl_fatfsgen import WLFATFS
+
+__all__ = [
+    "build_fatfs_image",
+    "build_fatfs_image_and_map",
+    "build_fatfs_template",
+    "file_data_offset",
+    "image_digest",
+    "populate_fatfs",
+    "verify_fatfs_image",
+    "write_fatfs_image",
+    "DirectoryEntry",
+    "FATFS",
+    "FATFSReader",
+    "WLFATFS",
+]
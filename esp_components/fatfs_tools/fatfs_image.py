@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+In-process API for building (wear-levelled) FAT images from an in-memory tree.
+
+The tree is a dict mapping names to file contents or nested dicts (sub-directories).
+File contents may be bytes-like objects or binary file-like objects (anything with ``read()``),
+seekable streams are copied into the image in bounded chunks without being read into memory as a whole.
+The image layout is identical to the one produced by ``fatfsgen.py``/``wl_fatfsgen.py``
+for the same directory tree: names are upper-cased and entries are created in sorted order.
+
+Example::
+
+    image = build_fatfs_image({'dnn': {'network.fpk': fpk_bytes, 'network_info.txt': info_bytes}},
+                              size=0x700000, long_names_enabled=True)
+
+Images that differ only in the content of one file of a fixed size can share a template::
+
+    template, offset, _ = build_fatfs_template(tree_with_placeholder, ['dnn', 'network.fpk'], size=0x700000)
+    image = bytearray(template)
+    image[offset:offset + len(fpk_bytes)] = fpk_bytes
+
+The generated (or read back) image can be checked against the tree::
+
+    problems = verify_fatfs_image(image, tree)  # empty list when the image holds exactly the tree
+
+With ``deterministic=True`` the entries get the default timestamp and the volume and WL device IDs are fixed,
+so the same tree always gives the same image, which can be identified by its digest::
+
+    image = build_fatfs_image(tree, size=0x700000, deterministic=True)
+    key = image_digest(image)
+
+The allocation map lists the (address, size) extents that carry content, everything else is 0xFF
+and does not need to be transferred to an erased flash::
+
+    image, extents = build_fatfs_image_and_map(tree, size=0x700000)
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from fatfs_utils.exceptions import FatalError
+from fatfs_utils.exceptions import WriteDirectoryException
+from fatfs_utils.fs_object import File
+from fatfsgen import FATFS
+from fatfsparse import FATFSReader
+from wl_fatfsgen import WLFATFS
+
+FileContent = Union[bytes, bytearray, memoryview, BinaryIO]
+FileTree = Dict[str, Any]  # name -> FileContent or nested FileTree
+
+
+def _remaining_size(stream: BinaryIO) -> Optional[int]:
+    """
+    Returns the number of bytes from the current position to the end of a seekable stream, None otherwise.
+    """
+    try:
+        position = stream.tell()
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return end - position
+
+
+def _write_file_content(fatfs: FATFS, path: List[str], value: FileContent, file_name: str, extension: str,
+                        path_from_root: Optional[List[str]], timestamp: datetime) -> None:
+    """
+    Creates the file and writes its content. Seekable streams are copied in bounded chunks
+    straight into the image, bytes-like content is written without an intermediate copy.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        content: Optional[FileContent] = value
+        size = memoryview(value).nbytes
+    elif hasattr(value, 'read'):
+        size = _remaining_size(value)
+        # non-seekable streams are read as a whole
+        content = value.read() if size is None else None
+        size = len(content) if size is None else size
+    else:
+        raise TypeError(f'Unsupported file content type: {type(value).__name__}')
+
+    fatfs.create_file(name=file_name,
+                      extension=extension,
+                      path_from_root=path_from_root,
+                      object_timestamp_=timestamp,
+                      is_empty=size == 0)
+    if content is None:
+        fatfs.write_content_from_stream(path, value, size)
+    else:
+        fatfs.write_content(path, content)
+
+
+def populate_fatfs(fatfs: FATFS,
+                   tree: FileTree,
+                   path_from_root: Optional[List[str]] = None,
+                   object_timestamp_: Optional[datetime] = None) -> None:
+    """
+    Recursively encodes the in-memory tree into the given FATFS instance.
+    Mirrors FATFS.generate, so the result is byte-identical to generating from the same directory.
+
+    :param fatfs: FATFS instance (e.g. WLFATFS.plain_fatfs)
+    :param tree: dict name -> file content (bytes-like or file-like) or nested dict
+    :param path_from_root: ancestors of the tree in the image, None means root
+    :param object_timestamp_: timestamp propagated to all entries, defaults to now
+    """
+    path_from_root = path_from_root or []
+    timestamp = object_timestamp_ or datetime.now()
+    with fatfs.deferred_fat_duplication():
+        _populate(fatfs, tree, path_from_root, timestamp)
+
+
+def _populate(fatfs: FATFS, tree: FileTree, path_from_root: List[str], timestamp: datetime) -> None:
+    for name in sorted(tree):
+        value = tree[name]
+        upper_name = name.upper()
+        if isinstance(value, dict):
+            fatfs.create_directory(name=upper_name,
+                                   path_from_root=path_from_root,
+                                   object_timestamp_=timestamp)
+            _populate(fatfs, value, path_from_root + [upper_name], timestamp)
+        else:
+            file_name, extension = os.path.splitext(upper_name)
+            _write_file_content(fatfs, path_from_root + [upper_name], value, file_name, extension[1:],
+                                path_from_root or None, timestamp)
+
+
+def _generate(tree: FileTree,
+              size: int,
+              wl: bool,
+              object_timestamp_: Optional[datetime],
+              use_default_datetime: bool,
+              **kwargs: Any) -> Union[FATFS, WLFATFS]:
+    """
+    Returns the generator object (WLFATFS with initialized WL, or FATFS) populated with the tree.
+    """
+    if wl:
+        wl_fatfs = WLFATFS(size=size, use_default_datetime=use_default_datetime, **kwargs)
+        populate_fatfs(wl_fatfs.plain_fatfs, tree, object_timestamp_=object_timestamp_)
+        wl_fatfs.init_wl()
+        return wl_fatfs
+
+    fatfs = FATFS(size=size, use_default_datetime=use_default_datetime, **kwargs)
+    populate_fatfs(fatfs, tree, object_timestamp_=object_timestamp_)
+    return fatfs
+
+
+def _image_of(generator: Union[FATFS, WLFATFS]) -> Union[bytes, bytearray]:
+    if isinstance(generator, WLFATFS):
+        return generator.fatfs_binary_image
+    return generator.state.binary_image
+
+
+def file_data_offset(fatfs: FATFS, path_from_root: List[str]) -> Optional[int]:
+    """
+    Returns the address of the file content in the plain FAT image.
+
+    :param fatfs: FATFS instance containing the file
+    :param path_from_root: path of the file in the tree (names are upper-cased as in populate_fatfs)
+    :returns: the address of the first byte of the content, None for an empty file
+    :raises FatalError: if the clusters of the file are not contiguous
+    """
+    path = [name.upper() for name in path_from_root]
+    entity = fatfs.root_directory.recursive_search(path, fatfs.root_directory)
+    if not isinstance(entity, File):
+        raise WriteDirectoryException(f'`{os.path.join(*path)}` is a directory!')
+    cluster = entity.first_cluster
+    if cluster is None:
+        return None
+    runs = list(fatfs.fat.chain_runs(cluster.id))
+    if len(runs) != 1:
+        raise FatalError(f'Content of `{os.path.join(*path)}` is not contiguous!')
+    return cluster.cluster_data_address
+
+
+def build_fatfs_image(tree: FileTree,
+                      size: int,
+                      wl: bool = True,
+                      object_timestamp_: Optional[datetime] = None,
+                      use_default_datetime: bool = False,
+                      **kwargs: Any) -> Union[bytes, bytearray]:
+    """
+    Builds the FAT image for the in-memory tree and returns it as a buffer.
+
+    :param tree: dict name -> file content or nested dict
+    :param size: partition size in bytes
+    :param wl: True to produce a wear-levelled image (WLFATFS), False for plain FATFS
+    :param object_timestamp_: timestamp of all entries, defaults to now
+    :param use_default_datetime: if True the entries get the default timestamp (1st of January 1980)
+    :param kwargs: other arguments of WLFATFS/FATFS (sector_size, long_names_enabled, fat_tables_cnt,
+        deterministic, ...)
+    :returns: the binary image
+    """
+    return _image_of(_generate(tree, size, wl, object_timestamp_, use_default_datetime, **kwargs))
+
+
+def build_fatfs_image_and_map(tree: FileTree,
+                              size: int,
+                              wl: bool = True,
+                              object_timestamp_: Optional[datetime] = None,
+                              use_default_datetime: bool = False,
+                              **kwargs: Any) -> Tuple[Union[bytes, bytearray], List[Tuple[int, int]]]:
+    """
+    Builds the FAT image like build_fatfs_image and returns it together with its allocation map,
+    the (address, size) extents that carry content. The rest of the image is 0xFF (erased flash).
+
+    :returns: (image, allocation map)
+    """
+    generator = _generate(tree, size, wl, object_timestamp_, use_default_datetime, **kwargs)
+    return _image_of(generator), generator.allocation_map()
+
+
+def build_fatfs_template(tree: FileTree,
+                         slot_path: List[str],
+                         size: int,
+                         wl: bool = True,
+                         object_timestamp_: Optional[datetime] = None,
+                         use_default_datetime: bool = False,
+                         **kwargs: Any) -> Tuple[Union[bytes, bytearray], int, List[Tuple[int, int]]]:
+    """
+    Builds the FAT image for the tree and locates the content of the file `slot_path` in it.
+    Writing other content of the same length at the returned offset produces the same image
+    as building the tree with that content, no FAT or directory regeneration is needed.
+
+    :param tree: dict name -> file content or nested dict, the slot file holds a placeholder of the final size
+    :param slot_path: path of the slot file in the tree
+    :param size: partition size in bytes
+    :param kwargs: arguments of build_fatfs_image
+    :returns: (image, offset of the slot file content in the image, allocation map of the image)
+    :raises FatalError: if the slot file is empty or its clusters are not contiguous
+    """
+    generator = _generate(tree, size, wl, object_timestamp_, use_default_datetime, **kwargs)
+    if isinstance(generator, WLFATFS):
+        plain_fatfs, image_offset = generator.plain_fatfs, generator.boot_sector_start
+    else:
+        plain_fatfs, image_offset = generator, 0
+    data_offset = file_data_offset(plain_fatfs, slot_path)
+    if data_offset is None:
+        raise FatalError(f'`{os.path.join(*slot_path)}` is empty, nothing to reserve!')
+    return _image_of(generator), image_offset + data_offset, generator.allocation_map()
+
+
+def write_fatfs_image(tree: FileTree, output: Union[str, BinaryIO], size: int, **kwargs: Any) -> int:
+    """
+    Builds the FAT image for the in-memory tree and writes it to a path or a binary stream.
+
+    :param tree: dict name -> file content or nested dict
+    :param output: output path or writable binary stream
+    :param size: partition size in bytes
+    :param kwargs: arguments of build_fatfs_image
+    :returns: number of bytes written
+    """
+    image = build_fatfs_image(tree, size, **kwargs)
+    if isinstance(output, str):
+        with open(output, 'wb') as output_file:
+            output_file.write(image)
+    else:
+        output.write(image)
+    return len(image)
+
+
+def image_digest(image: Union[bytes, bytearray, memoryview], algorithm: str = 'sha256') -> str:
+    """
+    Returns the hex digest of the image. Images generated with ``deterministic=True`` from the same tree
+    and with the same parameters have the same digest.
+
+    :param image: the binary image
+    :param algorithm: name of the hashlib algorithm
+    :returns: the hex digest
+    """
+    return hashlib.new(algorithm, image).hexdigest()
+
+
+def _tree_digests(tree: FileTree, base: str = '') -> Dict[str, Optional[str]]:
+    """
+    Returns {path: sha256 of the content} of the files in the tree, the names are upper-cased,
+    the digest is None for streams (their content cannot be read again).
+    """
+    digests: Dict[str, Optional[str]] = {}
+    for name, value in tree.items():
+        path = f'{base}/{name.upper()}' if base else name.upper()
+        if isinstance(value, dict):
+            digests.update(_tree_digests(value, path))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            digests[path] = hashlib.sha256(value).hexdigest()
+        else:
+            digests[path] = None
+    return digests
+
+
+def verify_fatfs_image(image: Union[bytes, bytearray, memoryview],
+                       tree: FileTree,
+                       wl_support: Optional[bool] = None) -> List[str]:
+    """
+    Reads the image back with FATFSReader and compares its files with the tree
+    (names case-insensitively, contents by sha256).
+
+    :param image: the image built from the tree or read back from the device
+    :param tree: dict name -> file content or nested dict
+    :param wl_support: True for wear levelled image, False for plain, None to detect
+    :returns: descriptions of the differences, empty list if the image holds exactly the tree
+    """
+    expected = _tree_digests(tree)
+    problems: List[str] = []
+    with FATFSReader(image, wl_support) as reader:
+        found: Dict[str, str] = {path.upper(): path for path, entry in reader.walk() if not entry.is_directory}
+        for path in sorted(expected):
+            if path not in found:
+                problems.append(f'missing file: {path}')
+            elif expected[path] is not None and reader.file_digest(found[path]) != expected[path]:
+                problems.append(f'content mismatch: {path}')
+        problems += [f'unexpected file: {found[path]}' for path in sorted(set(found) - set(expected))]
+    return problems
@@ -1,14 +1,14 @@
 # SPDX-FileCopyrightText: 2021-2024 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
 from inspect import getmembers, isroutine
-from typing import Optional
+from typing import Optional, Union
 
 from construct import Bytes, Const, Int8ul, Int16ul, Int32ul, PaddedString, Padding, Struct, core
 
 from .exceptions import InconsistentFATAttributes, NotInitialized
 from .fatfs_state import BootSectorState
 from .utils import (ALLOWED_SECTOR_SIZES, ALLOWED_SECTORS_PER_CLUSTER, EMPTY_BYTE, FAT32, FULL_BYTE,
-                    SHORT_NAMES_ENCODING, FATDefaults, generate_4bytes_random, pad_string)
+                    SHORT_NAMES_ENCODING, FATDefaults, fill_buffer, generate_4bytes_random, pad_string)
 
 
 class BootSector:
@@ -58,20 +58,48 @@ class BootSector:
         self._parsed_header: dict = {}
         self.boot_sector_state: BootSectorState = boot_sector_state
 
-    def generate_boot_sector(self) -> None:
+    def generate_boot_sector(self, binary_image_buffer: Optional[Union[bytearray, memoryview]] = None) -> None:
+        """
+        Generates the empty filesystem: the boot sector, empty FATs and root directory and the data region
+        filled with 0xFF.
+
+        :param binary_image_buffer: writable buffer of the image size, the image is generated into it in place
+            (e.g. a slice of the wear levelling image), when None a new image is created
+        """
         boot_sector_state: BootSectorState = self.boot_sector_state
         if boot_sector_state is None:
             raise NotInitialized('The BootSectorState instance is not initialized!')
-        volume_uuid = generate_4bytes_random()
+        # a negative volume_uuid means that no volume ID was requested
+        volume_uuid = boot_sector_state.volume_uuid
+        if volume_uuid < 0:
+            volume_uuid = generate_4bytes_random()
         pad_header: bytes = (boot_sector_state.sector_size - BootSector.BOOT_HEADER_SIZE) * EMPTY_BYTE
         fat_tables_content: bytes = (boot_sector_state.sectors_per_fat_cnt
                                      * boot_sector_state.fat_tables_cnt
                                      * boot_sector_state.sector_size
                                      * EMPTY_BYTE)
         root_dir_content: bytes = boot_sector_state.root_dir_sectors_cnt * boot_sector_state.sector_size * EMPTY_BYTE
-        data_content: bytes = boot_sector_state.data_sectors * boot_sector_state.sector_size * FULL_BYTE
+        data_size: int = boot_sector_state.data_sectors * boot_sector_state.sector_size
+        if binary_image_buffer is not None:
+            header_: bytes = self._build_header(volume_uuid)
+            data_start: int = len(header_) + len(pad_header) + len(fat_tables_content) + len(root_dir_content)
+            if len(binary_image_buffer) != data_start + data_size:
+                raise ValueError(f'The buffer size {len(binary_image_buffer)} does not match '
+                                 f'the image size {data_start + data_size}!')
+            binary_image_buffer[:len(header_)] = header_
+            fill_buffer(binary_image_buffer, len(header_), data_start, EMPTY_BYTE)
+            fill_buffer(binary_image_buffer, data_start, data_start + data_size, FULL_BYTE)
+            self.boot_sector_state.binary_image = binary_image_buffer
+            return
+        data_content: bytes = data_size * FULL_BYTE
 
         self.boot_sector_state.binary_image = (
+            self._build_header(volume_uuid) + pad_header + fat_tables_content + root_dir_content + data_content
+        )
+
+    def _build_header(self, volume_uuid: int) -> bytes:
+        boot_sector_state: BootSectorState = self.boot_sector_state
+        header_: bytes = (
             BootSector.BOOT_SECTOR_HEADER.build(
                 dict(BS_jmpBoot=(b'\xeb\xfe\x90'),
                      BS_OEMName=pad_string(boot_sector_state.oem_name, size=BootSector.MAX_OEM_NAME_SIZE),
@@ -93,8 +121,9 @@ class BootSector:
                                           size=BootSector.MAX_VOL_LAB_SIZE),
                      BS_FilSysType=pad_string(boot_sector_state.file_sys_type,
                                               size=BootSector.MAX_FS_TYPE_SIZE))
-            ) + pad_header + fat_tables_content + root_dir_content + data_content
+            )
         )
+        return header_
 
     def parse_boot_sector(self, binary_data: bytes) -> None:
         """
@@ -1,7 +1,7 @@
 # SPDX-FileCopyrightText: 2021-2022 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from construct import Int16ul
 
@@ -29,17 +29,21 @@ class Cluster:
     def __init__(self,
                  cluster_id: int,
                  boot_sector_state: BootSectorState,
-                 init_: bool) -> None:
+                 init_: bool,
+                 fat_table: Optional[Any] = None) -> None:
         """
         Initially, if init_ is False, the cluster is virtual and is not allocated (doesn't do changes in the FAT).
         :param cluster_id: the cluster ID - a key value linking the file's cluster,
           the corresponding physical cluster (data region) and the FAT table cluster.
         :param boot_sector_state: auxiliary structure holding the file-system's metadata
         :param init_: True for allocation the cluster on instantiation, otherwise False.
+        :param fat_table: FATTable holding the values of the FAT, if set the FAT entry is read from and written
+          through the table instead of being decoded from the binary image
         :returns: None
         """
         self.id: int = cluster_id
         self.boot_sector_state: BootSectorState = boot_sector_state
+        self.fat_table = fat_table
 
         self._next_cluster = None  # type: Optional[Cluster]
         # First cluster in FAT is reserved, low 8 bits contains BPB_Media and the rest is filled with 1
@@ -120,6 +124,8 @@ class Cluster:
 
         three bytes - AB XC YZ - stores two blocks - CAB YZX
         """
+        if self.fat_table is not None:
+            return self.fat_table.get(self.id)
         address_: int = self.real_cluster_address
         bin_img_: bytearray = self.boot_sector_state.binary_image
         if self.boot_sector_state.fatfs_type == FAT12:
@@ -152,6 +158,9 @@ class Cluster:
         2. if the cluster index is odd, we set the first half of the computed byte and the full consequent byte.
         Order of half bytes is 1, 3, 2.
         """
+        if self.fat_table is not None:
+            self.fat_table.set(self.id, value)
+            return
 
         def _set_msb_half_byte(address: int, value_: int) -> None:
             """
@@ -205,7 +214,8 @@ class Cluster:
         """
         This method sets bits in FAT table to `allocated` and clean the corresponding sector(s)
         """
-        self.set_in_fat(self.ALLOCATED_BLOCK_SWITCH[self.boot_sector_state.fatfs_type])
+        fatfs_type = self.fat_table.fatfs_type if self.fat_table is not None else self.boot_sector_state.fatfs_type
+        self.set_in_fat(self.ALLOCATED_BLOCK_SWITCH[fatfs_type])
 
         cluster_start = self.cluster_data_address
         dir_size = get_dir_size(self.is_root, self.boot_sector_state)
@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: 2021-2022 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
 
+import struct
 from typing import List, Optional, Union
 
 from construct import Const, Int8ul, Int16ul, Int32ul, PaddedString, Struct
@@ -62,6 +63,13 @@ class Entry:
         'DIR_FileSize' / Int32ul,
     )
 
+    # precompiled layouts of ENTRY_FORMAT_SHORT_NAME and of the long name entry used for building the entries,
+    # the construct definitions above (and _build_entry_reference) remain the reference implementation
+    SHORT_ENTRY_STRUCT = struct.Struct('<8s3sBBBHHHHHHHI')
+    LONG_ENTRY_STRUCT = struct.Struct('<B10sBBB12sH4s')
+    FILE_SIZE_STRUCT = struct.Struct('<I')
+    DIR_FILE_SIZE_IDX: int = 28
+
     def __init__(self,
                  entry_id: int,
                  parent_dir_entries_address: int,
@@ -87,12 +95,50 @@ class Entry:
         return entry_
 
     @staticmethod
-    def _build_entry(**kwargs) -> bytes:  # type: ignore
+    def _build_entry_reference(**kwargs) -> bytes:  # type: ignore
         entry_: bytes = Entry.ENTRY_FORMAT_SHORT_NAME.build(dict(**kwargs))
         return entry_
 
+    @staticmethod
+    def _build_entry(**kwargs) -> bytes:  # type: ignore
+        """
+        Builds the short entry using the precompiled struct, the result is the same as of _build_entry_reference.
+        """
+        name_: bytes = kwargs['DIR_Name'].encode(SHORT_NAMES_ENCODING)
+        extension_: bytes = kwargs['DIR_Name_ext'].encode(SHORT_NAMES_ENCODING)
+        if len(name_) > MAX_NAME_SIZE or len(extension_) > MAX_EXT_SIZE:
+            # the encoded name doesn't fit, let construct report the error
+            return Entry._build_entry_reference(**kwargs)
+        entry_: bytes = Entry.SHORT_ENTRY_STRUCT.pack(name_,
+                                                      extension_,
+                                                      kwargs['DIR_Attr'],
+                                                      kwargs['DIR_NTRes'],
+                                                      0,  # DIR_CrtTimeTenth
+                                                      kwargs['DIR_CrtTime'],
+                                                      kwargs['DIR_CrtDate'],
+                                                      kwargs['DIR_LstAccDate'],
+                                                      0,  # DIR_FstClusHI
+                                                      kwargs['DIR_WrtTime'],
+                                                      kwargs['DIR_WrtDate'],
+                                                      kwargs['DIR_FstClusLO'],
+                                                      kwargs['DIR_FileSize'])
+        return entry_
+
     @staticmethod
     def _build_entry_long(names: List[bytes], checksum: int, order: int, is_last: bool) -> bytes:
+        """
+        Builds the long entry using the precompiled struct, the result is the same as of _build_entry_long_reference.
+        """
+        assert [len(name_) for name_ in names] == [2 * Entry.LDIR_Name1_SIZE,
+                                                    2 * Entry.LDIR_Name2_SIZE,
+                                                    2 * Entry.LDIR_Name3_SIZE]
+        order |= (Entry.LAST_RECORD_LFN_ENTRY if is_last else 0x00)
+        long_entry: bytes = Entry.LONG_ENTRY_STRUCT.pack(order, names[0], Entry.ATTR_LONG_NAME, 0, checksum,
+                                                         names[1], 0, names[2])
+        return long_entry
+
+    @staticmethod
+    def _build_entry_long_reference(names: List[bytes], checksum: int, order: int, is_last: bool) -> bytes:
         """
         Long entry starts with 1 bytes of the order, if the entry is the last in the chain it is or-masked with 0x40,
         otherwise is without change (or masked with 0x00). The following example shows 3 entries:
@@ -245,9 +291,8 @@ class Entry:
         :param content_size: the new size of the file content in bytes
         :returns: None
 
-        This method parses the binary entry to the construct structure, updates the content size of the file
-        and builds new binary entry.
+        This method updates the content size of the file directly in the binary entry.
         """
-        parsed_entry = self._parse_entry(self.entry_bytes)
-        parsed_entry.DIR_FileSize = content_size  # type: ignore
-        self.entry_bytes = Entry.ENTRY_FORMAT_SHORT_NAME.build(parsed_entry)
+        Entry.FILE_SIZE_STRUCT.pack_into(self.fatfs_state.binary_image,
+                                         self.entry_address + Entry.DIR_FILE_SIZE_IDX,
+                                         content_size)
@@ -1,11 +1,13 @@
 # SPDX-FileCopyrightText: 2021-2022 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import List, Optional
+from typing import Iterator, Optional, Tuple
 
 from .cluster import Cluster
 from .exceptions import NoFreeClusterException
+from .fat_table import ClusterList, FATTable
 from .fatfs_state import BootSectorState
+from .utils import RESERVED_CLUSTERS_COUNT
 
 
 class FAT:
@@ -24,10 +26,12 @@ class FAT:
     def __init__(self, boot_sector_state: BootSectorState, init_: bool) -> None:
         self._first_free_cluster_id = 1
         self.boot_sector_state = boot_sector_state
-        self.clusters: List[Cluster] = [Cluster(cluster_id=i,
-                                                boot_sector_state=self.boot_sector_state,
-                                                init_=init_) for i in range(self.boot_sector_state.clusters)]
+        # the values of the FAT are kept in a compact table, Cluster objects are created only for accessed clusters
+        self.table: FATTable = FATTable(boot_sector_state=self.boot_sector_state)
+        self.clusters: ClusterList = ClusterList(self.table)
         if init_:
+            # First cluster in FAT is reserved, low 8 bits contains BPB_Media and the rest is filled with 1
+            self.table.set(Cluster.RESERVED_BLOCK_ID, Cluster.INITIAL_BLOCK_SWITCH[self.table.fatfs_type])
             self.allocate_root_dir()
 
     def get_cluster_value(self, cluster_id_: int) -> int:
@@ -39,7 +43,7 @@ class FAT:
         The reserved value is 0xFF8, the value of first cluster if 0xFFF, thus is last in chain,
         and the value of the second cluster is 0x555, so refers to the cluster number 0x555.
         """
-        fat_cluster_value_: int = self.clusters[cluster_id_].get_from_fat()
+        fat_cluster_value_: int = self.table.get(cluster_id_)
         return fat_cluster_value_
 
     def is_cluster_last(self, cluster_id_: int) -> bool:
@@ -48,7 +52,7 @@ class FAT:
         0xFFF for FAT12, 0xFFFF for FAT16 or 0xFFFFFFFF for FAT32, the cluster is the last.
         """
         value_ = self.get_cluster_value(cluster_id_)
-        is_cluster_last_: bool = value_ == (1 << self.boot_sector_state.fatfs_type) - 1
+        is_cluster_last_: bool = value_ == self.table.max_value
         return is_cluster_last_
 
     def get_chained_content(self, cluster_id_: int, size: Optional[int] = None) -> bytearray:
@@ -58,14 +62,12 @@ class FAT:
         traverses linked list of clusters and append partial results to the content.
         """
         binary_image: bytearray = self.boot_sector_state.binary_image
+        sector_size: int = self.boot_sector_state.sector_size
 
-        data_address_ = Cluster.compute_cluster_data_address(self.boot_sector_state, cluster_id_)
-        content_ = binary_image[data_address_: data_address_ + self.boot_sector_state.sector_size]
-
-        while not self.is_cluster_last(cluster_id_):
-            cluster_id_ = self.get_cluster_value(cluster_id_)
-            data_address_ = Cluster.compute_cluster_data_address(self.boot_sector_state, cluster_id_)
-            content_ += binary_image[data_address_: data_address_ + self.boot_sector_state.sector_size]
+        content_: bytearray = bytearray()
+        for run_start, run_length in self.chain_runs(cluster_id_):
+            data_address_ = Cluster.compute_cluster_data_address(self.boot_sector_state, run_start)
+            content_ += binary_image[data_address_: data_address_ + run_length * sector_size]
         # the size is None if the object is directory
         if size is None:
             return content_
@@ -79,11 +81,11 @@ class FAT:
         might the method cause `Out of space` error despite there would be free clusters.
         """
 
-        if self._first_free_cluster_id + 1 >= len(self.clusters):
+        if self._first_free_cluster_id + 1 >= len(self.table):
             raise NoFreeClusterException('No free cluster available!')
-        cluster = self.clusters[self._first_free_cluster_id + 1]
-        if not cluster.is_empty:
+        if self.table.get(self._first_free_cluster_id + 1) != 0x00:
             raise NoFreeClusterException('No free cluster available!')
+        cluster = self.clusters[self._first_free_cluster_id + 1]
         cluster.allocate_cluster()
         self._first_free_cluster_id += 1
         return cluster
@@ -98,3 +100,37 @@ class FAT:
             current.next_cluster = free_cluster
             current.set_in_fat(free_cluster.id)
             current = free_cluster
+
+    def allocate_run(self, first_cluster: Optional[Cluster], size: int) -> None:
+        """
+        Allocates the clusters needed for the file in addition to its first cluster as one run of contiguous
+        clusters, the chain links are written in a single pass. Unlike `allocate_chain` the data region
+        of the clusters is not cleaned, the content is expected to be written over the whole run.
+        The resulting FAT is the same as the one created by `allocate_chain`.
+        """
+        if first_cluster is None or size <= 1:
+            return
+        count: int = size - 1
+        start: int = self._first_free_cluster_id + 1
+        if start + count > len(self.table) or any(self.table.values[start:start + count]):
+            raise NoFreeClusterException('No free cluster available!')
+        self.table.set_run(start, count)
+        first_cluster.set_in_fat(start)
+        self._first_free_cluster_id = start + count - 1
+
+    def chain_runs(self, cluster_id_: int) -> Iterator[Tuple[int, int]]:
+        """
+        Traverses the chain of clusters starting with `cluster_id_` in FAT
+        and yields (first cluster id, number of clusters) for every run of consecutive clusters.
+        """
+        values = self.table.values
+        run_start: int = cluster_id_
+        while True:
+            next_id: int = values[cluster_id_]
+            if next_id == cluster_id_ + 1:
+                cluster_id_ = next_id
+                continue
+            yield run_start, cluster_id_ - run_start + 1
+            if not RESERVED_CLUSTERS_COUNT <= next_id < len(values):
+                return
+            run_start = cluster_id_ = next_id
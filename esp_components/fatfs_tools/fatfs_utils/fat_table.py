@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2021-2024 Espressif Systems (Shanghai) CO LTD
+# SPDX-License-Identifier: Apache-2.0
+
+from array import array
+from sys import byteorder
+from typing import Dict, Iterator, List, Union
+
+from .cluster import Cluster
+from .fatfs_state import BootSectorState
+from .utils import FAT12, FAT16
+
+
+class FATTable:
+    """
+    Compact representation of the FAT region.
+    The values of all FAT entries are mirrored in an array (two bytes per cluster),
+    changes are encoded directly into the FAT region of the binary image.
+    """
+
+    def __init__(self, boot_sector_state: BootSectorState) -> None:
+        self.boot_sector_state: BootSectorState = boot_sector_state
+        # the properties of the boot sector state are recomputed on every access, cache the ones used per entry
+        self.fatfs_type: int = boot_sector_state.fatfs_type
+        self.fat_start: int = boot_sector_state.fat_table_start_address
+        self.max_value: int = (1 << self.fatfs_type) - 1
+        self.values: array = self._decode(boot_sector_state.clusters)
+
+    def _decode(self, clusters_cnt: int) -> array:
+        """
+        Loads the values of the first FAT in the binary image (all zeros for a newly created image).
+        """
+        bin_img_: bytearray = self.boot_sector_state.binary_image
+        values: array = array('H')
+        if self.fatfs_type == FAT16:
+            values.frombytes(bytes(bin_img_[self.fat_start:self.fat_start + 2 * clusters_cnt]))
+            if byteorder == 'big':
+                values.byteswap()
+            return values
+        if self.fatfs_type == FAT12:
+            fat_bytes = bytes(bin_img_[self.fat_start:self.fat_start + (3 * clusters_cnt + 1) // 2 + 1])
+            for i in range(clusters_cnt):
+                address: int = i + (i >> 1)
+                pair: int = fat_bytes[address] | (fat_bytes[address + 1] << 8)
+                values.append(pair >> 4 if i & 1 else pair & 0xFFF)
+            return values
+        raise NotImplementedError('Only valid fatfs types are FAT12 and FAT16.')
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, cluster_id: int) -> int:
+        return self.values[cluster_id]
+
+    def set(self, cluster_id: int, value: int) -> None:
+        """
+        Sets the FAT entry of the cluster to the value and encodes it into the binary image.
+        FAT12 entries take one and half byte: the even entry owns the first byte and the low half of the second one,
+        the odd entry owns the high half of the first byte and the second byte.
+        """
+        # value must fit into number of bits of the fat (12 or 16)
+        assert value <= self.max_value
+        bin_img_: bytearray = self.boot_sector_state.binary_image
+        if self.fatfs_type == FAT12:
+            address: int = self.fat_start + cluster_id + (cluster_id >> 1)
+            if cluster_id & 1:
+                bin_img_[address] = (bin_img_[address] & 0x0F) | ((value & 0x0F) << 4)
+                bin_img_[address + 1] = value >> 4
+            else:
+                bin_img_[address] = value & 0xFF
+                bin_img_[address + 1] = (bin_img_[address + 1] & 0xF0) | (value >> 8)
+        elif self.fatfs_type == FAT16:
+            address = self.fat_start + 2 * cluster_id
+            bin_img_[address] = value & 0xFF
+            bin_img_[address + 1] = value >> 8
+        else:
+            raise NotImplementedError('Only valid fatfs types are FAT12 and FAT16.')
+        self.values[cluster_id] = value
+
+    def set_run(self, start: int, count: int) -> None:
+        """
+        Links `count` consecutive clusters starting with `start` into a chain in a single pass,
+        each cluster points to the following one and the last one is marked as the end of the chain.
+        FAT16 entries are written as one slice, FAT12 entries are packed in pairs (three bytes per two entries),
+        only an odd first entry and an unpaired last entry are encoded one by one.
+        """
+        if count <= 0:
+            return
+        links: array = array('H', range(start + 1, start + count))
+        links.append(self.max_value)
+        bin_img_: bytearray = self.boot_sector_state.binary_image
+        if self.fatfs_type == FAT16:
+            encoded: array = array('H', links)
+            if byteorder == 'big':
+                encoded.byteswap()
+            address: int = self.fat_start + 2 * start
+            bin_img_[address:address + 2 * count] = encoded.tobytes()
+            self.values[start:start + count] = links
+            return
+        if self.fatfs_type != FAT12:
+            raise NotImplementedError('Only valid fatfs types are FAT12 and FAT16.')
+
+        first: int = 0
+        if start & 1:
+            # the odd entry shares its first byte with the preceding entry
+            self.set(start, links[0])
+            first = 1
+        pairs: int = (count - first) // 2
+        if pairs:
+            even: array = links[first:first + 2 * pairs:2]
+            odd: array = links[first + 1:first + 2 * pairs:2]
+            packed: bytearray = bytearray(3 * pairs)
+            packed[0::3] = bytes(value & 0xFF for value in even)
+            packed[1::3] = bytes((low >> 8) | ((high & 0x0F) << 4) for low, high in zip(even, odd))
+            packed[2::3] = bytes(value >> 4 for value in odd)
+            cluster_id: int = start + first
+            address = self.fat_start + cluster_id + (cluster_id >> 1)
+            bin_img_[address:address + 3 * pairs] = packed
+            self.values[cluster_id:cluster_id + 2 * pairs] = links[first:first + 2 * pairs]
+        if (count - first) & 1:
+            # the last even entry shares its second byte with the following entry
+            self.set(start + count - 1, links[count - 1])
+
+class ClusterList:
+    """
+    Sequence of the clusters of the FAT, the Cluster objects are created only when they are accessed.
+    """
+
+    def __init__(self, table: FATTable) -> None:
+        self.table: FATTable = table
+        self._clusters: Dict[int, Cluster] = {}
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _get(self, cluster_id: int) -> Cluster:
+        cluster = self._clusters.get(cluster_id)
+        if cluster is None:
+            cluster = Cluster(cluster_id=cluster_id,
+                              boot_sector_state=self.table.boot_sector_state,
+                              init_=False,
+                              fat_table=self.table)
+            self._clusters[cluster_id] = cluster
+        return cluster
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Cluster, List[Cluster]]:
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Cluster index out of range')
+        return self._get(index)
+
+    def __iter__(self) -> Iterator[Cluster]:
+        for cluster_id in range(len(self)):
+            yield self._get(cluster_id)
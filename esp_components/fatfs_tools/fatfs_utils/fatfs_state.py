@@ -31,7 +31,8 @@ class FATFSState:
                  file_sys_type: str,
                  use_default_datetime: bool,
                  explicit_fat_type: Optional[int] = None,
-                 long_names_enabled: bool = False):
+                 long_names_enabled: bool = False,
+                 volume_uuid: int = -1):
         self.boot_sector_state = BootSectorState(oem_name=oem_name,
                                                  sector_size=sector_size,
                                                  sectors_per_cluster=sectors_per_cluster,
@@ -45,7 +46,7 @@ class FATFSState:
                                                  hidden_sectors=hidden_sectors,
                                                  volume_label=volume_label,
                                                  file_sys_type=file_sys_type,
-                                                 volume_uuid=-1)
+                                                 volume_uuid=volume_uuid)
 
         self._explicit_fat_type: Optional[int] = explicit_fat_type
         self.long_names_enabled: bool = long_names_enabled
@@ -3,18 +3,18 @@
 
 import os
 from datetime import datetime
-from typing import List, Optional, Tuple, Union
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 from .entry import Entry
 from .exceptions import FatalError, WriteDirectoryException
 from .fat import FAT, Cluster
 from .fatfs_state import FATFSState
-from .long_filename_utils import (build_lfn_full_name, build_lfn_unique_entry_name_order,
-                                  get_required_lfn_entries_count, split_name_to_lfn_entries,
+from .long_filename_utils import (build_lfn_full_name, get_required_lfn_entries_count,
+                                  lfn_unique_entry_name_order, split_name_to_lfn_entries,
                                   split_name_to_lfn_entry_blocks)
 from .utils import (DATETIME, INVALID_SFN_CHARS_PATTERN, MAX_EXT_SIZE, MAX_NAME_SIZE, FATDefaults,
-                    build_lfn_short_entry_name, build_name, lfn_checksum, required_clusters_count,
-                    split_content_into_sectors, split_to_name_and_extension)
+                    build_lfn_short_entry_name, build_name, lfn_checksum, required_clusters_count_by_size,
+                    split_to_name_and_extension)
 
 
 class File:
@@ -23,6 +23,7 @@ class File:
     """
     ATTR_ARCHIVE: int = 0x20
     ENTITY_TYPE: int = ATTR_ARCHIVE
+    READ_CHUNK_SIZE: int = 0x100000
 
     def __init__(self, name: str, fat: FAT, fatfs_state: FATFSState, entry: Entry, extension: str = '') -> None:
         self.name: str = name
@@ -49,18 +50,64 @@ class File:
         equals_: bool = build_name(name, extension) == build_name(self.name, self.extension)
         return equals_
 
-    def write(self, content: bytes) -> None:
-        self.entry.update_content_size(len(content))
+    def _data_views(self, size: int) -> Iterator[memoryview]:
+        """
+        Yields writable views of the data region holding the first `size` bytes of the file content,
+        one view per run of consecutive clusters. The rest of the last sector is cleaned,
+        the same way as the cluster allocation does.
+        """
+        self.entry.update_content_size(size)
+        if size == 0:
+            return
         # we assume that the correct amount of clusters is allocated
-        current_cluster = self._first_cluster
-        for content_part in split_content_into_sectors(content, self.fatfs_state.boot_sector_state.sector_size):
-            content_as_list = content_part
-            if current_cluster is None:
-                raise FatalError('No free space left!')
+        if self._first_cluster is None:
+            raise FatalError('No free space left!')
+
+        boot_sector_state = self.fatfs_state.boot_sector_state
+        sector_size: int = boot_sector_state.sector_size
+        image_view = memoryview(self.fatfs_state.binary_image)
+        written: int = 0
+        for run_start, run_length in self.fat.chain_runs(self._first_cluster.id):
+            address: int = Cluster.compute_cluster_data_address(boot_sector_state, run_start)
+            part_size: int = min(run_length * sector_size, size - written)
+            yield image_view[address: address + part_size]
+            written += part_size
+            if written == size:
+                content_end: int = address + part_size
+                padding: int = -part_size % sector_size
+                image_view[content_end: content_end + padding] = bytes(padding)
+                return
+        raise FatalError('No free space left!')
 
-            address: int = current_cluster.cluster_data_address
-            self.fatfs_state.binary_image[address: address + len(content_part)] = content_as_list
-            current_cluster = current_cluster.next_cluster
+    def write(self, content: bytes) -> None:
+        """
+        Writes the content into the clusters of the file, one slice assignment per run of consecutive clusters.
+        """
+        content_view = memoryview(content)
+        position: int = 0
+        for data_view in self._data_views(len(content_view)):
+            data_view[:] = content_view[position: position + len(data_view)]
+            position += len(data_view)
+
+    def write_stream(self, stream: BinaryIO, size: int) -> None:
+        """
+        Reads `size` bytes of the content from the binary stream straight into the clusters of the file,
+        in chunks of at most READ_CHUNK_SIZE bytes, so the content is never held in memory as a whole.
+        """
+        readinto = getattr(stream, 'readinto', None)
+        for data_view in self._data_views(size):
+            position: int = 0
+            while position < len(data_view):
+                chunk_view = data_view[position: position + self.READ_CHUNK_SIZE]
+                if readinto is not None:
+                    count = readinto(chunk_view)
+                else:
+                    chunk: bytes = stream.read(len(chunk_view))
+                    count = len(chunk)
+                    chunk_view[:count] = chunk
+                if not count:
+                    raise FatalError('The content is shorter than its declared size!')
+                position += count
 
 
 class Directory:
@@ -101,6 +148,13 @@ class Directory:
         self.entities: List[Union[File, Directory]] = []  # type: ignore
         self._entry = entry  # currently not in use (will use later for e.g. modification time, etc.)
 
+        # indexes of the entities, updated lazily from self.entities (see _update_index)
+        self._indexed_entities_cnt: int = 0
+        self._entities_by_name: Dict[str, Union[File, Directory]] = {}  # type: ignore
+        self._prefix_counts: Dict[str, int] = {}
+        # entries are never released, so all the entries before the cursor are allocated
+        self._free_entry_cursor: int = 0
+
     @property
     def is_root(self) -> bool:
         return self.parent is self
@@ -142,11 +196,29 @@ class Directory:
                                     entity_extension='',
                                     entity_type=dir_id.ENTITY_TYPE)
 
+    def _update_index(self) -> None:
+        """
+        Adds the entities appended since the last call to the indexes by name and by the 6 characters prefix
+        """
+        for entity in self.entities[self._indexed_entities_cnt:]:
+            # the first entity with the name wins, the same way as in the linear search
+            self._entities_by_name.setdefault(build_name(entity.name, entity.extension), entity)
+            prefix: str = entity.name[:6]
+            self._prefix_counts[prefix] = self._prefix_counts.get(prefix, 0) + 1
+        self._indexed_entities_cnt = len(self.entities)
+
     def lookup_entity(self, object_name: str, extension: str):  # type: ignore
-        for entity in self.entities:
-            if build_name(entity.name, entity.extension) == build_name(object_name, extension):
-                return entity
-        return None
+        if self._indexed_entities_cnt != len(self.entities):
+            self._update_index()
+        return self._entities_by_name.get(build_name(object_name, extension))
+
+    def lfn_unique_entry_name_order(self, lfn_entry_name: str) -> int:
+        """
+        Same as build_lfn_unique_entry_name_order(self.entities, lfn_entry_name), using the prefix counters
+        """
+        if self._indexed_entities_cnt != len(self.entities):
+            self._update_index()
+        return lfn_unique_entry_name_order(self._prefix_counts.get(lfn_entry_name[:6], 0))
 
     @staticmethod
     def _is_end_of_path(path_as_list: List[str]) -> bool:
@@ -169,9 +241,12 @@ class Directory:
         return self.recursive_search(path_as_list[1:], next_obj)
 
     def find_free_entry(self) -> Optional[Entry]:
-        for entry in self.entries:
+        entries_cnt: int = len(self.entries)
+        while self._free_entry_cursor < entries_cnt:
+            entry: Entry = self.entries[self._free_entry_cursor]
             if entry.is_empty:
                 return entry
+            self._free_entry_cursor += 1
         return None
 
     def _extend_directory(self) -> None:
@@ -207,7 +282,7 @@ class Directory:
                                   time):
         # type: (Entry, str, str, Directory, int, int, DATETIME, DATETIME) -> Entry
         lfn_full_name: str = build_lfn_full_name(name, extension)
-        lfn_unique_entry_order: int = build_lfn_unique_entry_name_order(target_dir.entities, name)
+        lfn_unique_entry_order: int = target_dir.lfn_unique_entry_name_order(name)
         lfn_short_entry_name: str = build_lfn_short_entry_name(name, extension, lfn_unique_entry_order)
         checksum: int = lfn_checksum(lfn_short_entry_name)
         entries_count: int = get_required_lfn_entries_count(lfn_full_name)
@@ -324,6 +399,19 @@ class Directory:
         directory.init_directory()
         target_dir.entities.append(directory)
 
+    def _file_to_write(self, path: List[str], size: int) -> File:
+        """
+        Finds the file in the directory structure and allocates the clusters for the content of the given size.
+
+        :raises WriteDirectoryException: raised is the target object for writing is a directory
+        """
+        entity_to_write: Entry = self.recursive_search(path, self)
+        if not isinstance(entity_to_write, File):
+            raise WriteDirectoryException(f'`{os.path.join(*path)}` is a directory!')
+        clusters_cnt: int = required_clusters_count_by_size(self.fatfs_state.boot_sector_state.sector_size, size)
+        self.fat.allocate_run(entity_to_write.first_cluster, clusters_cnt)
+        return entity_to_write
+
     def write_to_file(self, path: List[str], content: bytes) -> None:
         """
         Writes to file existing in the directory structure.
@@ -333,11 +421,16 @@ class Directory:
         :returns: None
         :raises WriteDirectoryException: raised is the target object for writing is a directory
         """
-        entity_to_write: Entry = self.recursive_search(path, self)
-        if isinstance(entity_to_write, File):
-            clusters_cnt: int = required_clusters_count(cluster_size=self.fatfs_state.boot_sector_state.sector_size,
-                                                        content=content)
-            self.fat.allocate_chain(entity_to_write.first_cluster, clusters_cnt)
-            entity_to_write.write(content)
-        else:
-            raise WriteDirectoryException(f'`{os.path.join(*path)}` is a directory!')
+        self._file_to_write(path, len(content)).write(content)
+
+    def write_stream_to_file(self, path: List[str], stream: BinaryIO, size: int) -> None:
+        """
+        Writes to file existing in the directory structure, the content is read from the stream.
+
+        :param path: path split into the list
+        :param stream: binary stream positioned at the beginning of the content
+        :param size: size of the content in bytes, the clusters are allocated up front
+        :returns: None
+        :raises WriteDirectoryException: raised is the target object for writing is a directory
+        """
+        self._file_to_write(path, size).write_stream(stream, size)
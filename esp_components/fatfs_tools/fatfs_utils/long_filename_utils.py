@@ -76,10 +76,19 @@ def build_lfn_unique_entry_name_order(entities: list, lfn_entry_name: str) -> in
     E.g. the file in directory 'thisisverylongfilenama.txt' will be named 'THISIS~1TXT' in its short entry.
     If we add another file 'thisisverylongfilenamax.txt' its name in the short entry will be 'THISIS~2TXT'.
     """
-    preceding_entries: int = 1
+    same_prefix_count: int = 0
     for entity in entities:
         if entity.name[:6] == lfn_entry_name[:6]:
-            preceding_entries += 1
+            same_prefix_count += 1
+    return lfn_unique_entry_name_order(same_prefix_count)
+
+
+def lfn_unique_entry_name_order(same_prefix_count: int) -> int:
+    """
+    Returns the order of the new short entry name given the number of the names within the directory
+    starting with the same 6 characters (see build_lfn_unique_entry_name_order).
+    """
+    preceding_entries: int = same_prefix_count + 1
     if preceding_entries > MAXIMAL_FILES_SAME_PREFIX:
         raise NoFreeClusterException('Maximal number of files with the same prefix is 127')
     return preceding_entries
@@ -9,6 +9,7 @@ from datetime import datetime
 from typing import List
 from typing import Optional
 from typing import Tuple
+from typing import Union
 
 from construct import BitsInteger
 from construct import BitStruct
@@ -96,7 +97,41 @@ def get_fat_sectors_count(clusters_count: int, sector_size: int) -> int:
 
 def required_clusters_count(cluster_size: int, content: bytes) -> int:
     # compute number of required clusters for file text
-    return (len(content) + cluster_size - 1) // cluster_size
+    return required_clusters_count_by_size(cluster_size, len(content))
+
+
+def required_clusters_count_by_size(cluster_size: int, size: int) -> int:
+    return (size + cluster_size - 1) // cluster_size
+
+
+def merge_extents(extents: List[Tuple[int, int]], alignment: int = 1) -> List[Tuple[int, int]]:
+    """
+    Aligns (address, size) extents outwards to `alignment` and merges the overlapping or adjacent ones.
+
+    :returns: sorted list of disjoint (address, size) extents
+    """
+    merged: List[List[int]] = []
+    for address, size in sorted(extents):
+        if size <= 0:
+            continue
+        start = address - address % alignment
+        end = (address + size + alignment - 1) // alignment * alignment
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end - start) for start, end in merged]
+
+
+def fill_buffer(buffer: Union[bytearray, memoryview], start: int, end: int, value: bytes,
+                chunk_size: int = 0x10000) -> None:
+    """
+    Fills buffer[start:end] with the byte value in place, chunk by chunk so no temporary of the range size is created.
+    """
+    chunk: bytes = value * min(chunk_size, max(end - start, 0))
+    for chunk_start in range(start, end, chunk_size):
+        chunk_end: int = min(chunk_start + chunk_size, end)
+        buffer[chunk_start:chunk_end] = chunk[:chunk_end - chunk_start]
 
 
 def generate_4bytes_random() -> int:
@@ -201,6 +236,11 @@ def get_args_for_partition_generator(desc: str, wl: bool) -> argparse.Namespace:
                         action='store_true',
                         help='For test purposes. If the flag is set the files are created with '
                              'the default timestamp that is the 1st of January 1980')
+    parser.add_argument('--deterministic',
+                        action='store_true',
+                        help='Generate a reproducible image: the files are created with the default timestamp '
+                             'and the random volume ID' + (' and WL device ID' if wl else '') +
+                             ' are replaced by fixed values, so the same input gives the same image')
     parser.add_argument('--fat_type',
                         default=0,
                         type=int,
@@ -268,7 +308,8 @@ def build_date_entry(year: int, mon: int, mday: int) -> int:
     assert year in range(FATFS_INCEPTION_YEAR, FATFS_INCEPTION_YEAR + FATFS_MAX_YEARS)
     assert mon in range(1, FATFS_MAX_MONTHS + 1)
     assert mday in range(1, FATFS_MAX_DAYS + 1)
-    return int.from_bytes(DATE_ENTRY.build(dict(year=year - FATFS_INCEPTION_YEAR, month=mon, day=mday)), 'big')
+    # the same bit layout as DATE_ENTRY (7 bits year, 4 bits month, 5 bits day), packed arithmetically
+    return ((year - FATFS_INCEPTION_YEAR) << 9) | (mon << 5) | mday
 
 
 def build_time_entry(hour: int, minute: int, sec: int) -> int:
@@ -282,10 +323,8 @@ def build_time_entry(hour: int, minute: int, sec: int) -> int:
     assert hour in range(FATFS_MAX_HOURS)
     assert minute in range(FATFS_MAX_MINUTES)
     assert sec in range(FATFS_MAX_SECONDS)
-    return int.from_bytes(TIME_ENTRY.build(
-        dict(hour=hour, minute=minute, second=sec // FATFS_SECONDS_GRANULARITY)),
-        byteorder='big'
-    )
+    # the same bit layout as TIME_ENTRY (5 bits hour, 6 bits minute, 5 bits second), packed arithmetically
+    return (hour << 11) | (minute << 5) | (sec // FATFS_SECONDS_GRANULARITY)
 
 
 class FATDefaults:
@@ -313,3 +352,7 @@ class FATDefaults:
     WR_SIZE: int = 16
     # wear leveling metadata (config sector) contains always sector size 4096
     WL_SECTOR_SIZE: int = 4096
+
+    # identifiers used instead of the random ones when the image is generated in the deterministic mode
+    VOLUME_ID: int = 0x45535046
+    DEVICE_ID: int = 0x45535046
@@ -2,12 +2,18 @@
 # SPDX-FileCopyrightText: 2021-2024 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
 import os
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Any
+from typing import BinaryIO
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
 from fatfs_utils.boot_sector import BootSector
+from fatfs_utils.cluster import Cluster
 from fatfs_utils.exceptions import NoFreeClusterException
 from fatfs_utils.fat import FAT
 from fatfs_utils.fatfs_state import FATFSState
@@ -20,8 +26,9 @@ from fatfs_utils.utils import FATFS_MIN_ALLOC_UNIT
 from fatfs_utils.utils import get_args_for_partition_generator
 from fatfs_utils.utils import get_fat_sectors_count
 from fatfs_utils.utils import get_non_data_sectors_cnt
+from fatfs_utils.utils import merge_extents
 from fatfs_utils.utils import read_filesystem
-from fatfs_utils.utils import required_clusters_count
+from fatfs_utils.utils import required_clusters_count_by_size
 from fatfs_utils.utils import RESERVED_CLUSTERS_COUNT
 
 
@@ -29,7 +36,11 @@ def duplicate_fat_decorator(func):  # type: ignore
     def wrapper(self, *args, **kwargs) -> None:  # type: ignore
         func(self, *args, **kwargs)
         if isinstance(self, FATFS):
-            self.duplicate_fat()
+            if self._defer_fat_duplication:
+                # batched generation, the FAT is duplicated once the image is finalized (see flush_fat)
+                self._fat_dirty = True
+            else:
+                self.duplicate_fat()
     return wrapper
 
 
@@ -56,7 +67,20 @@ class FATFS:
                  file_sys_type: str = FATDefaults.FILE_SYS_TYPE,
                  root_entry_count: int = FATDefaults.ROOT_ENTRIES_COUNT,
                  explicit_fat_type: Optional[int] = None,
-                 media_type: int = FATDefaults.MEDIA_TYPE) -> None:
+                 media_type: int = FATDefaults.MEDIA_TYPE,
+                 binary_image_buffer: Optional[Union[bytearray, memoryview]] = None,
+                 volume_id: Optional[int] = None,
+                 deterministic: bool = False) -> None:
+        """
+        :param binary_image_buffer: writable buffer of the image size, the empty filesystem is generated into it
+            in place and all the changes are written there (e.g. a slice of the wear levelling image)
+        :param volume_id: volume serial number stored in the boot sector, random if None
+        :param deterministic: if True the same content always produces the same image: the entries get
+            the default timestamp and the volume ID defaults to FATDefaults.VOLUME_ID
+        """
+        if deterministic:
+            use_default_datetime = True
+            volume_id = FATDefaults.VOLUME_ID if volume_id is None else volume_id
         # root directory bytes should be aligned by sector size
         assert (int(root_entry_count) * BYTES_PER_DIRECTORY_ENTRY) % sector_size == 0
         # number of bytes in the root dir must be even multiple of BPB_BytsPerSec
@@ -80,10 +104,16 @@ class FATFS:
                                             long_names_enabled=long_names_enabled,
                                             volume_label=volume_label,
                                             oem_name=oem_name,
-                                            use_default_datetime=use_default_datetime)
-        binary_image: bytes = bytearray(
-            read_filesystem(binary_image_path) if binary_image_path else self.create_empty_fatfs())
-        self.state.binary_image = binary_image
+                                            use_default_datetime=use_default_datetime,
+                                            volume_uuid=-1 if volume_id is None else volume_id)
+        if binary_image_buffer is not None and not binary_image_path:
+            self.state.binary_image = self.create_empty_fatfs(binary_image_buffer)
+        else:
+            binary_image: bytes = bytearray(
+                read_filesystem(binary_image_path) if binary_image_path else self.create_empty_fatfs())
+            self.state.binary_image = binary_image
+        self._defer_fat_duplication: bool = False
+        self._fat_dirty: bool = False
 
         self.fat: FAT = FAT(boot_sector_state=self.state.boot_sector_state, init_=True)
 
@@ -151,9 +181,17 @@ class FATFS:
         """
         self.root_directory.write_to_file(path_from_root, content)
 
-    def create_empty_fatfs(self) -> Any:
+    @duplicate_fat_decorator
+    def write_content_from_stream(self, path_from_root: List[str], stream: BinaryIO, size: int) -> None:
+        """
+        Same as write_content, the content of the given size is read from the binary stream in bounded chunks
+        straight into the data region of the image
+        """
+        self.root_directory.write_stream_to_file(path_from_root, stream, size)
+
+    def create_empty_fatfs(self, binary_image_buffer: Optional[Union[bytearray, memoryview]] = None) -> Any:
         boot_sector_ = BootSector(boot_sector_state=self.state.boot_sector_state)
-        boot_sector_.generate_boot_sector()
+        boot_sector_.generate_boot_sector(binary_image_buffer)
         return boot_sector_.binary_image
 
     def duplicate_fat(self) -> None:
@@ -169,9 +207,48 @@ class FATFS:
                 self.state.binary_image[fat_start: fat_end]
             )
 
+    def flush_fat(self) -> None:
+        """
+        Duplicates the FAT if it was modified in the batched generation mode since the last duplication
+        """
+        if self._fat_dirty:
+            self._fat_dirty = False
+            self.duplicate_fat()
+
+    @contextmanager
+    def deferred_fat_duplication(self) -> Iterator[None]:
+        """
+        Batched generation mode: inside the context the modifying methods do not copy the first FAT
+        over the second one after every call, the FAT is duplicated once when the context is left.
+        The incremental API (calls outside the context) keeps duplicating after each call.
+        """
+        previous_mode: bool = self._defer_fat_duplication
+        self._defer_fat_duplication = True
+        try:
+            yield
+        finally:
+            self._defer_fat_duplication = previous_mode
+            if not previous_mode:
+                self.flush_fat()
+
     def write_filesystem(self, output_path: str) -> None:
+        self.flush_fat()
         with open(output_path, 'wb') as output:
-            output.write(bytearray(self.state.binary_image))
+            output.write(self.state.binary_image)
+
+    def allocation_map(self) -> List[Tuple[int, int]]:
+        """
+        Returns sorted (address, size) extents of the image that carry content:
+        the reserved sectors (boot sector), the FATs, the root directory and the allocated data clusters.
+        Everything else is a free data cluster, filled with 0xFF the same way as erased flash.
+        """
+        boot_sec_st = self.state.boot_sector_state
+        extents: List[Tuple[int, int]] = [(0, boot_sec_st.data_region_start)]
+        fat_values = self.fat.table.values
+        for cluster_id in range(RESERVED_CLUSTERS_COUNT, len(fat_values)):
+            if fat_values[cluster_id] != 0x00:
+                extents.append((Cluster.compute_cluster_data_address(boot_sec_st, cluster_id), boot_sec_st.sector_size))
+        return merge_extents(extents, boot_sec_st.sector_size)
 
     @duplicate_fat_decorator
     def _generate_partition_from_folder(self,
@@ -193,15 +270,15 @@ class FATFS:
 
         if os.path.isfile(real_path):
             with open(real_path, 'rb') as file:
-                content = file.read()
-            file_name, extension = os.path.splitext(split_path[-1])
-            extension = extension[1:]  # remove the dot from the extension
-            self.create_file(name=file_name,
-                             extension=extension,
-                             path_from_root=split_path[1:-1] or None,
-                             object_timestamp_=object_timestamp,
-                             is_empty=len(content) == 0)
-            self.write_content(split_path[1:], content)
+                content_size: int = os.fstat(file.fileno()).st_size
+                file_name, extension = os.path.splitext(split_path[-1])
+                extension = extension[1:]  # remove the dot from the extension
+                self.create_file(name=file_name,
+                                 extension=extension,
+                                 path_from_root=split_path[1:-1] or None,
+                                 object_timestamp_=object_timestamp,
+                                 is_empty=content_size == 0)
+                self.write_content_from_stream(split_path[1:], file, content_size)
         elif os.path.isdir(real_path):
             if not is_dir:
                 self.create_directory(name=split_path[-1],
@@ -218,7 +295,8 @@ class FATFS:
         Normalize path to folder and recursively encode folder to binary image
         """
         path_to_folder, folder_name = os.path.split(input_directory)
-        self._generate_partition_from_folder(folder_name, folder_path=path_to_folder, is_dir=True)
+        with self.deferred_fat_duplication():
+            self._generate_partition_from_folder(folder_name, folder_path=path_to_folder, is_dir=True)
 
 
 def calculate_min_space(path: List[str],
@@ -227,9 +305,7 @@ def calculate_min_space(path: List[str],
                         long_file_names: bool = False,
                         is_root: bool = False) -> int:
     if os.path.isfile(os.path.join(*path, fs_entity)):
-        with open(os.path.join(*path, fs_entity), 'rb') as file_:
-            content = file_.read()
-        res: int = required_clusters_count(sector_size, content)
+        res: int = required_clusters_count_by_size(sector_size, os.stat(os.path.join(*path, fs_entity)).st_size)
         return res
     buff: int = 0
     dir_size = 2 * FATDefaults.ENTRY_SIZE  # record for symlinks "." and ".."
@@ -270,7 +346,8 @@ def main() -> None:
                   long_names_enabled=args.long_name_support,
                   use_default_datetime=args.use_default_datetime,
                   root_entry_count=args.root_entry_count,
-                  explicit_fat_type=args.fat_type)
+                  explicit_fat_type=args.fat_type,
+                  deterministic=args.deterministic)
 
     fatfs.generate(args.input_directory)
     fatfs.write_filesystem(args.output_file)
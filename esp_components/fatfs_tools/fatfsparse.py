@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+"""
+Read-only access to FAT images generated by fatfsgen.py/wl_fatfsgen.py (or read back from a device).
+
+The image is mapped into memory (mmap), the wear levelling layer is stripped with `remove_wl`
+when present, the directories are listed with long file names support and the files are read,
+hashed or extracted by walking their cluster chains in FAT.
+
+Example::
+
+    with FATFSReader.open('temp/storage_dl.bin') as reader:
+        for path, entry in reader.walk():
+            print(path, entry.size, reader.file_digest(path))
+
+Command line::
+
+    python fatfsparse.py storage_dl.bin --wl-layer detect --list --extract out_dir
+"""
+import argparse
+import hashlib
+import mmap
+import os
+from typing import Any
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from fatfs_utils.boot_sector import BootSector
+from fatfs_utils.cluster import Cluster
+from fatfs_utils.entry import Entry
+from fatfs_utils.exceptions import FatalError
+from fatfs_utils.fat_table import FATTable
+from fatfs_utils.fatfs_state import BootSectorState
+from fatfs_utils.utils import FATDefaults
+from fatfs_utils.utils import lfn_checksum
+from fatfs_utils.utils import RESERVED_CLUSTERS_COUNT
+from wl_fatfsgen import remove_wl
+
+ImageBuffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# the first byte of the name of the deleted entry and of the entry ending the directory
+DELETED_ENTRY_MARK: int = 0xE5
+END_OF_DIRECTORY_MARK: int = 0x00
+# DIR_NTRes flags of the short entry, the name and the extension are displayed in lower case
+NTRES_LOWER_NAME: int = 0x08
+NTRES_LOWER_EXTENSION: int = 0x10
+
+
+class DirectoryEntry(NamedTuple):
+    """
+    The entity recorded in the directory, the name is the long name if present, otherwise the short one.
+    """
+    name: str
+    short_name: str
+    attributes: int
+    first_cluster: int
+    size: int
+
+    @property
+    def is_directory(self) -> bool:
+        return bool(self.attributes & Entry.ATTR_DIRECTORY)
+
+
+def _short_name(name_: bytes, extension_: bytes, ntres: int) -> str:
+    name: str = name_.decode('latin-1').rstrip(' ')
+    extension: str = extension_.decode('latin-1').rstrip(' ')
+    if ntres & NTRES_LOWER_NAME:
+        name = name.lower()
+    if ntres & NTRES_LOWER_EXTENSION:
+        extension = extension.lower()
+    return f'{name}.{extension}' if extension else name
+
+
+class FATFSReader:
+    """
+    The class FATFSReader provides read-only API for the plain or wear levelled FAT image.
+    """
+
+    def __init__(self, image: ImageBuffer, wl_support: Optional[bool] = None) -> None:
+        """
+        :param image: the content of the image (bytes-like object or mmap)
+        :param wl_support: True if the image is wear levelled, False if it is plain, None to detect it
+        :raises FatalError: if the image is not a FAT volume (e.g. a SPIFFS partition)
+        """
+        if wl_support is None:
+            wl_support = not self.is_plain_image(image)
+        self.wl_support: bool = wl_support
+        try:
+            self._image: memoryview = memoryview(remove_wl(image) if wl_support else image)
+            boot_sector = BootSector()
+            boot_sector.parse_boot_sector(self._image[:BootSector.BOOT_HEADER_SIZE].tobytes())
+            self.boot_sector_state: BootSectorState = boot_sector.boot_sector_state
+            self.boot_sector_state.binary_image = self._image
+            self.table: FATTable = FATTable(self.boot_sector_state)
+        except Exception as e:  # construct errors or inconsistent boot sector values
+            layer: str = 'wear levelled ' if wl_support else ''
+            reason: str = (str(e).splitlines() or [''])[0]
+            raise FatalError(f'The image is not a {layer}FAT volume ({type(e).__name__}: {reason})') from e
+        # the end of chain marks are 0xFF8-0xFFF for FAT12 and 0xFFF8-0xFFFF for FAT16
+        self._end_of_chain: int = self.table.max_value & ~0x7
+        self._mmap: Optional[mmap.mmap] = None
+        self._file: Optional[BinaryIO] = None
+
+    @classmethod
+    def open(cls, image_path: str, wl_support: Optional[bool] = None) -> 'FATFSReader':
+        """
+        Maps the image file into memory and creates the reader. A plain image is read in place,
+        stripping the wear levelling layer creates one copy of the image.
+        """
+        image_file: BinaryIO = open(image_path, 'rb')
+        try:
+            image: mmap.mmap = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            image_file.close()
+            raise
+        try:
+            reader = cls(image, wl_support)
+        except Exception:
+            try:
+                image.close()
+            except BufferError:
+                # views of the map are still referenced by the traceback, the map is closed when they are collected
+                pass
+            image_file.close()
+            raise
+        reader._mmap, reader._file = image, image_file
+        return reader
+
+    def close(self) -> None:
+        self._image.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'FATFSReader':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @staticmethod
+    def is_plain_image(image: ImageBuffer) -> bool:
+        """
+        The plain image starts with the boot sector, the wear levelled one with the dummy or a moved sector.
+        """
+        try:
+            BootSector().parse_boot_sector(bytes(image[:BootSector.BOOT_HEADER_SIZE]))
+        except Exception:  # the header doesn't parse (construct errors) or is inconsistent
+            return False
+        return True
+
+    @property
+    def image(self) -> memoryview:
+        """
+        The plain FAT image (without the wear levelling layer)
+        """
+        return self._image
+
+    def cluster_chain(self, first_cluster: int) -> Iterator[int]:
+        """
+        Yields the ids of the clusters in the chain starting with `first_cluster`.
+
+        :raises FatalError: if the chain refers to a free or invalid cluster or contains a loop
+        """
+        cluster_id: int = first_cluster
+        for _ in range(len(self.table)):
+            if not RESERVED_CLUSTERS_COUNT <= cluster_id < len(self.table):
+                raise FatalError(f'Invalid cluster {cluster_id} in the chain of cluster {first_cluster}!')
+            yield cluster_id
+            cluster_id = self.table.get(cluster_id)
+            if cluster_id >= self._end_of_chain:
+                return
+        raise FatalError(f'The chain of cluster {first_cluster} contains a loop!')
+
+    def chain_runs(self, first_cluster: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (first cluster id, number of clusters) for every run of consecutive clusters in the chain.
+        """
+        run_start: Optional[int] = None
+        run_length: int = 0
+        for cluster_id in self.cluster_chain(first_cluster):
+            if run_start is not None and cluster_id == run_start + run_length:
+                run_length += 1
+                continue
+            if run_start is not None:
+                yield run_start, run_length
+            run_start, run_length = cluster_id, 1
+        if run_start is not None:
+            yield run_start, run_length
+
+    def _chain_views(self, first_cluster: int, size: Optional[int] = None) -> Iterator[memoryview]:
+        """
+        Yields the views of the data region holding the content of the chain, one view per run of consecutive
+        clusters. When `size` is given the content is cut to the size.
+
+        :raises FatalError: if the chain is shorter than the size
+        """
+        if size == 0:
+            return
+        sector_size: int = self.boot_sector_state.sector_size
+        remaining: Optional[int] = size
+        for run_start, run_length in self.chain_runs(first_cluster):
+            address: int = Cluster.compute_cluster_data_address(self.boot_sector_state, run_start)
+            run_size: int = run_length * sector_size
+            if remaining is not None:
+                run_size = min(run_size, remaining)
+                remaining -= run_size
+            yield self._image[address:address + run_size]
+            if remaining == 0:
+                return
+        if remaining:
+            raise FatalError(f'The chain of cluster {first_cluster} is shorter than the size {size}!')
+
+    def _directory_views(self, first_cluster: Optional[int]) -> Iterator[memoryview]:
+        if first_cluster is None:
+            root_start: int = self.boot_sector_state.root_directory_start
+            yield self._image[root_start:root_start + self.boot_sector_state.root_dir_sectors_cnt
+                              * self.boot_sector_state.sector_size]
+            return
+        yield from self._chain_views(first_cluster)
+
+    def _list_directory(self, first_cluster: Optional[int]) -> List[DirectoryEntry]:
+        """
+        Parses the entries of the directory (None for the root directory), the long names are joined
+        with their short entries when the checksum matches.
+        """
+        entries: List[DirectoryEntry] = []
+        lfn_parts: Dict[int, bytes] = {}
+        lfn_checksum_: Optional[int] = None
+        for view in self._directory_views(first_cluster):
+            for entry_address in range(0, len(view) - FATDefaults.ENTRY_SIZE + 1, FATDefaults.ENTRY_SIZE):
+                first_byte: int = view[entry_address]
+                if first_byte == END_OF_DIRECTORY_MARK:
+                    return entries
+                if first_byte == DELETED_ENTRY_MARK:
+                    lfn_parts, lfn_checksum_ = {}, None
+                    continue
+                attributes: int = view[entry_address + 11]
+                if attributes & Entry.ATTR_LONG_NAME == Entry.ATTR_LONG_NAME:
+                    order, name1, _, _, checksum, name2, _, name3 = Entry.LONG_ENTRY_STRUCT.unpack_from(view,
+                                                                                                    entry_address)
+                    if order & Entry.LAST_RECORD_LFN_ENTRY:
+                        lfn_parts, lfn_checksum_ = {}, checksum
+                    if checksum == lfn_checksum_:
+                        lfn_parts[order & ~Entry.LAST_RECORD_LFN_ENTRY] = name1 + name2 + name3
+                    continue
+
+                (name_, extension_, attributes, ntres, _, _, _, _, _, _, _, first_cluster_id,
+                 size) = Entry.SHORT_ENTRY_STRUCT.unpack_from(view, entry_address)
+                short_name: str = _short_name(name_, extension_, ntres)
+                long_name: Optional[str] = None
+                if lfn_parts and lfn_checksum_ == lfn_checksum((name_ + extension_).decode('latin-1')):
+                    encoded: bytes = b''.join(lfn_parts[order] for order in sorted(lfn_parts))
+                    long_name = encoded.decode('utf-16-le', errors='replace').split('\x00')[0].rstrip('\uffff')
+                lfn_parts, lfn_checksum_ = {}, None
+
+                if attributes & Entry.ATTR_VOLUME_ID or short_name in ('.', '..'):
+                    continue
+                entries.append(DirectoryEntry(name=long_name or short_name,
+                                              short_name=short_name,
+                                              attributes=attributes,
+                                              first_cluster=first_cluster_id,
+                                              size=size))
+        return entries
+
+    @staticmethod
+    def _split_path(path: str) -> List[str]:
+        return [part for part in path.replace('\\', '/').split('/') if part]
+
+    def _lookup(self, path: str) -> Optional[DirectoryEntry]:
+        """
+        Finds the entry of the path, the names are compared case-insensitively (as FatFs does).
+        None is returned for the root directory.
+
+        :raises FileNotFoundError: if the path does not exist
+        """
+        entry: Optional[DirectoryEntry] = None
+        for name in self._split_path(path):
+            if entry is not None and not entry.is_directory:
+                raise FileNotFoundError(f'`{path}`: `{entry.name}` is not a directory!')
+            directory_entries = self._list_directory(entry.first_cluster if entry else None)
+            entry = next((e for e in directory_entries
+                          if name.upper() in (e.name.upper(), e.short_name.upper())), None)
+            if entry is None:
+                raise FileNotFoundError(f'No such file or directory: `{path}`')
+        return entry
+
+    def listdir(self, path: str = '/') -> List[DirectoryEntry]:
+        """
+        :param path: path of the directory in the image, '/' is the root directory
+        :returns: the entries of the directory
+        """
+        entry: Optional[DirectoryEntry] = self._lookup(path)
+        if entry is not None and not entry.is_directory:
+            raise NotADirectoryError(f'`{path}` is not a directory!')
+        return self._list_directory(entry.first_cluster if entry else None)
+
+    def walk(self, path: str = '/') -> Iterator[Tuple[str, DirectoryEntry]]:
+        """
+        Recursively yields (path, entry) of all the files and directories under the path, sorted by name.
+        """
+        base: str = '/'.join(self._split_path(path))
+        for entry in sorted(self.listdir(path), key=lambda e: e.name):
+            entry_path: str = f'{base}/{entry.name}' if base else entry.name
+            yield entry_path, entry
+            if entry.is_directory:
+                yield from self.walk(entry_path)
+
+    def _file_entry(self, path: str) -> DirectoryEntry:
+        entry: Optional[DirectoryEntry] = self._lookup(path)
+        if entry is None or entry.is_directory:
+            raise IsADirectoryError(f'`{path}` is a directory!')
+        return entry
+
+    def iter_file(self, path: str) -> Iterator[memoryview]:
+        """
+        Yields the content of the file as views of the image, one view per run of consecutive clusters.
+        """
+        entry: DirectoryEntry = self._file_entry(path)
+        return self._chain_views(entry.first_cluster, entry.size)
+
+    def read_file(self, path: str) -> bytes:
+        return b''.join(self.iter_file(path))
+
+    def file_digest(self, path: str, algorithm: str = 'sha256') -> str:
+        """
+        Computes the hex digest of the file content directly from the image, without copying it.
+        """
+        digest = hashlib.new(algorithm)
+        for view in self.iter_file(path):
+            digest.update(view)
+        return digest.hexdigest()
+
+    def extract(self, output_dir: str, path: str = '/') -> List[str]:
+        """
+        Extracts the files and directories under the path into the output directory.
+
+        :returns: paths of the extracted files
+        """
+        extracted: List[str] = []
+        os.makedirs(output_dir, exist_ok=True)
+        for entry_path, entry in self.walk(path):
+            target: str = os.path.join(output_dir, *entry_path.split('/'))
+            if entry.is_directory:
+                os.makedirs(target, exist_ok=True)
+                continue
+            with open(target, 'wb') as output:
+                for view in self.iter_file(entry_path):
+                    output.write(view)
+            extracted.append(target)
+        return extracted
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='List, hash and extract the content of a (wear levelled) FAT image')
+    parser.add_argument('input_image',
+                        help='Path to the image (e.g. storage_dl.bin or a flash read-back)')
+    parser.add_argument('--wl-layer',
+                        choices=['detect', 'enabled', 'disabled'],
+                        default='detect',
+                        help='Whether the image contains the wear levelling layer')
+    parser.add_argument('--list',
+                        action='store_true',
+                        help='Print the files with their sizes and sha256 digests')
+    parser.add_argument('--extract',
+                        default=None,
+                        help='Directory to extract the content of the image into')
+    args = parser.parse_args()
+
+    wl_support: Optional[bool] = {'detect': None, 'enabled': True, 'disabled': False}[args.wl_layer]
+    with FATFSReader.open(args.input_image, wl_support) as reader:
+        if args.list or not args.extract:
+            for path, entry in reader.walk():
+                if entry.is_directory:
+                    print(f'{path}/')
+                else:
+                    print(f'{path}\t{entry.size}\t{reader.file_digest(path)}')
+        if args.extract:
+            for path in reader.extract(args.extract):
+                print(f'extracted: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # SPDX-FileCopyrightText: 2021-2024 Espressif Systems (Shanghai) CO LTD
 # SPDX-License-Identifier: Apache-2.0
+from typing import List
 from typing import Optional
+from typing import Tuple
 
 from construct import Const
 from construct import Int32ul
@@ -9,14 +11,16 @@ from construct import Struct
 from fatfs_utils.exceptions import WLNotInitialized
 from fatfs_utils.utils import crc32
 from fatfs_utils.utils import FATDefaults
+from fatfs_utils.utils import fill_buffer
 from fatfs_utils.utils import FULL_BYTE
 from fatfs_utils.utils import generate_4bytes_random
 from fatfs_utils.utils import get_args_for_partition_generator
+from fatfs_utils.utils import merge_extents
 from fatfs_utils.utils import UINT32_MAX
 from fatfsgen import FATFS
 
 
-def remove_wl(binary_image: bytes) -> bytes:
+def remove_wl(binary_image: bytes) -> bytearray:
     partition_size: int = len(binary_image)
     total_sectors: int = partition_size // FATDefaults.WL_SECTOR_SIZE
     wl_state_size: int = WLFATFS.WL_STATE_HEADER_SIZE + WLFATFS.WL_STATE_RECORD_SIZE * total_sectors
@@ -38,16 +42,29 @@ def remove_wl(binary_image: bytes) -> bytes:
             total_records += 1
         else:
             break
-    before_dummy = binary_image[:total_records * FATDefaults.WL_SECTOR_SIZE]
-    after_dummy = binary_image[total_records * FATDefaults.WL_SECTOR_SIZE + FATDefaults.WL_SECTOR_SIZE:]
-    new_image: bytes = before_dummy + after_dummy
+    # the plain image without the dummy sector and the WL sectors, the dummy sector splits it into two parts
+    plain_size: int = partition_size - FATDefaults.WL_SECTOR_SIZE - wl_sectors_size
+    dummy_start: int = min(total_records * FATDefaults.WL_SECTOR_SIZE, plain_size)
+    image_view = memoryview(binary_image)
+    plain_parts = ((0, image_view[:dummy_start]),
+                   (dummy_start, image_view[dummy_start + FATDefaults.WL_SECTOR_SIZE:
+                                            plain_size + FATDefaults.WL_SECTOR_SIZE]))
 
-    # remove wl sectors
-    new_image = new_image[:len(new_image) - (FATDefaults.WL_SECTOR_SIZE + 2 * wl_state_total_size)]
+    # reorder to preserve original order (the last move_count sectors go first)
+    shift: int = data_['move_count'] * FATDefaults.WL_SECTOR_SIZE
+    if not 0 < shift < plain_size:
+        shift = 0
 
-    # reorder to preserve original order
-    new_image = (new_image[-data_['move_count'] * FATDefaults.WL_SECTOR_SIZE:]
-                 + new_image[:-data_['move_count'] * FATDefaults.WL_SECTOR_SIZE])
+    # the parts are copied once into the new image
+    new_image: bytearray = bytearray(plain_size)
+    position: int = 0
+    for range_start, range_end in ((plain_size - shift, plain_size), (0, plain_size - shift)):
+        for part_start, part in plain_parts:
+            start: int = max(range_start, part_start)
+            end: int = min(range_end, part_start + len(part))
+            if start < end:
+                new_image[position:position + end - start] = part[start - part_start:end - part_start]
+                position += end - start
     return new_image
 
 
@@ -106,7 +123,18 @@ class WLFATFS:
                  device_id: int = None,
                  root_entry_count: int = FATDefaults.ROOT_ENTRIES_COUNT,
                  media_type: int = FATDefaults.MEDIA_TYPE,
-                 wl_mode: Optional[str] = None) -> None:
+                 wl_mode: Optional[str] = None,
+                 volume_id: Optional[int] = None,
+                 deterministic: bool = False) -> None:
+        """
+        :param device_id: device ID stored in the WL state, random if None
+        :param volume_id: volume serial number stored in the boot sector, random if None
+        :param deterministic: if True the same content always produces the same image: the entries get
+            the default timestamp, the device ID and the volume ID default to FATDefaults.DEVICE_ID
+            and FATDefaults.VOLUME_ID
+        """
+        if deterministic:
+            device_id = FATDefaults.DEVICE_ID if device_id is None else device_id
         self._initialized = False
         self._version = version
         self._temp_buff_size = temp_buff_size
@@ -128,6 +156,13 @@ class WLFATFS:
             wl_sectors += WLFATFS.WL_SAFE_MODE_DUMP_SECTORS
 
         self.plain_fat_sectors = self.total_sectors - wl_sectors
+        plain_fat_size: int = self.plain_fat_sectors * FATDefaults.WL_SECTOR_SIZE
+        self.wl_state_start: int = self.boot_sector_start + plain_fat_size
+        self.wl_config_start: int = (self.wl_state_start
+                                     + WLFATFS.WL_STATE_COPY_COUNT * self.wl_state_sectors * FATDefaults.WL_SECTOR_SIZE)
+        # the final image is allocated once (erased), the plain FAT image is generated directly at its offset
+        # and the WL sectors are written in place by init_wl
+        self._wl_image: bytearray = bytearray(FULL_BYTE) * (self.wl_config_start + FATDefaults.WL_SECTOR_SIZE)
         self.plain_fatfs = FATFS(
             explicit_fat_type=explicit_fat_type,
             size=self.plain_fat_sectors * FATDefaults.WL_SECTOR_SIZE,
@@ -144,21 +179,31 @@ class WLFATFS:
             sec_per_track=sec_per_track,
             volume_label=volume_label,
             file_sys_type=file_sys_type,
-            media_type=media_type
+            media_type=media_type,
+            volume_id=volume_id,
+            deterministic=deterministic,
+            binary_image_buffer=memoryview(self._wl_image)[self.boot_sector_start:self.wl_state_start]
         )
 
         self.fatfs_binary_image = self.plain_fatfs.state.binary_image
 
     def init_wl(self) -> None:
-        self.fatfs_binary_image = self.plain_fatfs.state.binary_image
+        self.plain_fatfs.flush_fat()
         self._add_dummy_sector()
-        # config must be added after state, do not change the order of these two calls!
         self._add_state_sectors()
         self._add_config_sector()
+        self.fatfs_binary_image = self._wl_image
         self._initialized = True
 
+    def _write_sector(self, address: int, content: bytes = b'') -> None:
+        """
+        Writes the content at the beginning of the WL sector at the address, the rest of the sector is erased (0xFF)
+        """
+        self._wl_image[address:address + len(content)] = content
+        fill_buffer(self._wl_image, address + len(content), address + FATDefaults.WL_SECTOR_SIZE, FULL_BYTE)
+
     def _add_dummy_sector(self) -> None:
-        self.fatfs_binary_image = FATDefaults.WL_SECTOR_SIZE * FULL_BYTE + self.fatfs_binary_image
+        self._write_sector(0)
 
     def _add_config_sector(self) -> None:
         wl_config_data = WLFATFS.WL_CONFIG_T_DATA.build(
@@ -180,8 +225,7 @@ class WLFATFS:
         # adding three 4 byte zeros to align the structure
         wl_config = wl_config_data + wl_config_crc + Int32ul.build(0) + Int32ul.build(0) + Int32ul.build(0)
 
-        self.fatfs_binary_image += (
-            wl_config + (FATDefaults.WL_SECTOR_SIZE - WLFATFS.WL_CONFIG_HEADER_SIZE) * FULL_BYTE)
+        self._write_sector(self.wl_config_start, wl_config)
 
     def _add_state_sectors(self) -> None:
         wl_state_data = WLFATFS.WL_STATE_T_DATA.build(
@@ -193,23 +237,43 @@ class WLFATFS:
                 max_count=FATDefaults.UPDATE_RATE,
                 block_size=FATDefaults.WL_SECTOR_SIZE,  # equal to page size, thus equal to wl sector size (4096)
                 version=self._version,
-                device_id=self._device_id or generate_4bytes_random(),
+                device_id=generate_4bytes_random() if self._device_id is None else self._device_id,
             )
         )
         crc = crc32(list(wl_state_data), UINT32_MAX)
         wl_state_crc = Int32ul.build(crc)
         wl_state = wl_state_data + wl_state_crc
-        wl_state_sector_padding: bytes = (FATDefaults.WL_SECTOR_SIZE - WLFATFS.WL_STATE_HEADER_SIZE) * FULL_BYTE
-        wl_state_sector: bytes = (
-            wl_state + wl_state_sector_padding + (self.wl_state_sectors - 1) * FATDefaults.WL_SECTOR_SIZE * FULL_BYTE
-        )
-        self.fatfs_binary_image += (WLFATFS.WL_STATE_COPY_COUNT * wl_state_sector)
+        wl_state_copy_size: int = self.wl_state_sectors * FATDefaults.WL_SECTOR_SIZE
+        for i in range(WLFATFS.WL_STATE_COPY_COUNT):
+            wl_state_copy_start: int = self.wl_state_start + i * wl_state_copy_size
+            self._write_sector(wl_state_copy_start, wl_state)
+            fill_buffer(self._wl_image,
+                        wl_state_copy_start + FATDefaults.WL_SECTOR_SIZE,
+                        wl_state_copy_start + wl_state_copy_size,
+                        FULL_BYTE)
+
+    def allocation_map(self) -> List[Tuple[int, int]]:
+        """
+        Returns sorted (address, size) extents of the WL image that carry content, aligned to WL sectors:
+        the extents of the plain FAT image shifted by the dummy sector, the first sector of each WL state copy
+        and the WL config sector. The rest of the image (dummy sector, free clusters, padding of the state copies)
+        is filled with 0xFF, the same way as erased flash.
+        """
+        if not self._initialized:
+            raise WLNotInitialized('FATFS is not initialized with WL. First call method WLFATFS.init_wl!')
+        extents: List[Tuple[int, int]] = [(self.boot_sector_start + address, size)
+                                          for address, size in self.plain_fatfs.allocation_map()]
+        wl_state_copy_size: int = self.wl_state_sectors * FATDefaults.WL_SECTOR_SIZE
+        for i in range(WLFATFS.WL_STATE_COPY_COUNT):
+            extents.append((self.wl_state_start + i * wl_state_copy_size, FATDefaults.WL_SECTOR_SIZE))
+        extents.append((self.wl_config_start, FATDefaults.WL_SECTOR_SIZE))
+        return merge_extents(extents, FATDefaults.WL_SECTOR_SIZE)
 
     def wl_write_filesystem(self, output_path: str) -> None:
         if not self._initialized:
             raise WLNotInitialized('FATFS is not initialized with WL. First call method WLFATFS.init_wl!')
         with open(output_path, 'wb') as output:
-            output.write(bytearray(self.fatfs_binary_image))
+            output.write(memoryview(self.fatfs_binary_image))
 
 
 if __name__ == '__main__':
@@ -223,7 +287,8 @@ if __name__ == '__main__':
                        long_names_enabled=args.long_name_support,
                        use_default_datetime=args.use_default_datetime,
                        root_entry_count=args.root_entry_count,
-                       wl_mode=args.wl_mode)
+                       wl_mode=args.wl_mode,
+                       deterministic=args.deterministic)
 
     wl_fatfs.plain_fatfs.generate(args.input_directory)
     wl_fatfs.init_wl()
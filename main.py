@@ -31,6 +31,10 @@ import os
 import as_factory_info
 import as_factory_firmware
 import as_factory_model
+import as_pipeline
+import as_journal
+from as_nvs_flash import read_flash_and_mac
+from as_dm_register.as_dm_ledger import normalize_mac
 
 # 导入配置模块
 import as_ms500_config
@@ -43,9 +47,30 @@ ENABLE_STEP1_REGISTER = True   # 步骤1: 参数注册（NVS 烧录）
 ENABLE_STEP2_FIRMWARE = True   # 步骤2: 固件烧录
 ENABLE_STEP3_MODEL = True      # 步骤3: 模型烧录
 
+# 流水线模式：按数据依赖并发执行（服务器注册、模型转换与固件烧录同时进行），见 as_pipeline.py
+# 为 False 时，设备有未完成的生产日志（上次流水线中途失败）仍使用流水线模式断点续做
+ENABLE_PIPELINE = False
+
 
 #------------------  主流程  ------------------
 
+def has_unfinished_journal(port, bin_type):
+    """
+    设备是否有未完成的生产日志（上次流水线中途失败）
+
+    只有日志目录中存在未完成的日志时才读取设备 MAC；读取失败时返回 False，由后续步骤报告连接错误
+    """
+    macs = as_journal.unfinished_macs()
+    if not macs:
+        return False
+    try:
+        mac = read_flash_and_mac(port, bin_type)
+    except Exception as e:
+        print(f"警告: 无法读取设备 MAC，不检查生产日志: {e}")
+        return False
+    return bool(mac) and normalize_mac(mac) in macs
+
+
 def main():
     """主函数 - 完整的工厂生产流程"""
 
@@ -70,13 +95,31 @@ def main():
             enabled_steps.append("模型烧录")
         print(" -> ".join(enabled_steps) if enabled_steps else "无")
 
+        use_pipeline = ENABLE_PIPELINE
+        if not use_pipeline and as_pipeline.JOURNAL_ENABLED and has_unfinished_journal(PORT, BIN_TYPE):
+            # 断点续做只在流水线模式中可用
+            print("\n发现该设备未完成的生产日志，使用流水线模式从未完成的步骤继续")
+            use_pipeline = True
+
+        if use_pipeline:
+            return as_pipeline.main(PORT, BIN_TYPE, MODEL_TYPE,
+                                    register=ENABLE_STEP1_REGISTER,
+                                    firmware=ENABLE_STEP2_FIRMWARE,
+                                    model=ENABLE_STEP3_MODEL)
+
         # 步骤1: 调用 as_factory_info.py 进行参数注册
         if ENABLE_STEP1_REGISTER:
             print("\n" + "=" * 80)
             print("【步骤 1/3】 参数注册（NVS 烧录）")
             print("=" * 80)
-            as_factory_info.main(port=PORT, bin_type=BIN_TYPE)
-            print("\n✓ 步骤 1 完成: 参数注册成功")
+            result = as_factory_info.main(port=PORT, bin_type=BIN_TYPE)
+            if not result["success"]:
+                print(f"\n✗ 步骤 1 失败: {result['error']}")
+                return 1
+            if result["status"] == "skipped":
+                print("\n⊘ 步骤 1 完成: 设备已有注册参数，按策略跳过注册")
+            else:
+                print("\n✓ 步骤 1 完成: 参数注册成功")
         else:
             print("\n⊘ 步骤 1 已跳过: 参数注册（ENABLE_STEP1_REGISTER = False）")
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+as_dm_api 熔断器测试
+
+使用方法:
+    python -m pytest -q tests
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from as_dm_register import as_dm_api
+from as_dm_register.as_dm_api import StreamingEndpoint, CircuitBreaker
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.reason = "OK"
+        self.text = json.dumps(data)
+
+
+class ScriptedSession:
+    """按顺序返回（或抛出）预设的结果"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def request(self, method, url, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "breaker.db")
+        # 熔断状态写入临时数据库，不影响工位机上的 as_dm_breaker.db
+        for patcher in (mock.patch.object(as_dm_api, "BREAKER_PATH", self.path),
+                        mock.patch.dict(as_dm_api._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_api(self, url, *outcomes):
+        api = StreamingEndpoint(url, "token")
+        api.session = ScriptedSession(*outcomes)
+        api.breaker = CircuitBreaker(url, failure_threshold=1, cooldown=0, path=self.path)
+        return api
+
+    def test_half_open_probe_with_unexpected_error_reopens(self):
+        api = self.make_api("http://breaker-half-open.test",
+                       requests.exceptions.ConnectionError("refused"),
+                       requests.exceptions.ChunkedEncodingError("connection broken"),
+                       FakeResponse(200, {"results": []}))
+
+        # 第一次失败即熔断
+        self.assertFalse(api.get_data_from_site({}, "/camera/c/")[0])
+        self.assertIsNotNone(api.breaker.opened_at)
+
+        # 冷却结束后的探测请求抛出非连接类异常：计为失败并重新熔断，而不是一直等待探测结果
+        success, message = api.get_data_from_site({}, "/camera/c/")
+        self.assertFalse(success)
+        self.assertIn("connection broken", message)
+        self.assertFalse(api.breaker.probing)
+
+        # 下一次探测成功后恢复
+        self.assertTrue(api.get_data_from_site({}, "/camera/c/")[0])
+        self.assertIsNone(api.breaker.opened_at)
+        self.assertEqual(api.breaker.failures, 0)
+
+    def test_unexpected_exception_is_recorded_and_raised(self):
+        api = self.make_api("http://breaker-raise.test", KeyboardInterrupt())
+        with self.assertRaises(KeyboardInterrupt):
+            api.get_data_from_site({}, "/camera/c/")
+        self.assertEqual(api.breaker.failures, 1)
+        self.assertFalse(api.breaker.probing)
+
+    def test_state_is_shared_between_processes(self):
+        # 两个实例使用同一个数据库，相当于两个进程中的熔断器
+        url = "http://breaker-shared.test"
+        first = CircuitBreaker(url, failure_threshold=2, cooldown=60, path=self.path)
+        second = CircuitBreaker(url, failure_threshold=2, cooldown=60, path=self.path)
+
+        first.record_failure()
+        second.record_failure()
+        self.assertFalse(first.allow())
+        self.assertFalse(second.allow())
+        self.assertTrue(CircuitBreaker("http://other.test", path=self.path).allow())
+
+        # 冷却结束后两个进程中只有一个可以发出探测请求
+        first.cooldown = second.cooldown = 0
+        self.assertEqual([first.allow(), second.allow()], [True, False])
+        first.record_success()
+        self.assertTrue(second.allow())
+        self.assertEqual(second.failures, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+as_dm_register 注册流程测试（服务器请求由 FakeSession 在内存中应答）
+
+使用方法:
+    python -m pytest -q tests
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from as_dm_register import as_dm_api
+from as_dm_register.as_dm_api import StreamingEndpoint, find_camera, API_CAMERA
+from as_dm_register.as_dm_ledger import RegistrationLedger
+from as_dm_register.as_dm_register import check_camera_registered
+from as_dm_register.as_dm_store import RegistrationStore, STATUS_REGISTERED, STATUS_USED
+
+SERVER_URL = "http://dm.test"
+MAC_A = "30:ed:a0:00:00:0a"
+MAC_B = "30:ed:a0:00:00:0b"
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.reason = "OK" if status_code < 400 else "Error"
+        self.text = json.dumps(data)
+
+
+class FakeSession:
+    """只应答摄像头查询，cameras 为服务器上的摄像头记录；status_code 非 200 时模拟查询失败"""
+
+    def __init__(self, cameras, status_code=200):
+        self.cameras = cameras
+        self.status_code = status_code
+
+    def request(self, method, url, params=None, **kwargs):
+        if self.status_code != 200:
+            return FakeResponse(self.status_code, {})
+        assert method == "GET" and url == SERVER_URL + API_CAMERA
+        # 模拟服务器的模糊匹配：返回所有包含 c_sn 的记录
+        return FakeResponse(200, {"results": [camera for camera in self.cameras if params["c_sn"] in camera["c_sn"]]})
+
+
+def make_api(cameras, status_code=200):
+    api = StreamingEndpoint(SERVER_URL, "token")
+    api.session = FakeSession(cameras, status_code)
+    return api
+
+
+class CheckCameraRegisteredTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ledger_path = os.path.join(self.tmpdir.name, "ledger.db")
+        # 熔断状态写入临时数据库，不影响工位机上的 as_dm_breaker.db
+        for patcher in (mock.patch.object(as_dm_api, "BREAKER_PATH", os.path.join(self.tmpdir.name, "breaker.db")),
+                        mock.patch.dict(as_dm_api._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with RegistrationLedger(self.ledger_path) as ledger:
+            ledger.record_attempt(SERVER_URL, "CA500-0001", MAC_A)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check(self, api, c_sn, g_camera_id=None, owner=None):
+        return check_camera_registered(api, c_sn, g_camera_id, owner, ledger_path=self.ledger_path)
+
+    def test_duplicate_sn_from_other_device_is_registered(self):
+        # 设备 A 注册中途失败，留下未写入 c_sensor 的摄像头；设备 B 使用相同 c_sn
+        api = make_api([{"id": 7, "c_sn": "CA500-0001", "c_sensor": ""}])
+        can_register, camera_id, message = self.check(api, "CA500-0001", "G-B", MAC_B)
+        self.assertFalse(can_register)
+        self.assertIn("already registered", message)
+
+        can_register, camera_id, _ = self.check(api, "CA500-0001", None, None)
+        self.assertFalse(can_register)
+
+    def test_same_device_resumes_unfinished_registration(self):
+        api = make_api([{"id": 7, "c_sn": "CA500-0001", "c_sensor": ""}])
+        self.assertEqual(self.check(api, "CA500-0001", "G-A", MAC_A.upper())[:2], (True, 7))
+
+    def test_matching_c_sensor_is_reused(self):
+        api = make_api([{"id": 7, "c_sn": "CA500-0001", "c_sensor": "G-A"}])
+        self.assertEqual(self.check(api, "CA500-0001", "G-A", MAC_B)[:2], (True, 7))
+        self.assertFalse(self.check(api, "CA500-0001", "G-B", MAC_A)[0])
+
+    def test_lookup_failure_aborts(self):
+        api = make_api([], status_code=500)
+        can_register, camera_id, _ = self.check(api, "CA500-0001", "G-A", MAC_A)
+        self.assertEqual((can_register, camera_id), (False, 0))
+
+    def test_only_exact_c_sn_matches(self):
+        api = make_api([{"id": 8, "c_sn": "CA500-00010", "c_sensor": "G-X"}])
+        success, camera_data, _ = find_camera(api, "CA500-0001")
+        self.assertTrue(success)
+        self.assertIsNone(camera_data)
+        self.assertEqual(self.check(api, "CA500-0001", "G-B", MAC_B)[:2], (True, 0))
+
+
+class RegistrationStoreClaimTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmpdir.name, "store.db")
+        with RegistrationStore(self.store_path) as store:
+            store.add({"c_sn": "CA500-0001", "u_sn": "U500-0001", "server_url": SERVER_URL,
+                       "u_camera_id": 1, "u_unit_id": 2, "u_account_id": 3,
+                       "password": "pw", "device_token": "token"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_one_station_claims_record(self):
+        with RegistrationStore(self.store_path) as a, RegistrationStore(self.store_path) as b:
+            self.assertTrue(a.mark_used("CA500-0001", "G-A"))
+            self.assertFalse(b.mark_used("CA500-0001", "G-B"))
+            record = b.get("CA500-0001")
+        self.assertEqual((record["status"], record["c_sensor"]), (STATUS_USED, "G-A"))
+
+    def test_unmark_used_restores_record(self):
+        with RegistrationStore(self.store_path) as store:
+            self.assertTrue(store.mark_used("CA500-0001", "G-A"))
+            store.unmark_used("CA500-0001", None)
+            record = store.get("CA500-0001")
+            self.assertEqual((record["status"], record["c_sensor"], record["used_at"]),
+                             (STATUS_REGISTERED, None, None))
+            self.assertTrue(store.mark_used("CA500-0001", "G-B"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+FAT 镜像生成工具测试
+
+    - 目录项和日期/时间的 struct 打包与 construct 参考实现逐字节一致（短文件名、长文件名、边界日期）
+    - FAT / 磨损均衡镜像与基准实现生成的镜像一致（GOLDEN_SHA256 为基准实现对同一目录树生成镜像的 sha256）
+    - 读取非 FAT 镜像（如 SPIFFS 分区）时报告 FatalError
+
+使用方法:
+    python -m pytest -q tests
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from esp_components.fatfs_tools import FATFS, FATFSReader, WLFATFS, build_fatfs_image, image_digest
+from fatfs_utils.entry import Entry
+from fatfs_utils.exceptions import FatalError
+from fatfs_utils.utils import DATE_ENTRY, TIME_ENTRY, build_date_entry, build_time_entry
+
+# 基准实现（固定卷 ID / 设备 ID 和默认时间戳）生成的镜像摘要: (类型, 扇区大小, 分区大小) -> sha256
+GOLDEN_SHA256 = {
+    ("fat", 4096, 0x100000): "61644735378f3ce887f94bc0cccfcf1f6941183a482252b6ec5ee9a30280c3c7",  # FAT12
+    ("fat", 512, 0x700000): "69e68c1359a50fe6da264599157ca5e4b1c7765ec8a1fcd12ba95916b173a110",  # FAT16
+    ("wl", 4096, 0x100000): "e59bd2dd5c1dc1e9686bdd349c145832d0ce3ff1b187ec8f45b9088c4aee0f11",
+    ("wl", 512, 0x100000): "9acf63c88b14474144759e730c1af96fd021a7782a923c6a34b2afd509f3733e",
+}
+
+
+def golden_tree():
+    """测试用目录树：短/长文件名、空文件、跨簇文件、子目录，以及占满多个簇的目录"""
+    tree = {
+        "HELLO.TXT": b"hello",
+        "EMPTY.BIN": b"",
+        "A_rather_long_file_name_for_lfn.dat": bytes((i * 7) % 256 for i in range(3 * 4096 + 17)),
+        "sub": {
+            "dir2": {"nested.txt": b"nested" * 100},
+            "Mixed.Case.Name.txt": bytes(range(256)) * 33,
+        },
+        "many": {f"file_number_{i:03d}.log": bytes([i]) * (i * 97) for i in range(60)},
+    }
+    return tree
+
+
+def write_tree(root, tree):
+    for name, value in tree.items():
+        path = os.path.join(root, name)
+        if isinstance(value, dict):
+            os.makedirs(path)
+            write_tree(path, value)
+        else:
+            with open(path, "wb") as file:
+                file.write(value)
+
+
+class EntryPackingTest(unittest.TestCase):
+
+    def short_entry(self, **overrides):
+        fields = dict(DIR_Name="HELLO   ", DIR_Name_ext="TXT", DIR_Attr=Entry.ATTR_ARCHIVE, DIR_NTRes=0x00,
+                      DIR_CrtTimeTenth=0, DIR_CrtTime=0, DIR_CrtDate=0x21, DIR_LstAccDate=0x21,
+                      DIR_FstClusHI=0, DIR_WrtTime=0, DIR_WrtDate=0x21, DIR_FstClusLO=2, DIR_FileSize=5)
+        fields.update(overrides)
+        return fields
+
+    def test_short_entry_matches_reference(self):
+        cases = [
+            self.short_entry(),
+            self.short_entry(DIR_Name="A       ", DIR_Name_ext="   ", DIR_Attr=Entry.ATTR_DIRECTORY, DIR_FileSize=0),
+            self.short_entry(DIR_Name="~1      ", DIR_NTRes=Entry.LDIR_DIR_NTRES, DIR_FstClusLO=0xFFFF,
+                             DIR_FileSize=0xFFFFFFFF),
+            self.short_entry(DIR_CrtTime=build_time_entry(23, 59, 58), DIR_CrtDate=build_date_entry(2106, 12, 31),
+                             DIR_WrtTime=build_time_entry(23, 59, 58), DIR_WrtDate=build_date_entry(2106, 12, 31),
+                             DIR_LstAccDate=build_date_entry(2106, 12, 31)),
+        ]
+        for fields in cases:
+            with self.subTest(fields=fields):
+                reference = {key: value for key, value in fields.items()
+                             if key not in ("DIR_CrtTimeTenth", "DIR_FstClusHI")}
+                self.assertEqual(Entry._build_entry(**fields), Entry._build_entry_reference(**reference))
+
+    def test_long_entry_matches_reference(self):
+        names = ["thisi".encode("utf-16-le"), "sveryl".encode("utf-16-le"), "on".encode("utf-16-le")]
+        tail = ["g.txt".encode("utf-16-le"), b"\x00\x00" + b"\xff" * 10, b"\xff" * 4]
+        for parts, checksum, order, is_last in ((names, 0x43, 1, False), (tail, 0x43, 2, True),
+                                                (names, 0x00, 20, True), (tail, 0xFF, 1, False)):
+            with self.subTest(order=order, is_last=is_last):
+                self.assertEqual(Entry._build_entry_long(parts, checksum, order, is_last),
+                                 Entry._build_entry_long_reference(parts, checksum, order, is_last))
+
+    def test_file_size_patch_matches_reference(self):
+        entry = bytearray(Entry._build_entry(**self.short_entry()))
+        Entry.FILE_SIZE_STRUCT.pack_into(entry, Entry.DIR_FILE_SIZE_IDX, 123456789)
+        self.assertEqual(bytes(entry), Entry._build_entry_reference(
+            **{key: value for key, value in self.short_entry(DIR_FileSize=123456789).items()
+               if key not in ("DIR_CrtTimeTenth", "DIR_FstClusHI")}))
+
+    def test_date_and_time_match_reference(self):
+        for year, month, day in ((1980, 1, 1), (2024, 2, 29), (2099, 12, 31), (2106, 12, 31), (2000, 10, 15)):
+            reference = int.from_bytes(DATE_ENTRY.build(dict(year=year - 1980, month=month, day=day)), "big")
+            self.assertEqual(build_date_entry(year, month, day), reference, (year, month, day))
+        for hour, minute, second in ((0, 0, 0), (23, 59, 59), (23, 59, 58), (12, 34, 57), (1, 0, 1)):
+            reference = int.from_bytes(TIME_ENTRY.build(dict(hour=hour, minute=minute, second=second // 2)), "big")
+            self.assertEqual(build_time_entry(hour, minute, second), reference, (hour, minute, second))
+
+
+class GoldenImageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.input_dir = os.path.join(cls.tmpdir.name, "input")
+        os.makedirs(cls.input_dir)
+        write_tree(cls.input_dir, golden_tree())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def file_digest(self, path):
+        with open(path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def test_fat_generator_matches_golden(self):
+        output = os.path.join(self.tmpdir.name, "fat.bin")
+        for sector_size, size in ((4096, 0x100000), (512, 0x700000)):
+            with self.subTest(sector_size=sector_size):
+                fatfs = FATFS(size=size, sector_size=sector_size, long_names_enabled=True, deterministic=True)
+                fatfs.generate(self.input_dir)
+                fatfs.write_filesystem(output)
+                self.assertEqual(self.file_digest(output), GOLDEN_SHA256[("fat", sector_size, size)])
+
+    def test_wl_generator_matches_golden(self):
+        output = os.path.join(self.tmpdir.name, "wl.bin")
+        for sector_size in (4096, 512):
+            with self.subTest(sector_size=sector_size):
+                wlfatfs = WLFATFS(size=0x100000, sector_size=sector_size, long_names_enabled=True, deterministic=True)
+                wlfatfs.plain_fatfs.generate(self.input_dir)
+                wlfatfs.init_wl()
+                wlfatfs.wl_write_filesystem(output)
+                self.assertEqual(self.file_digest(output), GOLDEN_SHA256[("wl", sector_size, 0x100000)])
+
+    def test_in_memory_builder_matches_golden(self):
+        image = build_fatfs_image(golden_tree(), size=0x100000, sector_size=4096, long_names_enabled=True,
+                                  deterministic=True)
+        self.assertEqual(image_digest(image), GOLDEN_SHA256[("wl", 4096, 0x100000)])
+
+
+class FATFSReaderTest(unittest.TestCase):
+
+    def test_non_fat_image_raises_fatal_error(self):
+        # 固件目录中的 storage.bin 是 SPIFFS 分区
+        spiffs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "as_flash_firmware", "bin_type", "ped_alarm", "storage.bin")
+        for wl_support in (None, True, False):
+            with self.subTest(wl_support=wl_support):
+                with self.assertRaisesRegex(FatalError, "not a .*FAT volume"):
+                    FATFSReader.open(spiffs_path, wl_support)
+        with self.assertRaises(FatalError):
+            FATFSReader(b"\xff" * 0x10000)
+
+
+if __name__ == "__main__":
+    unittest.main()
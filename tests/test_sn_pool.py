@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+序列号池测试：领取、持有、提交、释放，以及 NVS 烧录成功后才提交序列号
+
+使用方法:
+    python -m pytest -q tests
+"""
+
+import functools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import as_factory_info
+from as_dm_register import as_sn_pool
+from as_dm_register.as_sn_pool import SNPool, STATUS_CLAIMED, STATUS_FREE, STATUS_USED
+
+MAC_A = "30:ed:a0:00:00:0a"
+MAC_B = "30:ed:a0:00:00:0b"
+
+
+class SNPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "pool.db")
+        with SNPool(self.path) as pool:
+            pool.add_range("C-", "U-", 1, 2)
+
+    def status(self, c_sn):
+        with SNPool(self.path) as pool:
+            return pool.conn.execute("SELECT status FROM sn_pool WHERE c_sn = ?", (c_sn,)).fetchone()[0]
+
+
+class SNPoolHoldTest(SNPoolTestCase):
+
+    def test_hold_after_release_by_same_device(self):
+        with SNPool(self.path) as pool:
+            c_sn, _ = pool.claim("station-1", MAC_A)
+            self.assertTrue(pool.release(c_sn, "station-1"))
+            self.assertFalse(pool.hold(c_sn, "station-2", MAC_B))
+            self.assertTrue(pool.hold(c_sn, "station-2", MAC_A))
+            self.assertTrue(pool.commit(c_sn, "station-2"))
+            self.assertFalse(pool.hold(c_sn, "station-2", MAC_A))
+
+    def test_hold_fails_when_claimed_by_other_station(self):
+        with SNPool(self.path) as pool:
+            c_sn, _ = pool.claim("station-1", MAC_A)
+            self.assertFalse(pool.hold(c_sn, "station-2", MAC_B))
+            self.assertTrue(pool.hold(c_sn, "station-1", MAC_A))
+
+
+class FlashRegistrationTest(SNPoolTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.generate = mock.Mock()
+        self.flash = mock.Mock()
+        for patcher in (mock.patch.object(as_factory_info.as_ms500_config, "get_sn_pool_enabled", return_value=True),
+                        mock.patch.object(as_sn_pool, "SNPool", functools.partial(SNPool, self.path)),
+                        mock.patch.object(as_factory_info, "generate_nvs_data", self.generate),
+                        mock.patch.object(as_factory_info, "flash_nvs", self.flash)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        with SNPool(self.path) as pool:
+            self.c_sn, self.u_sn = pool.claim("station-1", MAC_A)
+        self.device_info = {"c_sn": self.c_sn, "u_sn": self.u_sn, "mac": MAC_A}
+
+    def test_commit_after_flash(self):
+        as_factory_info.flash_registration("COM1", "ms500_uvc", self.device_info, owner="station-1")
+        self.flash.assert_called_once_with("COM1", "ms500_uvc")
+        self.assertEqual(self.status(self.c_sn), STATUS_USED)
+
+    def test_flash_failure_releases_for_same_device(self):
+        self.flash.side_effect = RuntimeError("flash failed")
+        with self.assertRaises(RuntimeError):
+            as_factory_info.flash_registration("COM1", "ms500_uvc", self.device_info, owner="station-1")
+        self.assertEqual(self.status(self.c_sn), STATUS_FREE)
+
+        # 同一设备重试时领回同一对序列号
+        with SNPool(self.path) as pool:
+            self.assertEqual(pool.claim("station-1", MAC_A), (self.c_sn, self.u_sn))
+
+    def test_lost_lease_is_not_written_to_nvs(self):
+        with SNPool(self.path) as pool:
+            pool.conn.execute("UPDATE sn_pool SET owner = ?, mac = ? WHERE c_sn = ?", ("station-2", MAC_B, self.c_sn))
+        with self.assertRaises(RuntimeError):
+            as_factory_info.flash_registration("COM1", "ms500_uvc", self.device_info, owner="station-1")
+        self.generate.assert_not_called()
+        self.flash.assert_not_called()
+        self.assertEqual(self.status(self.c_sn), STATUS_CLAIMED)
+
+    def test_failed_commit_is_reported(self):
+        # 烧录过程中租期被其他工位收回
+        def reclaim(port, bin_type):
+            with SNPool(self.path) as pool:
+                pool.conn.execute("UPDATE sn_pool SET owner = ? WHERE c_sn = ?", ("station-2", self.c_sn))
+        self.flash.side_effect = reclaim
+        with self.assertRaisesRegex(RuntimeError, "提交失败"):
+            as_factory_info.flash_registration("COM1", "ms500_uvc", self.device_info, owner="station-1")
+
+
+if __name__ == "__main__":
+    unittest.main()